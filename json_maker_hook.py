@@ -8,19 +8,43 @@ This script calculates the hash of files, generates information about files
 in a directory, and creates a JSON representation of modpack data for
 a Minecraft repository.
 """
+import argparse
 import hashlib
 import json
 import os
 import sys
-from typing import Dict, Iterable, List, Optional
+import time
+from typing import Dict, Iterable, List, Optional, Set, Union
 from urllib.parse import urljoin
 from pathlib import Path
 
-import boto3
 import jsonschema
 import validators
 from loguru import logger as log
-from src.pydantic_models import FileInfo, MapJson, Modpack, ServerConfig
+from src.blob_table import NORMALIZED_MAP_JSON_PATH, write_normalized_map_json
+from src.bucket_audit import audit
+from src.bundles import attach_bundles
+from src.compression import (
+    COMPRESSION_CACHE_PATH,
+    attach_compressed_variants,
+    iter_all_file_infos,
+)
+from src.delta_patches import attach_patches
+from src.garbage_collector import DEFAULT_KEEP_GENERATIONS, collect_garbage
+from src.git_hash_provider import GitHashProvider, source_state
+from src.inotify_watcher import InotifyWatcher, QueueOverflow
+from src.manifest_store import ManifestStore
+from src.map_diff import diff_map_json
+from src.packing import attach_packs
+from src.publishing import load_targets, publish
+from src.pydantic_models import (
+    FileInfo,
+    MapJson,
+    Modpack,
+    PublishTarget,
+    ServerConfig,
+)
+from src.stat_cache import StatCache
 import pydantic
 
 log.add(
@@ -41,6 +65,17 @@ REPOSITORY_API_URL = (
     "https://raw.githubusercontent.com/izharus/hallowen_modpacks/main/"
 )
 PATH_TO_MODPACKS_DIR = "modpacks"
+# Both provide hashes of unchanged files through get(path).
+HashProvider = Union[GitHashProvider, ManifestStore]
+# Used if publish_targets.json does not exist.
+DEFAULT_PUBLISH_TARGET = PublishTarget(
+    name="yandex",
+    endpoint_url="https://storage.yandexcloud.net",
+    bucket_name=BUCKET_NAME,
+    access_key_id=ACCESS_KEY,
+    secret_key_env="YANDEX_OBJECT_STORAGE_EDITOR_KEY",
+    manifest_key=f"{PATH_TO_MODPACKS_DIR}/map.json",
+)
 
 # Ваш JSON Schema
 SCHEMA = {
@@ -99,16 +134,54 @@ def calculate_hash(file_name, hash_algorithm="sha256"):
         raise CalculateHashFailed() from error
 
 
+# Hashes computed during this run, keyed by file identity. Hardlinked
+# copies of a file share the inode, so their content is hashed once.
+_HASH_MEMO: Dict[tuple, str] = {}
+
+
+def hash_file(
+    file_path: str,
+    hash_provider: Optional[HashProvider] = None,
+) -> str:
+    """
+    Calculate the hash of a file, reusing a hash of the same inode.
+
+    Args:
+        file_path (str): The path to the file.
+        hash_provider (Optional[HashProvider]): Provides hashes of
+            files which did not change since the previous run.
+
+    Returns:
+        str: The sha256 hash of the file.
+    """
+    if hash_provider is not None:
+        file_hash = hash_provider.get(file_path)
+        if file_hash is not None:
+            return file_hash
+    try:
+        stat = os.stat(file_path)
+    except OSError as error:
+        raise CalculateHashFailed() from error
+    identity = (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+    file_hash = _HASH_MEMO.get(identity)
+    if file_hash is None:
+        file_hash = calculate_hash(file_path)
+        _HASH_MEMO[identity] = file_hash
+    return file_hash
+
+
 def parse_config_dict(
         config_path: str,
         modpack_dir: str,
         repository_api_url: str,
+        hash_provider: Optional[HashProvider] = None,
         ) -> ServerConfig:
     """
     Parse a configuration file located at the specified path.
 
     Args:
         config_path (str): The path to the configuration file.
+        hash_provider (Optional[HashProvider]): Passed to hash_file().
 
     Returns:
         ServerConfig: A ServerConfig instance containing the parsed
@@ -137,6 +210,7 @@ def parse_config_dict(
             "server_icon.jpg",
             )),
         repository_api_url,
+        hash_provider,
     )
     if not server_launcher_icon:
         raise ServerIconNotFound
@@ -178,6 +252,7 @@ def create_github_api_url(base_api_url: str, path_to_file_in_repo: str) -> str:
 def generate_single_file_info(
     file_path: str,
     base_api_url: str,
+    hash_provider: Optional[HashProvider] = None,
 ) -> Optional[FileInfo]:
     """
     Generate information for a specific file.
@@ -185,6 +260,7 @@ def generate_single_file_info(
     Args:
         file_path (str): The path to the specific file.
         base_api_url (str): The base URL for the API where the file can be downloaded.
+        hash_provider (Optional[HashProvider]): Passed to hash_file().
 
     Returns:
         Optional[FileInfo]: A FileInfo object containing information about the file,
@@ -201,13 +277,15 @@ def generate_single_file_info(
         file_name=file_name,
         api_url=download_api_url,
         yan_obj_storage=file_path.replace("\\", "/"),
-        hash=calculate_hash(file_path),
+        hash=hash_file(file_path, hash_provider),
         dist_file_path=dist_file_path,
+        size=os.path.getsize(file_path),
     )
 
 def generate_file_info(
     root_directory: str,
     base_api_url: str,
+    hash_provider: Optional[HashProvider] = None,
 ) -> List[FileInfo]:
     """
     Generate information about files in a directory.
@@ -217,6 +295,7 @@ def generate_file_info(
             for files. Path should be relative.
         base_api_url (str): The base URL for the API where the files
             can be downloaded.
+        hash_provider (Optional[HashProvider]): Passed to hash_file().
 
     Returns:
         List[dict]: A list of dictionaries containing information about the
@@ -230,38 +309,115 @@ def generate_file_info(
     - 'hash': The hash value of the file.
     - 'dist_file_path': The relative path of the file. Into this path
         file should be downloaded.
+    - 'size': The size of the file in bytes.
     """
     if os.path.isabs(root_directory):
         raise ValueError("Path should be relative")
     map_files = []
     for root, _directories, files in os.walk(root_directory):
         for file_name in files:
-            relative_file_path = os.path.join(root, file_name)
-            dist_file_path = os.path.relpath(
-                os.path.join(root, file_name),
-                root_directory,
-            )
-            download_api_url = create_github_api_url(
-                base_api_url,
-                relative_file_path,
-            )
             map_files.append(
-                FileInfo(
-                    **{
-                        "file_name": file_name,
-                        "api_url": download_api_url,
-                        "yan_obj_storage": relative_file_path.replace(
-                            "\\", "/"
-                        ),
-                        "hash": calculate_hash(relative_file_path),
-                        "dist_file_path": dist_file_path,
-                    }
+                create_file_info(
+                    os.path.join(root, file_name),
+                    root_directory,
+                    base_api_url,
+                    hash_provider,
                 )
             )
     return map_files
 
 
-def generate_json(relative_path: str, repository_api_url: str) -> MapJson:
+def create_file_info(
+    relative_file_path: str,
+    root_directory: str,
+    base_api_url: str,
+    hash_provider: Optional[HashProvider] = None,
+) -> FileInfo:
+    """
+    Create a FileInfo for a single file inside of root_directory.
+
+    Args:
+        relative_file_path (str): The path to the file, relative
+            to the repository root.
+        root_directory (str): The directory the dist_file_path
+            is relative to.
+        base_api_url (str): The base URL for the API where the files
+            can be downloaded.
+        hash_provider (Optional[HashProvider]): Passed to hash_file().
+
+    Returns:
+        FileInfo: The same FileInfo generate_file_info() creates for
+            this file.
+    """
+    download_api_url = create_github_api_url(
+        base_api_url,
+        relative_file_path,
+    )
+    return FileInfo(
+        file_name=os.path.basename(relative_file_path),
+        api_url=download_api_url,
+        yan_obj_storage=relative_file_path.replace("\\", "/"),
+        hash=hash_file(relative_file_path, hash_provider),
+        dist_file_path=os.path.relpath(
+            relative_file_path,
+            root_directory,
+        ),
+        size=os.path.getsize(relative_file_path),
+    )
+
+
+def generate_modpack(
+    modpack_dir: str,
+    repository_api_url: str,
+    hash_provider: Optional[HashProvider] = None,
+) -> Modpack:
+    """
+    Generate a Modpack object for a single modpack directory.
+
+    Args:
+        modpack_dir (str): The relative path to the modpack directory.
+        repository_api_url (str): The URL to the repository where modpack
+            data is hosted.
+        hash_provider (Optional[HashProvider]): Passed to hash_file().
+
+    Returns:
+        Modpack: A Modpack instance with config and all data groups.
+    """
+    server_config = parse_config_dict(
+        os.path.join(modpack_dir, "server_config.json"),
+        modpack_dir,
+        repository_api_url,
+        hash_provider,
+    )
+
+    main_data = generate_file_info(
+        os.path.join(modpack_dir, "main_data"),
+        repository_api_url,
+        hash_provider,
+    )
+
+    additional_data_path = os.path.join(modpack_dir, "client_additional_data")
+    client_additional_data = {}
+    os.makedirs(additional_data_path, exist_ok=True)
+    for dir_name in os.listdir(additional_data_path):
+        client_additional_data[dir_name] = generate_file_info(
+            os.path.join(additional_data_path, dir_name),
+            repository_api_url,
+            hash_provider,
+        )
+
+    return Modpack(
+        server_config=server_config,
+        main_data=main_data,
+        client_additional_data=client_additional_data,
+    )
+
+
+def generate_json(
+    relative_path: str,
+    repository_api_url: str,
+    hash_provider: Optional[HashProvider] = None,
+) -> MapJson:
     """
     Generate a MapJson object representation of modpack data.
 
@@ -270,181 +426,374 @@ def generate_json(relative_path: str, repository_api_url: str) -> MapJson:
             containing modpack data.
         repository_api_url (str): The URL to the repository where modpack
             data is hosted.
+        hash_provider (Optional[HashProvider]): Provides hashes of
+            files unchanged since the previous run. Every file is
+            hashed if it is None.
 
     Returns:
         MapJson: A MapJson instance containing information about modpacks.
     """
-    # pylint: disable = C0301
     map_json: Dict = {}
     for root, directories, _ in os.walk(relative_path):
         if root == relative_path:
             for modpack_name in directories:
-                map_json[modpack_name] = {}
-                config_path = os.path.join(
-                    root, modpack_name, "server_config.json"
-                )
-                server_config = parse_config_dict(
-                    config_path,
+                map_json[modpack_name] = generate_modpack(
                     os.path.join(root, modpack_name),
                     repository_api_url,
-                    )
-
-                main_data = generate_file_info(
-                    os.path.join(root, modpack_name, "main_data"),
-                    repository_api_url,
+                    hash_provider,
                 )
+    return MapJson(modpacks=map_json)
 
-                additional_data_path = os.path.join(
-                    root, modpack_name, "client_additional_data"
-                )
-                client_additional_data = {}
-                os.makedirs(additional_data_path, exist_ok=True)
-                for dir_name in os.listdir(additional_data_path):
-                    client_additional_data[dir_name] = generate_file_info(
-                        os.path.join(
-                            root,
-                            modpack_name,
-                            "client_additional_data",
-                            dir_name,
-                        ),
-                        repository_api_url,
-                    )
 
-                map_json[modpack_name] = Modpack(
-                    server_config=server_config,
-                    main_data=main_data,
-                    client_additional_data=client_additional_data,
+def _update_file_list(
+    file_infos: List[FileInfo],
+    changed_path: str,
+    root_directory: str,
+    base_api_url: str,
+) -> None:
+    """Replace entries of file_infos affected by a change of changed_path."""
+    obj_key = changed_path.replace("\\", "/")
+    index = next(
+        (
+            i
+            for i, file_info in enumerate(file_infos)
+            if file_info.yan_obj_storage == obj_key
+        ),
+        None,
+    )
+    file_infos[:] = [
+        file_info
+        for file_info in file_infos
+        if file_info.yan_obj_storage != obj_key
+        and not file_info.yan_obj_storage.startswith(obj_key + "/")
+    ]
+    if os.path.isfile(changed_path):
+        file_info = create_file_info(
+            changed_path, root_directory, base_api_url
+        )
+        if index is None:
+            file_infos.append(file_info)
+        else:
+            file_infos.insert(index, file_info)
+    elif os.path.isdir(changed_path):
+        for root, _directories, files in os.walk(changed_path):
+            for file_name in files:
+                file_infos.append(
+                    create_file_info(
+                        os.path.join(root, file_name),
+                        root_directory,
+                        base_api_url,
+                    )
                 )
-    return MapJson(modpacks=map_json)
 
 
-def get_all_obj_keys(map_json: MapJson) -> Dict:
+def update_map_json(
+    map_json: MapJson,
+    changed_paths: Iterable[str],
+    relative_path: str,
+    repository_api_url: str,
+) -> Set[str]:
     """
-    Get all object keys from the provided map_json.
+    Update only the entries of map_json affected by changed paths.
+
+    Entries are built with the same rules generate_json() uses, so the
+    result equals a full regeneration up to the order of files.
 
     Args:
-        map_json (Dict): A dictionary containing information about object keys.
+        map_json (MapJson): The map to update in place.
+        changed_paths (Iterable[str]): Created, modified, moved or deleted
+            paths inside of relative_path.
+        relative_path (str): The relative path to the directory
+            containing modpack data.
+        repository_api_url (str): The URL to the repository where modpack
+            data is hosted.
 
     Returns:
-        Dict: A dictionary containing all object keys.
-
-    Notes:
-        The function returns a dictionary where the keys are 'yan_obj_storage'
-        values and the values are 'hash' values.
+        Set[str]: Names of modpacks which were touched.
     """
-    res = {}
-    for _, modpack_data in map_json.modpacks.items():
-        res.update(
-            {
-                file_info.yan_obj_storage: file_info.hash
-                for file_info in modpack_data.main_data
-            }
-        )
-        for _, additional_data in modpack_data.client_additional_data.items():
-            res.update(
-                {
-                    file_info.yan_obj_storage: file_info.hash
-                    for file_info in additional_data
-                }
+    updated = set()
+    for changed_path in sorted(changed_paths):
+        parts = Path(os.path.relpath(changed_path, relative_path)).parts
+        if not parts or parts[0] in (os.curdir, os.pardir):
+            continue
+        changed_path = os.path.join(relative_path, *parts)
+        modpack_name = parts[0]
+        modpack_dir = os.path.join(relative_path, modpack_name)
+        modpack = map_json.modpacks.get(modpack_name)
+        updated.add(modpack_name)
+        if not os.path.isdir(modpack_dir):
+            map_json.modpacks.pop(modpack_name, None)
+        elif (
+            modpack is None
+            or len(parts) == 1
+            or parts[1:] == ("client_additional_data",)
+        ):
+            map_json.modpacks[modpack_name] = generate_modpack(
+                modpack_dir, repository_api_url
             )
-    return res
+        elif parts[1:] == ("server_config.json",):
+            modpack.server_config = parse_config_dict(
+                os.path.join(modpack_dir, "server_config.json"),
+                modpack_dir,
+                repository_api_url,
+            )
+        elif parts[1:] == ("main_data",):
+            modpack.main_data = generate_file_info(
+                changed_path, repository_api_url
+            )
+        elif parts[1] == "main_data":
+            _update_file_list(
+                modpack.main_data,
+                changed_path,
+                os.path.join(modpack_dir, "main_data"),
+                repository_api_url,
+            )
+        elif parts[1] == "client_additional_data":
+            if parts[2] == "launcher_data":
+                modpack.server_config = parse_config_dict(
+                    os.path.join(modpack_dir, "server_config.json"),
+                    modpack_dir,
+                    repository_api_url,
+                )
+            group_dir = os.path.join(
+                modpack_dir, "client_additional_data", parts[2]
+            )
+            if not os.path.isdir(group_dir):
+                modpack.client_additional_data.pop(parts[2], None)
+            elif (
+                len(parts) == 3
+                or parts[2] not in modpack.client_additional_data
+            ):
+                modpack.client_additional_data[parts[2]] = (
+                    generate_file_info(group_dir, repository_api_url)
+                )
+            else:
+                _update_file_list(
+                    modpack.client_additional_data[parts[2]],
+                    changed_path,
+                    group_dir,
+                    repository_api_url,
+                )
+    return updated
 
 
-def delete_files(
-    boto3_client: boto3.client,
-    bucket_name: str,
-    obj_keys: Iterable[str],
-) -> None:
+def load_map_json(map_json_path: str = "map.json") -> MapJson:
+    """Load a previous map.json, returning an empty map if it is unusable."""
+    try:
+        with open(map_json_path, encoding="utf-8") as fr:
+            return MapJson(**json.load(fr))
+    except (FileNotFoundError, json.JSONDecodeError, pydantic.ValidationError):
+        return MapJson(modpacks={})
+
+
+def write_map_json(map_json: MapJson, map_json_path: str = "map.json"):
+    """
+    Write map_json to disk, replacing the previous file atomically.
+    The normalized variant with a shared blob table is written as well.
     """
-    Delete multiple objects from an S3 bucket.
+    tmp_path = f"{map_json_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as fw:
+        json.dump(map_json.model_dump(mode="json"), fw)
+    os.replace(tmp_path, map_json_path)
+    write_normalized_map_json(
+        map_json,
+        os.path.join(
+            os.path.dirname(map_json_path), NORMALIZED_MAP_JSON_PATH
+        ),
+    )
+
+
+def attach_cached_compressed_variants(map_json: MapJson) -> None:
+    """Attach compressed variants using the on-disk compression cache."""
+    compression_cache = StatCache(COMPRESSION_CACHE_PATH).load()
+    attach_compressed_variants(map_json, compression_cache)
+    compression_cache.save()
+
+
+def attach_derived_data(map_json_old: MapJson, map_json: MapJson) -> None:
+    """
+    Attach everything derived from the files of a generated map.
+
+    The pre-commit run and watch mode both use it, so a map written by
+    either has the same source state, compressed variants, bundles,
+    packs and delta patches.
 
     Args:
-        boto3_client (boto3.client): Boto3 S3 client.
-        bucket_name (str): Name of the S3 bucket.
-        obj_keys (Iterable[str]): List of object keys (file paths) to delete.
+        map_json_old (MapJson): The previous map, patches are built
+            against its files.
+        map_json (MapJson): The generated map to update in place.
+    """
+    map_json.source_commit, map_json.source_changes = source_state(
+        PATH_TO_MODPACKS_DIR
+    )
+    attach_cached_compressed_variants(map_json)
+    attach_bundles(map_json, include_additional_data=True)
+    attach_packs(map_json)
+    attach_patches(map_json_old, map_json)
 
-    Raises:
-        botocore.exceptions.ClientError: If any error occurs
-            during object deletion.
+
+def publish_map_json(
+    targets: List[PublishTarget],
+    map_json: MapJson,
+) -> bool:
     """
-    for obj_key in obj_keys:
-        log.info(f"Deleting: {obj_key}")
-        boto3_client.delete_object(Bucket=bucket_name, Key=obj_key)
+    Publish the map to all targets.
 
+    Returns:
+        bool: True if every target is up to date.
+    """
+    reports = publish(targets, map_json)
+    return all(report.ok for report in reports)
 
-def upload_new_files(
-    boto3_client: boto3.client,
-    bucket_name: str,
-    old_object_keys: Dict[str, str],
-    new_object_keys: Dict[str, str],
-):
+
+def watch(sync: bool = False) -> None:
     """
-    Upload new or modified files to an S3 bucket.
+    Keep map.json up to date while files in the modpacks dir change.
 
-    Args:
-        boto3_client (boto3.client): Boto3 S3 client.
-        bucket_name (str): Name of the S3 bucket.
-        old_object_keys (Dict[str, str]): Dictionary containing old
-            object keys and hashes.
-        new_object_keys (Dict[str, str]): Dictionary containing new
-            object keys and hashes.
+    The map is generated once, then only entries affected by inotify
+    events are regenerated. A burst of events is handled as one update.
 
-    Raises:
-        IOError: If an I/O error occurs during file operation.
-        botocore.exceptions.ClientError: If an error occurs during file upload.
-            This includes errors such as FileNotFoundError
-            (if the file specified by the object key does not exist),
-            AccessDenied (if access is denied), etc.
+    Args:
+        sync (bool): Publish changed files and map.json to all targets
+            after every update.
     """
-    for object_key, new_file_hash in new_object_keys.items():
-        old_file_hash = old_object_keys.get(object_key, "None")
-        if old_file_hash != new_file_hash:
+    map_json = generate_json(PATH_TO_MODPACKS_DIR, REPOSITORY_API_URL)
+    attach_derived_data(load_map_json(), map_json)
+    write_map_json(map_json)
+    targets = load_targets(default=DEFAULT_PUBLISH_TARGET) if sync else []
+    if targets:
+        publish_map_json(targets, map_json)
+    published = map_json.model_copy(deep=True)
+    with InotifyWatcher(PATH_TO_MODPACKS_DIR) as watcher:
+        log.info(f"Watching {PATH_TO_MODPACKS_DIR} for changes...")
+        while True:
+            try:
+                changed_paths = watcher.wait_for_changes()
+            except QueueOverflow:
+                log.warning("Events were lost, regenerating map.json")
+                map_json = generate_json(
+                    PATH_TO_MODPACKS_DIR, REPOSITORY_API_URL
+                )
+                changed_paths = set()
+            started = time.monotonic()
+            try:
+                updated = update_map_json(
+                    map_json,
+                    changed_paths,
+                    PATH_TO_MODPACKS_DIR,
+                    REPOSITORY_API_URL,
+                )
+                attach_derived_data(published, map_json)
+            except (RuntimeError, OSError) as error:
+                log.error(f"Unable to update map.json: {error}")
+                continue
+            changes = diff_map_json(published, map_json)
+            if changes.empty:
+                continue
+            log.info(f"map.json changes:\n{changes.changelog()}")
+            write_map_json(map_json)
+            if targets:
+                publish_map_json(targets, map_json)
+            published = map_json.model_copy(deep=True)
             log.info(
-                f"Uploading: {object_key}, old/new hash: "
-                f"{old_file_hash}/{new_file_hash}"
+                f"map.json updated ({', '.join(sorted(updated))}) in "
+                f"{time.monotonic() - started:.3f}s"
             )
-            boto3_client.upload_file(object_key, bucket_name, object_key)
 
 
-def main():
+def main(argv: Optional[List[str]] = None):
     """Main work."""
-    try:
-        with open("map.json", encoding="utf-8") as fr:
-            map_json_old = json.load(fr)
-    except FileNotFoundError:
-        map_json_old = {"modpacks": {}}
-    try:
-        map_json_old = MapJson(**map_json_old)
-    except pydantic.ValidationError:
-        map_json_old = {"modpacks": {}}
-
-    new_map_json = generate_json(PATH_TO_MODPACKS_DIR, REPOSITORY_API_URL)
-    # validate map
-    # MapJson(modpacks=new_map_json)
-    s3 = boto3.client(
-        "s3",
-        endpoint_url="https://storage.yandexcloud.net",
-        aws_access_key_id=ACCESS_KEY,
-        aws_secret_access_key=SECRET_KEY,
+    parser = argparse.ArgumentParser(description=__doc__)
+    # pre-commit passes names of changed files, they are not used.
+    parser.add_argument("filenames", nargs="*")
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="keep map.json up to date while modpack files change",
     )
-    new_object_keys = get_all_obj_keys(new_map_json)
-    old_object_keys = {}#get_all_obj_keys(map_json_old)
-
-    set_old_hashes = set(old_object_keys.keys())
-    set_new_hashes = set(new_object_keys.keys())
-
-    # delete all old files
-    delete_files(s3, BUCKET_NAME, set_old_hashes - set_new_hashes)
-
-    # upload all new files
-    upload_new_files(s3, BUCKET_NAME, old_object_keys, new_object_keys)
-
-    if new_map_json != map_json_old:
-        with open("map.json", "w", encoding="utf-8") as fw:
-            json.dump(new_map_json.model_dump(mode="json"), fw)
-        s3.upload_file(
-            "map.json", BUCKET_NAME, f"{PATH_TO_MODPACKS_DIR}/map.json"
+    parser.add_argument(
+        "--sync",
+        action="store_true",
+        help="in watch mode, publish changes to all targets as well",
+    )
+    parser.add_argument(
+        "--audit",
+        action="store_true",
+        help="compare every target bucket with map.json and exit",
+    )
+    parser.add_argument(
+        "--repair",
+        action="store_true",
+        help="with --audit, upload missing and mismatched objects",
+    )
+    parser.add_argument(
+        "--gc",
+        action="store_true",
+        help="delete objects the latest generations do not use and exit",
+    )
+    parser.add_argument(
+        "--keep-generations",
+        type=int,
+        default=DEFAULT_KEEP_GENERATIONS,
+        help="with --gc, the number of latest generations to keep",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="with --gc, only list objects which would be deleted",
+    )
+    args = parser.parse_args(argv)
+    if args.gc:
+        gc_reports = collect_garbage(
+            load_targets(default=DEFAULT_PUBLISH_TARGET),
+            load_map_json(),
+            keep=args.keep_generations,
+            dry_run=args.dry_run,
+        )
+        sys.exit(0 if all(report.ok for report in gc_reports) else 1)
+    if args.audit:
+        audit_reports = audit(
+            load_targets(default=DEFAULT_PUBLISH_TARGET),
+            load_map_json(),
+            repair=args.repair,
         )
+        sys.exit(0 if all(report.ok for report in audit_reports) else 1)
+    if args.watch:
+        try:
+            watch(sync=args.sync)
+        except KeyboardInterrupt:
+            log.info("Watch mode stopped...")
+        sys.exit(0)
+
+    map_json_old = load_map_json()
+
+    with ManifestStore() as store:
+        hash_provider: Optional[HashProvider] = GitHashProvider.from_map_json(
+            map_json_old, PATH_TO_MODPACKS_DIR
+        )
+        if hash_provider is None:
+            hash_provider = store
+        new_map_json = generate_json(
+            PATH_TO_MODPACKS_DIR, REPOSITORY_API_URL, hash_provider
+        )
+        log.info(f"Hashes reused: {hash_provider.reused}")
+        attach_derived_data(map_json_old, new_map_json)
+        changes = diff_map_json(map_json_old, new_map_json)
+        changed = not changes.empty
+        store.update_stats(iter_all_file_infos(new_map_json))
+        if changed:
+            log.info(f"map.json changes:\n{changes.changelog()}")
+            write_map_json(new_map_json)
+        elif not os.path.isfile(NORMALIZED_MAP_JSON_PATH):
+            # map_blobs.json is not committed, fresh clones have to build it.
+            write_normalized_map_json(map_json_old, NORMALIZED_MAP_JSON_PATH)
+        if changed or store.latest_generation() is None:
+            store.record_generation(new_map_json, changes)
+    targets = load_targets(default=DEFAULT_PUBLISH_TARGET)
+    if not publish_map_json(targets, new_map_json):
+        log.error("Publishing failed for some targets...")
+        sys.exit(1)
+    if changed:
         log.info("Operation success...")
         sys.exit(1)
     log.info("No any changes...")
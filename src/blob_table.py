@@ -0,0 +1,166 @@
+"""
+A normalized variant of map.json with a shared blob table.
+
+Identical files (libraries, shared mods, resourcepacks) appear once in
+the blob table keyed by hash. Modpack entries only reference a hash and
+a dist path, so the manifest is smaller and launchers installing several
+packs download every blob once.
+"""
+import json
+import os
+from typing import Dict, List
+
+from src.compression import iter_all_file_infos
+from src.pydantic_models import (
+    BlobInfo,
+    BlobRef,
+    FileInfo,
+    MapJson,
+    Modpack,
+    NormalizedMapJson,
+    NormalizedModpack,
+)
+
+NORMALIZED_MAP_JSON_PATH = "map_blobs.json"
+
+
+class BlobNotFound(KeyError):
+    """Raises if a normalized map references a missing blob."""
+
+    def __init__(self, message="Blob is not in the blob table.") -> None:
+        super().__init__(message)
+
+
+def build_blob_table(map_json: MapJson) -> Dict[str, BlobInfo]:
+    """
+    Build the blob table for all files of the map.
+
+    The smallest object key among identical files is used as the blob's
+    storage key, so the table does not depend on modpack order.
+
+    Args:
+        map_json (MapJson): The full map.
+
+    Returns:
+        Dict[str, BlobInfo]: Blobs keyed by hash, sorted by hash.
+    """
+    owners: Dict[str, FileInfo] = {}
+    for file_info in iter_all_file_infos(map_json):
+        owner = owners.get(file_info.hash)
+        if owner is None or file_info.yan_obj_storage < owner.yan_obj_storage:
+            owners[file_info.hash] = file_info
+    return {
+        file_hash: BlobInfo(
+            size=owner.size,
+            yan_obj_storage=owner.yan_obj_storage,
+            api_url=owner.api_url,
+            compressed=owner.compressed,
+            pack=owner.pack,
+            patches=owner.patches,
+        )
+        for file_hash, owner in sorted(owners.items())
+    }
+
+
+def _refs(file_infos: List[FileInfo]) -> List[BlobRef]:
+    return [
+        BlobRef(
+            hash=file_info.hash,
+            file_name=file_info.file_name,
+            dist_file_path=file_info.dist_file_path,
+        )
+        for file_info in file_infos
+    ]
+
+
+def normalize_map_json(map_json: MapJson) -> NormalizedMapJson:
+    """
+    Convert a map into its normalized variant.
+
+    Args:
+        map_json (MapJson): The full map.
+
+    Returns:
+        NormalizedMapJson: The map with a shared blob table.
+    """
+    return NormalizedMapJson(
+        blobs=build_blob_table(map_json),
+        modpacks={
+            name: NormalizedModpack(
+                server_config=modpack.server_config,
+                main_data=_refs(modpack.main_data),
+                client_additional_data={
+                    group: _refs(file_infos)
+                    for group, file_infos in (
+                        modpack.client_additional_data.items()
+                    )
+                },
+                bundles=modpack.bundles,
+                packs=modpack.packs,
+            )
+            for name, modpack in map_json.modpacks.items()
+        },
+    )
+
+
+def resolve_ref(normalized: NormalizedMapJson, ref: BlobRef) -> FileInfo:
+    """
+    Build a FileInfo for a reference, pointing to the blob's object.
+
+    Raises:
+        BlobNotFound: If the blob table does not contain the hash.
+    """
+    try:
+        blob = normalized.blobs[ref.hash]
+    except KeyError as error:
+        raise BlobNotFound(f"Blob {ref.hash} is not found") from error
+    return FileInfo(
+        file_name=ref.file_name,
+        api_url=blob.api_url,
+        yan_obj_storage=blob.yan_obj_storage,
+        hash=ref.hash,
+        dist_file_path=ref.dist_file_path,
+        size=blob.size,
+        compressed=blob.compressed,
+        pack=blob.pack,
+        patches=blob.patches,
+    )
+
+
+def denormalize_map_json(normalized: NormalizedMapJson) -> MapJson:
+    """
+    Convert a normalized map back into the map.json layout.
+
+    Files of every modpack point to the blob's object, so the result
+    downloads every blob from a single location.
+    """
+    return MapJson(
+        modpacks={
+            name: Modpack(
+                server_config=modpack.server_config,
+                main_data=[
+                    resolve_ref(normalized, ref) for ref in modpack.main_data
+                ],
+                client_additional_data={
+                    group: [resolve_ref(normalized, ref) for ref in refs]
+                    for group, refs in modpack.client_additional_data.items()
+                },
+                bundles=modpack.bundles,
+                packs=modpack.packs,
+            )
+            for name, modpack in normalized.modpacks.items()
+        }
+    )
+
+
+def write_normalized_map_json(
+    map_json: MapJson,
+    map_json_path: str = NORMALIZED_MAP_JSON_PATH,
+) -> NormalizedMapJson:
+    """Write the normalized variant of the map next to map.json."""
+    normalized = normalize_map_json(map_json)
+    tmp_path = f"{map_json_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as fw:
+        json.dump(normalized.model_dump(mode="json"), fw)
+    os.replace(tmp_path, map_json_path)
+    return normalized
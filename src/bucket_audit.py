@@ -0,0 +1,256 @@
+"""
+Integrity audit of a publish target without downloading objects.
+
+Every object referenced by the map is compared to the bucket listing
+(paged ListObjectsV2 gives size and ETag). Content is confirmed by the
+sha256 stored in object metadata, read with parallel HEAD requests only
+for objects whose ETag was not verified before. Objects uploaded without
+metadata are checked by comparing their ETag with the local md5.
+
+Orphaned objects are only reported. They may belong to a retained
+generation or be in use by another clone, so deleting them is left to
+the garbage collector.
+"""
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional
+
+from loguru import logger as log
+from pydantic import BaseModel
+
+from src.publishing import (
+    PUBLISH_STATE_DIR,
+    SHA256_METADATA_KEY,
+    PublishObject,
+    RemoteObject,
+    TargetState,
+    collect_objects,
+    create_client,
+    list_bucket,
+    upload_object,
+)
+from src.pydantic_models import MapJson, PublishTarget
+
+AUDIT_CACHE_DIR = os.path.join("data", "audit_cache")
+HEAD_WORKERS = 16
+
+
+# pylint: disable=R0903
+class AuditReport(BaseModel):
+    """
+    The result of an audit of a single target.
+
+    Attributes:
+        name (str): The name of the target.
+        checked (int): The number of objects referenced by the map.
+        missing (List[str]): Referenced keys absent from the bucket.
+        mismatched (List[str]): Keys whose size or hash differs.
+        unverified (List[str]): Keys whose content could not be checked
+            (multipart uploads without sha256 metadata).
+        orphaned (List[str]): Keys in the bucket not referenced by
+            the map. They are reported only, as retained generations
+            may still use them.
+        repaired (List[str]): Keys uploaded again during repair.
+    """
+
+    name: str
+    checked: int = 0
+    missing: List[str] = []
+    mismatched: List[str] = []
+    unverified: List[str] = []
+    orphaned: List[str] = []
+    repaired: List[str] = []
+
+    @property
+    def ok(self) -> bool:
+        """True if every object of the map is in the bucket."""
+        return not (self.missing or self.mismatched)
+
+
+def local_md5(file_path: str) -> Optional[str]:
+    """Calculate the md5 of a local file, None if it does not exist."""
+    try:
+        with open(file_path, "rb") as fr:
+            return hashlib.file_digest(fr, "md5").hexdigest()
+    except OSError:
+        return None
+
+
+class AuditCache:
+    """
+    Remembers sha256 hashes confirmed for object ETags of a target.
+
+    Attributes:
+        cache_path (str): The path to the JSON cache file.
+        etags (Dict[str, Dict[str, str]]): Object keys mapped to
+            {"etag": ..., "sha256": ...}.
+    """
+
+    def __init__(self, cache_path: str) -> None:
+        self.cache_path = cache_path
+        try:
+            with open(cache_path, encoding="utf-8") as fr:
+                self.etags: Dict[str, Dict[str, str]] = json.load(fr)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.etags = {}
+
+    def get(self, key: str, etag: str) -> Optional[str]:
+        """Return the confirmed sha256 for the key if the ETag matches."""
+        entry = self.etags.get(key)
+        if entry is not None and entry.get("etag") == etag:
+            return entry.get("sha256")
+        return None
+
+    def set(self, key: str, etag: str, sha256: str) -> None:
+        """Remember the sha256 of an object version."""
+        self.etags[key] = {"etag": etag, "sha256": sha256}
+
+    def save(self) -> None:
+        """Write the cache to disk."""
+        os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+        tmp_path = f"{self.cache_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as fw:
+            json.dump(self.etags, fw)
+        os.replace(tmp_path, self.cache_path)
+
+
+def remote_sha256(
+    client,
+    bucket_name: str,
+    obj: PublishObject,
+    remote: RemoteObject,
+) -> Optional[str]:
+    """
+    Find out the sha256 of a remote object with a single HEAD request.
+
+    Returns:
+        Optional[str]: The sha256 from metadata. If there is no metadata
+            and the ETag equals the local md5, the local hash is returned.
+            None if the content can not be confirmed.
+    """
+    response = client.head_object(Bucket=bucket_name, Key=obj.key)
+    sha256 = response.get("Metadata", {}).get(SHA256_METADATA_KEY)
+    if sha256:
+        return sha256
+    if "-" not in remote.etag and local_md5(obj.local_path) == remote.etag:
+        return obj.hash
+    return None
+
+
+def audit_target(
+    target: PublishTarget,
+    map_json: MapJson,
+    repair: bool = False,
+    prefix: Optional[str] = None,
+    cache_dir: str = AUDIT_CACHE_DIR,
+    state_dir: str = PUBLISH_STATE_DIR,
+) -> AuditReport:
+    """
+    Compare a target bucket with the objects referenced by the map.
+
+    Args:
+        target (PublishTarget): The target to audit.
+        map_json (MapJson): The map the bucket should match.
+        repair (bool): Upload missing and mismatched objects again.
+        prefix (Optional[str]): Only keys under this prefix are listed
+            and can be orphaned. The manifest directory by default.
+        cache_dir (str): The directory with per-target audit caches.
+        state_dir (str): The directory with per-target publish states.
+            Missing and mismatched objects are dropped from the state,
+            so the next publishing uploads them again.
+
+    Returns:
+        AuditReport: Missing, mismatched and orphaned objects.
+    """
+    if prefix is None:
+        prefix = target.manifest_key.rpartition("/")[0]
+        prefix = f"{prefix}/" if prefix else ""
+    client = create_client(target)
+    expected = collect_objects(map_json)
+    remote_objects = list_bucket(client, target.bucket_name, prefix)
+    cache = AuditCache(os.path.join(cache_dir, f"{target.name}.json"))
+    report = AuditReport(name=target.name, checked=len(expected))
+
+    to_head = []
+    for key, obj in sorted(expected.items()):
+        remote = remote_objects.get(key)
+        if remote is None:
+            report.missing.append(key)
+        elif obj.size is not None and remote.size != obj.size:
+            report.mismatched.append(key)
+        else:
+            cached_sha256 = cache.get(key, remote.etag)
+            if cached_sha256 is None:
+                to_head.append((obj, remote))
+            elif cached_sha256 != obj.hash:
+                report.mismatched.append(key)
+
+    with ThreadPoolExecutor(max_workers=HEAD_WORKERS) as executor:
+        hashes = executor.map(
+            lambda item: remote_sha256(
+                client, target.bucket_name, item[0], item[1]
+            ),
+            to_head,
+        )
+        for (obj, remote), sha256 in zip(to_head, hashes):
+            if sha256 is None:
+                report.unverified.append(obj.key)
+                continue
+            cache.set(obj.key, remote.etag, sha256)
+            if sha256 != obj.hash:
+                report.mismatched.append(obj.key)
+
+    manifest_keys = {
+        target.manifest_key,
+        target.normalized_manifest_key,
+        target.pointer_key,
+    }
+    report.orphaned = sorted(
+        key
+        for key in remote_objects
+        if key not in expected
+        and key not in manifest_keys
+        and not key.startswith(target.generations_prefix)
+    )
+
+    state = TargetState.for_target(target, state_dir)
+    for key in report.missing + report.mismatched:
+        state.objects.pop(key, None)
+    if repair:
+        for key in report.missing + report.mismatched:
+            try:
+                upload_object(client, target, expected[key])
+            except Exception as error:
+                log.error(f"[{target.name}] Repair failed: {key}: {error}")
+                continue
+            state.objects[key] = expected[key].hash
+            report.repaired.append(key)
+    state.save()
+    cache.save()
+    log.info(
+        f"[{target.name}] checked: {report.checked}, "
+        f"missing: {len(report.missing)}, "
+        f"mismatched: {len(report.mismatched)}, "
+        f"unverified: {len(report.unverified)}, "
+        f"orphaned: {len(report.orphaned)}, "
+        f"repaired: {len(report.repaired)}"
+    )
+    return report
+
+
+def audit(
+    targets: Iterable[PublishTarget],
+    map_json: MapJson,
+    repair: bool = False,
+) -> List[AuditReport]:
+    """Audit every target concurrently."""
+    targets = list(targets)
+    with ThreadPoolExecutor(max_workers=max(len(targets), 1)) as executor:
+        return list(
+            executor.map(
+                lambda target: audit_target(target, map_json, repair),
+                targets,
+            )
+        )
@@ -0,0 +1,244 @@
+"""
+Whole-group bundle artifacts for first-time installs.
+
+All files of main_data (and optionally of every client_additional_data
+group) are packed into a deterministic tar archive compressed with gzip
+(zstd on request). A cold install downloads one archive instead of hundreds of
+files. Bundles are named after a digest of their contents and are only
+rebuilt when the files of the group change. Clients extract them with
+src.client_sync.install_bundle.
+"""
+import gzip
+import hashlib
+import json
+import os
+import tarfile
+from typing import Dict, List, Optional
+
+from loguru import logger as log
+
+from src.compression import zstandard
+from src.pydantic_models import BundleInfo, FileInfo, MapJson
+
+BUNDLES_DIR = os.path.join("data", "bundles")
+MAIN_DATA_BUNDLE = "main_data"
+BUNDLE_SUFFIXES = {None: ".tar", "gzip": ".tar.gz", "zstd": ".tar.zst"}
+# Not zstd by default: zstandard is optional and bundle names must not
+# depend on the packages installed on the machine.
+DEFAULT_BUNDLE_ENCODING = "gzip"
+
+
+class BundleFailed(RuntimeError):
+    """Raises if a bundle could not be built or extracted."""
+
+    def __init__(self, message="Bundle failed.") -> None:
+        super().__init__(message)
+
+
+def bundle_member_name(dist_file_path: str) -> str:
+    """Return the archive member name for a dist_file_path."""
+    return dist_file_path.replace("\\", "/")
+
+
+def content_digest(file_infos: List[FileInfo]) -> str:
+    """
+    Calculate a digest of dist paths and hashes of the files.
+
+    The digest does not depend on the order of files.
+    """
+    hasher = hashlib.sha256()
+    for name, file_hash in sorted(
+        (bundle_member_name(info.dist_file_path), info.hash)
+        for info in file_infos
+    ):
+        hasher.update(f"{name}\0{file_hash}\n".encode("utf-8"))
+    return hasher.hexdigest()
+
+
+def bundle_key(
+    modpack_name: str, group: str, digest: str, encoding: Optional[str]
+) -> str:
+    """Return the object key of a bundle."""
+    return (
+        f"modpacks/{modpack_name}/bundles/{group}-{digest[:16]}"
+        f"{BUNDLE_SUFFIXES[encoding]}"
+    )
+
+
+def bundle_local_path(bundle: BundleInfo) -> str:
+    """Return the local path where the bundle archive is kept."""
+    return os.path.join(BUNDLES_DIR, bundle.yan_obj_storage)
+
+
+class _HashingWriter:
+    """A file wrapper which counts and hashes everything written."""
+
+    def __init__(self, fileobj) -> None:
+        self._fileobj = fileobj
+        self.hasher = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data: bytes) -> int:
+        """Hash and count data, then write it to the wrapped file."""
+        self.hasher.update(data)
+        self.size += len(data)
+        return self._fileobj.write(data)
+
+    def flush(self) -> None:
+        """Flush the wrapped file."""
+        self._fileobj.flush()
+
+
+def write_tar(file_infos: List[FileInfo], fileobj) -> None:
+    """
+    Write a deterministic tar archive of the files into fileobj.
+
+    Members are sorted by name and carry no timestamps or owners, so the
+    same files always give the same bytes. Files are read from their
+    object keys, which are paths relative to the repository root.
+    """
+    with tarfile.open(
+        fileobj=fileobj, mode="w|", format=tarfile.PAX_FORMAT
+    ) as tar:
+        for file_info in sorted(
+            file_infos,
+            key=lambda info: bundle_member_name(info.dist_file_path),
+        ):
+            tar_info = tarfile.TarInfo(
+                bundle_member_name(file_info.dist_file_path)
+            )
+            tar_info.size = os.path.getsize(file_info.yan_obj_storage)
+            tar_info.mtime = 0
+            tar_info.mode = 0o644
+            with open(file_info.yan_obj_storage, "rb") as fr:
+                tar.addfile(tar_info, fr)
+
+
+def build_bundle(
+    file_infos: List[FileInfo],
+    output_path: str,
+    encoding: Optional[str],
+) -> BundleInfo:
+    """
+    Build a bundle archive.
+
+    Args:
+        file_infos (List[FileInfo]): Files of the group.
+        output_path (str): Where the archive is written.
+        encoding (Optional[str]): "zstd", "gzip" or None.
+
+    Returns:
+        BundleInfo: The bundle, yan_obj_storage is not set yet.
+
+    Raises:
+        BundleFailed: If zstd is requested but zstandard is missing.
+    """
+    if encoding == "zstd" and zstandard is None:
+        raise BundleFailed("zstandard package is not installed.")
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    tmp_path = f"{output_path}.tmp"
+    with open(tmp_path, "wb") as raw:
+        writer = _HashingWriter(raw)
+        if encoding == "zstd":
+            compressor = zstandard.ZstdCompressor(level=19, threads=-1)
+            with compressor.stream_writer(writer, closefd=False) as stream:
+                write_tar(file_infos, stream)
+        elif encoding == "gzip":
+            with gzip.GzipFile(
+                fileobj=writer, mode="wb", mtime=0, filename=""
+            ) as stream:
+                write_tar(file_infos, stream)
+        else:
+            write_tar(file_infos, writer)
+    os.replace(tmp_path, output_path)
+    return BundleInfo(
+        yan_obj_storage="",
+        hash=writer.hasher.hexdigest(),
+        size=writer.size,
+        encoding=encoding,
+        content_digest=content_digest(file_infos),
+    )
+
+
+def ensure_bundle(
+    modpack_name: str,
+    group: str,
+    file_infos: List[FileInfo],
+    encoding: Optional[str],
+) -> Optional[BundleInfo]:
+    """
+    Return the bundle of a group, building it only if it does not exist.
+
+    A sidecar JSON file next to the archive keeps its hash and size, so
+    an existing bundle is not read again.
+
+    Returns:
+        Optional[BundleInfo]: The bundle, or None for an empty group.
+    """
+    if not file_infos:
+        return None
+    digest = content_digest(file_infos)
+    key = bundle_key(modpack_name, group, digest, encoding)
+    local_path = os.path.join(BUNDLES_DIR, key)
+    info_path = f"{local_path}.json"
+    try:
+        with open(info_path, encoding="utf-8") as fr:
+            bundle = BundleInfo(**json.load(fr))
+        if os.path.getsize(local_path) == bundle.size:
+            return bundle
+    except (OSError, ValueError):
+        pass
+    log.info(f"Building bundle: {key}")
+    bundle = build_bundle(file_infos, local_path, encoding)
+    bundle.yan_obj_storage = key
+    with open(info_path, "w", encoding="utf-8") as fw:
+        json.dump(bundle.model_dump(), fw)
+    return bundle
+
+
+def remove_stale_bundles(map_json: MapJson) -> None:
+    """Delete local bundle archives the map does not reference."""
+    referenced = set()
+    for modpack in map_json.modpacks.values():
+        for bundle in modpack.bundles.values():
+            referenced.add(os.path.normpath(bundle_local_path(bundle)))
+    for root, _directories, files in os.walk(BUNDLES_DIR):
+        for file_name in files:
+            path = os.path.join(root, file_name)
+            archive_path = path.removesuffix(".json")
+            if os.path.normpath(archive_path) not in referenced:
+                os.remove(path)
+
+
+def attach_bundles(
+    map_json: MapJson,
+    include_additional_data: bool = False,
+    encoding: Optional[str] = DEFAULT_BUNDLE_ENCODING,
+) -> MapJson:
+    """
+    Set the `bundles` field of every modpack of the map.
+
+    Args:
+        map_json (MapJson): The map to update in place.
+        include_additional_data (bool): Bundle every
+            client_additional_data group as well.
+        encoding (Optional[str]): Bundle compression, gzip by default.
+            None leaves bundles uncompressed.
+
+    Returns:
+        MapJson: The same map instance.
+    """
+    for modpack_name, modpack in map_json.modpacks.items():
+        groups: Dict[str, List[FileInfo]] = {
+            MAIN_DATA_BUNDLE: modpack.main_data
+        }
+        if include_additional_data:
+            groups.update(modpack.client_additional_data)
+        bundles = {}
+        for group, file_infos in groups.items():
+            bundle = ensure_bundle(modpack_name, group, file_infos, encoding)
+            if bundle is not None:
+                bundles[group] = bundle
+        modpack.bundles = bundles
+    remove_stale_bundles(map_json)
+    return map_json
@@ -0,0 +1,911 @@
+"""
+Client side synchronization of a modpack described by map.json.
+
+The sync plans work against a local hash cache (keyed by size and mtime),
+so warm installs are verified with stat calls only. Missing or changed
+files are downloaded in parallel from Yandex Object Storage, falling back
+to the GitHub api_url. Downloads are resumed from partial files, verified
+against the manifest hash and moved into place atomically. Small files
+stored in pack objects are fetched with ranged requests, several files
+per request. A changed file whose previous version is on disk is updated
+with a patch if the manifest has one from that version.
+
+Usage:
+    python -m src.client_sync map.json <modpack> <install_dir> [--verify-only]
+    python -m src.client_sync <storage url> <modpack> <install_dir>
+
+With a storage url, the manifest of the current generation is fetched
+through the pointer object, so a half published generation is never used.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import tarfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.error import HTTPError, URLError
+from urllib.parse import quote
+from urllib.request import Request, urlopen
+
+from loguru import logger as log
+from pydantic import BaseModel
+
+from src.blob_table import denormalize_map_json
+from src.compression import zstandard
+from src.delta_patches import PatchFailed, apply_patch
+from src.pydantic_models import (
+    BundleInfo,
+    FileInfo,
+    MapJson,
+    NormalizedMapJson,
+    PackRef,
+)
+from src.stat_cache import StatCache
+
+YAN_OBJ_STORAGE_URL = "https://storage.yandexcloud.net/tfc.halloween/"
+POINTER_KEY = "modpacks/current.json"
+SYNC_CACHE_NAME = ".sync_cache.json"
+PART_SUFFIX = ".part"
+PATCH_PART_SUFFIX = ".patch.part"
+TMP_SUFFIX = ".tmp"
+DOWNLOAD_WORKERS = 8
+# A bundle is used when at least this share of a group's files is missing.
+BUNDLE_MISSING_RATIO = 0.5
+BUNDLE_PART_NAME = ".bundle"
+# Ranges of a pack closer than this are fetched with one request.
+PACK_RANGE_GAP = 16 * 1024
+HASH_WORKERS = 4
+CHUNK_SIZE = 64 * 1024
+REQUEST_TIMEOUT = 60
+
+
+class SyncFailed(RuntimeError):
+    """Raises if a file could not be synchronized."""
+
+    def __init__(self, message="Synchronization failed.") -> None:
+        super().__init__(message)
+
+
+class HashMismatch(SyncFailed):
+    """Raises if downloaded data does not match the manifest hash."""
+
+    def __init__(self, message="Downloaded file hash mismatch.") -> None:
+        super().__init__(message)
+
+
+# pylint: disable=R0903
+class SyncTask(BaseModel):
+    """
+    A single file which has to be downloaded.
+
+    Attributes:
+        file_info (FileInfo): The file from the manifest.
+        target_path (str): The local path of the file.
+        reason (str): "missing" or "changed".
+    """
+
+    file_info: FileInfo
+    target_path: str
+    reason: str
+
+
+class PackRange(BaseModel):
+    """
+    A contiguous byte range of a pack object fetched with one request.
+
+    Attributes:
+        yan_obj_storage (str): The object key of the pack.
+        start (int): The first byte of the range.
+        end (int): The byte after the last byte of the range.
+        tasks (List[SyncTask]): Files inside of the range.
+    """
+
+    yan_obj_storage: str
+    start: int
+    end: int
+    tasks: List[SyncTask]
+
+
+class SyncReport(BaseModel):
+    """
+    The result of a synchronization run.
+
+    Attributes:
+        checked (int): The number of files checked.
+        tasks (List[SyncTask]): Files which were missing or changed.
+        downloaded (List[str]): Target paths which were downloaded.
+        failed (List[str]): Target paths which could not be downloaded.
+        bundled (List[str]): Target paths extracted from bundles before
+            the per-file synchronization.
+    """
+
+    checked: int = 0
+    tasks: List[SyncTask] = []
+    downloaded: List[str] = []
+    failed: List[str] = []
+    bundled: List[str] = []
+
+    @property
+    def ok(self) -> bool:
+        """True if the install is complete."""
+        return not self.failed and len(self.downloaded) == len(self.tasks)
+
+
+def resolve_dist_path(install_dir: str, dist_file_path: str) -> str:
+    """
+    Convert a manifest dist_file_path into a local path.
+
+    Manifests are generated on Windows, so both separators are accepted.
+
+    Raises:
+        SyncFailed: If the path escapes the install directory.
+    """
+    parts = [
+        part for part in dist_file_path.replace("\\", "/").split("/") if part
+    ]
+    if not parts or ".." in parts or os.path.isabs(dist_file_path):
+        raise SyncFailed(f"Unsafe dist_file_path: {dist_file_path}")
+    return os.path.join(install_dir, *parts)
+
+
+def files_for_modpack(
+    map_json: MapJson,
+    modpack_name: str,
+    groups: Iterable[str] = (),
+) -> List[FileInfo]:
+    """
+    Collect files of the modpack which should be installed.
+
+    Args:
+        map_json (MapJson): The manifest.
+        modpack_name (str): The name of the modpack.
+        groups (Iterable[str]): Names of client_additional_data groups
+            to install together with main_data.
+
+    Raises:
+        SyncFailed: If the modpack or a group does not exist.
+    """
+    try:
+        modpack = map_json.modpacks[modpack_name]
+    except KeyError as error:
+        raise SyncFailed(f"Unknown modpack: {modpack_name}") from error
+    file_infos = list(modpack.main_data)
+    for group in groups:
+        try:
+            file_infos.extend(modpack.client_additional_data[group])
+        except KeyError as error:
+            raise SyncFailed(f"Unknown data group: {group}") from error
+    return file_infos
+
+
+def hash_local_file(file_path: str) -> str:
+    """Calculate the sha256 hash of a local file."""
+    hasher = hashlib.sha256()
+    with open(file_path, "rb") as fr:
+        for chunk in iter(lambda: fr.read(CHUNK_SIZE), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def cached_local_hash(file_path: str, cache: StatCache) -> str:
+    """Get the hash of a local file from the cache, hashing on a miss."""
+    cached = cache.get(file_path)
+    if cached is not None and "hash" in cached:
+        return cached["hash"]
+    file_hash = hash_local_file(file_path)
+    cache.set(file_path, {"hash": file_hash})
+    return file_hash
+
+
+def _check_file(
+    file_info: FileInfo,
+    target_path: str,
+    cache: StatCache,
+) -> Optional[SyncTask]:
+    if not os.path.isfile(target_path):
+        return SyncTask(
+            file_info=file_info, target_path=target_path, reason="missing"
+        )
+    if (
+        file_info.size is not None
+        and os.path.getsize(target_path) != file_info.size
+    ):
+        return SyncTask(
+            file_info=file_info, target_path=target_path, reason="changed"
+        )
+    if cached_local_hash(target_path, cache) != file_info.hash:
+        return SyncTask(
+            file_info=file_info, target_path=target_path, reason="changed"
+        )
+    return None
+
+
+def plan_sync(
+    file_infos: Iterable[FileInfo],
+    install_dir: str,
+    cache: StatCache,
+    workers: int = HASH_WORKERS,
+) -> List[SyncTask]:
+    """
+    Find files which are missing or differ from the manifest.
+
+    Files with a cache entry matching their size and mtime are not read.
+
+    Args:
+        file_infos (Iterable[FileInfo]): Files from the manifest.
+        install_dir (str): The local install directory.
+        cache (StatCache): The local hash cache.
+        workers (int): The number of threads used for hashing.
+
+    Returns:
+        List[SyncTask]: Files which have to be downloaded, in manifest
+            order.
+    """
+    targets = [
+        (file_info, resolve_dist_path(install_dir, file_info.dist_file_path))
+        for file_info in file_infos
+    ]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(
+            lambda item: _check_file(item[0], item[1], cache), targets
+        )
+        return [task for task in results if task is not None]
+
+
+def _quote_url(url: str) -> str:
+    return quote(url, safe=":/%?=&")
+
+
+def _open_url(url: str, offset: int = 0, end: Optional[int] = None):
+    if end is not None:
+        headers = {"Range": f"bytes={offset}-{end}"}
+    else:
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+    return urlopen(  # nosec B310 - urls come from the manifest
+        Request(_quote_url(url), headers=headers), timeout=REQUEST_TIMEOUT
+    )
+
+
+def download_with_resume(url: str, part_path: str) -> None:
+    """
+    Download a url into part_path, continuing a previous partial download.
+
+    Args:
+        url (str): The url to download.
+        part_path (str): The partial file to write into.
+
+    Raises:
+        urllib.error.URLError: If the request fails.
+    """
+    offset = os.path.getsize(part_path) if os.path.isfile(part_path) else 0
+    try:
+        response = _open_url(url, offset)
+    except HTTPError as error:
+        # The partial file is already complete.
+        if error.code == 416 and offset:
+            return
+        raise
+    with response:
+        mode = "ab" if offset and response.status == 206 else "wb"
+        with open(part_path, mode) as fw:
+            shutil.copyfileobj(response, fw, CHUNK_SIZE)
+
+
+def _decompress_file(source_path: str, target_path: str, encoding: str):
+    with open(target_path, "wb") as fw:
+        if encoding == "gzip":
+            with gzip.open(source_path, "rb") as fr:
+                shutil.copyfileobj(fr, fw, CHUNK_SIZE)
+        elif encoding == "zstd" and zstandard is not None:
+            with open(source_path, "rb") as raw:
+                reader = zstandard.ZstdDecompressor().stream_reader(raw)
+                shutil.copyfileobj(reader, fw, CHUNK_SIZE)
+        else:
+            raise SyncFailed(f"Unsupported encoding: {encoding}")
+
+
+def _fetch_verified(url: str, part_path: str, expected_hash: str) -> None:
+    download_with_resume(url, part_path)
+    if hash_local_file(part_path) != expected_hash:
+        os.remove(part_path)
+        raise HashMismatch(f"Hash mismatch for {url}")
+
+
+def download_sources(
+    file_info: FileInfo,
+    storage_url: str = YAN_OBJ_STORAGE_URL,
+) -> List[Tuple[str, str, Optional[str]]]:
+    """
+    List download sources in order of preference.
+
+    Returns:
+        List[Tuple[str, str, Optional[str]]]: Tuples of (url, expected
+            hash of the downloaded bytes, compression encoding or None).
+    """
+    sources: List[Tuple[str, str, Optional[str]]] = []
+    variant = file_info.compressed
+    if variant is not None and (
+        variant.encoding == "gzip" or zstandard is not None
+    ):
+        sources.append(
+            (
+                storage_url + variant.yan_obj_storage,
+                variant.hash,
+                variant.encoding,
+            )
+        )
+    sources.append(
+        (storage_url + file_info.yan_obj_storage, file_info.hash, None)
+    )
+    sources.append((file_info.api_url, file_info.hash, None))
+    return sources
+
+
+def patch_file(
+    task: SyncTask,
+    cache: StatCache,
+    storage_url: str = YAN_OBJ_STORAGE_URL,
+) -> bool:
+    """
+    Update a changed file with a patch from its local version.
+
+    Returns:
+        bool: True if the file was patched, False if the manifest has no
+            usable patch for the local version or patching failed.
+    """
+    target_path = task.target_path
+    if not task.file_info.patches or not os.path.isfile(target_path):
+        return False
+    local_hash = cached_local_hash(target_path, cache)
+    for patch in task.file_info.patches:
+        if patch.from_hash != local_hash or (
+            patch.encoding == "zstd-dict" and zstandard is None
+        ):
+            continue
+        url = storage_url + patch.yan_obj_storage
+        part_path = target_path + PATCH_PART_SUFFIX
+        tmp_path = target_path + TMP_SUFFIX
+        try:
+            _fetch_verified(url, part_path, patch.hash)
+            with open(part_path, "rb") as fr:
+                data = fr.read()
+            os.remove(part_path)
+            with open(target_path, "rb") as fr:
+                new = apply_patch(fr.read(), data, patch.encoding)
+            if hashlib.sha256(new).hexdigest() != task.file_info.hash:
+                raise HashMismatch(f"Hash mismatch after patching {url}")
+            with open(tmp_path, "wb") as fw:
+                fw.write(new)
+            os.replace(tmp_path, target_path)
+            cache.set(target_path, {"hash": task.file_info.hash})
+            return True
+        except (URLError, OSError, SyncFailed, PatchFailed) as error:
+            log.warning(f"Patch failed: {url}: {error}")
+    return False
+
+
+def download_file(
+    task: SyncTask,
+    cache: StatCache,
+    storage_url: str = YAN_OBJ_STORAGE_URL,
+) -> None:
+    """
+    Download a single file, verify it and move it into place.
+
+    A patch from the local version is tried first, then every source in
+    turn. The target file is replaced with os.replace(), so it is never
+    left half written.
+
+    Raises:
+        SyncFailed: If no source produced a file with the right hash.
+    """
+    target_path = task.target_path
+    if patch_file(task, cache, storage_url):
+        return
+    os.makedirs(os.path.dirname(target_path) or ".", exist_ok=True)
+    errors = []
+    for url, expected_hash, encoding in download_sources(
+        task.file_info, storage_url
+    ):
+        part_path = (
+            target_path + PART_SUFFIX + (f".{encoding}" if encoding else "")
+        )
+        try:
+            _fetch_verified(url, part_path, expected_hash)
+            if encoding:
+                tmp_path = target_path + TMP_SUFFIX
+                _decompress_file(part_path, tmp_path, encoding)
+                os.remove(part_path)
+                if hash_local_file(tmp_path) != task.file_info.hash:
+                    os.remove(tmp_path)
+                    raise HashMismatch(f"Hash mismatch for {url}")
+                part_path = tmp_path
+            os.replace(part_path, target_path)
+            cache.set(target_path, {"hash": task.file_info.hash})
+            return
+        except (URLError, OSError, SyncFailed) as error:
+            log.warning(f"Download failed: {url}: {error}")
+            errors.append(str(error))
+    raise SyncFailed(f"Unable to download {target_path}: {errors}")
+
+
+def plan_pack_ranges(
+    tasks: Iterable[SyncTask], max_gap: int = PACK_RANGE_GAP
+) -> List[PackRange]:
+    """
+    Merge packed files of the tasks into as few ranges as possible.
+
+    Files of the same pack separated by at most max_gap bytes share a
+    range, the bytes in between are downloaded and dropped.
+    """
+    by_pack: Dict[str, List[Tuple[PackRef, SyncTask]]] = {}
+    for task in tasks:
+        ref = task.file_info.pack
+        if ref is not None:
+            by_pack.setdefault(ref.yan_obj_storage, []).append((ref, task))
+    ranges: List[PackRange] = []
+    for key, packed in sorted(by_pack.items()):
+        packed.sort(key=lambda item: item[0].offset)
+        current: Optional[PackRange] = None
+        for ref, task in packed:
+            if current is not None and ref.offset - current.end <= max_gap:
+                current.end = max(current.end, ref.offset + ref.length)
+                current.tasks.append(task)
+                continue
+            current = PackRange(
+                yan_obj_storage=key,
+                start=ref.offset,
+                end=ref.offset + ref.length,
+                tasks=[task],
+            )
+            ranges.append(current)
+    return ranges
+
+
+def download_pack_range(
+    pack_range: PackRange,
+    cache: StatCache,
+    storage_url: str = YAN_OBJ_STORAGE_URL,
+) -> List[str]:
+    """
+    Fetch a range of a pack and write the files inside of it.
+
+    Every file is verified by hash and moved into place atomically.
+
+    Returns:
+        List[str]: Target paths which were written. Files missing from
+            the result should be downloaded one by one.
+    """
+    url = storage_url + pack_range.yan_obj_storage
+    with _open_url(url, pack_range.start, pack_range.end - 1) as response:
+        data = response.read()
+        # The server ignored the Range header.
+        if response.status != 206:
+            data = data[pack_range.start : pack_range.end]
+    written = []
+    for task in pack_range.tasks:
+        ref = task.file_info.pack
+        if ref is None:
+            continue
+        start = ref.offset - pack_range.start
+        chunk = data[start : start + ref.length]
+        if hashlib.sha256(chunk).hexdigest() != task.file_info.hash:
+            log.warning(f"Hash mismatch in pack range: {task.target_path}")
+            continue
+        os.makedirs(os.path.dirname(task.target_path) or ".", exist_ok=True)
+        tmp_path = task.target_path + TMP_SUFFIX
+        with open(tmp_path, "wb") as fw:
+            fw.write(chunk)
+        os.replace(tmp_path, task.target_path)
+        cache.set(task.target_path, {"hash": task.file_info.hash})
+        written.append(task.target_path)
+    return written
+
+
+def sync_files(
+    file_infos: Iterable[FileInfo],
+    install_dir: str,
+    verify_only: bool = False,
+    workers: int = DOWNLOAD_WORKERS,
+    storage_url: str = YAN_OBJ_STORAGE_URL,
+) -> SyncReport:
+    """
+    Bring install_dir in line with the given manifest files.
+
+    Args:
+        file_infos (Iterable[FileInfo]): Files from the manifest.
+        install_dir (str): The local install directory.
+        verify_only (bool): Only report missing and changed files.
+        workers (int): The number of parallel downloads.
+        storage_url (str): The public url of the object storage bucket.
+
+    Returns:
+        SyncReport: What was checked, downloaded and failed.
+    """
+    file_infos = list(file_infos)
+    cache = StatCache(os.path.join(install_dir, SYNC_CACHE_NAME)).load()
+    lock = threading.Lock()
+    report = SyncReport(checked=len(file_infos))
+    try:
+        report.tasks = plan_sync(file_infos, install_dir, cache)
+        if verify_only or not report.tasks:
+            return report
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            remaining = [
+                task for task in report.tasks if task.file_info.pack is None
+            ]
+            range_futures = {
+                executor.submit(
+                    download_pack_range, pack_range, cache, storage_url
+                ): pack_range
+                for pack_range in plan_pack_ranges(report.tasks)
+            }
+            for range_future in as_completed(range_futures):
+                pack_range = range_futures[range_future]
+                try:
+                    written = set(range_future.result())
+                except (URLError, OSError) as error:
+                    log.warning(
+                        f"Pack download failed: "
+                        f"{pack_range.yan_obj_storage}: {error}"
+                    )
+                    written = set()
+                for task in pack_range.tasks:
+                    if task.target_path in written:
+                        report.downloaded.append(task.target_path)
+                    else:
+                        remaining.append(task)
+
+            futures = {
+                executor.submit(download_file, task, cache, storage_url): task
+                for task in remaining
+            }
+            for future in as_completed(futures):
+                task = futures[future]
+                try:
+                    future.result()
+                except SyncFailed as error:
+                    log.error(str(error))
+                    with lock:
+                        report.failed.append(task.target_path)
+                else:
+                    log.info(f"Downloaded: {task.target_path}")
+                    with lock:
+                        report.downloaded.append(task.target_path)
+    finally:
+        cache.save()
+    return report
+
+
+def _open_bundle_stream(raw, encoding: Optional[str]):
+    if encoding is None:
+        return raw
+    if encoding == "gzip":
+        return gzip.GzipFile(fileobj=raw, mode="rb")
+    if encoding == "zstd" and zstandard is not None:
+        return zstandard.ZstdDecompressor().stream_reader(raw)
+    raise SyncFailed(f"Unsupported encoding: {encoding}")
+
+
+def extract_bundle(
+    archive_path: str,
+    encoding: Optional[str],
+    install_dir: str,
+    expected: Dict[str, str],
+    cache: StatCache,
+) -> List[str]:
+    """
+    Extract a bundle archive into install_dir in a single pass.
+
+    Only members listed in `expected` are written. Every member is
+    hashed while it is written and moved into place only if the hash
+    matches the manifest.
+
+    Args:
+        archive_path (str): The downloaded archive.
+        encoding (Optional[str]): The compression of the archive.
+        install_dir (str): The local install directory.
+        expected (Dict[str, str]): Hashes keyed by dist_file_path with
+            forward slashes.
+        cache (StatCache): The local hash cache to fill.
+
+    Returns:
+        List[str]: Target paths which were extracted.
+    """
+    extracted = []
+    with (
+        open(archive_path, "rb") as raw,
+        tarfile.open(
+            fileobj=_open_bundle_stream(raw, encoding), mode="r|"
+        ) as tar,
+    ):
+        for member in tar:
+            expected_hash = expected.get(member.name)
+            if not member.isfile() or expected_hash is None:
+                continue
+            target_path = resolve_dist_path(install_dir, member.name)
+            os.makedirs(os.path.dirname(target_path) or ".", exist_ok=True)
+            tmp_path = target_path + TMP_SUFFIX
+            hasher = hashlib.sha256()
+            member_file = tar.extractfile(member)
+            if member_file is None:
+                continue
+            with member_file as fr, open(tmp_path, "wb") as fw:
+                while chunk := fr.read(CHUNK_SIZE):
+                    hasher.update(chunk)
+                    fw.write(chunk)
+            if hasher.hexdigest() != expected_hash:
+                os.remove(tmp_path)
+                log.warning(f"Hash mismatch in bundle: {member.name}")
+                continue
+            os.replace(tmp_path, target_path)
+            cache.set(target_path, {"hash": expected_hash})
+            extracted.append(target_path)
+    return extracted
+
+
+def install_bundle(
+    bundle: BundleInfo,
+    file_infos: List[FileInfo],
+    install_dir: str,
+    storage_url: str = YAN_OBJ_STORAGE_URL,
+) -> List[str]:
+    """
+    Install a data group from its bundle with a single download.
+
+    The archive is downloaded with resume support, verified against the
+    manifest hash and extracted. Files which are not extracted are left
+    to the regular per-file synchronization.
+
+    Returns:
+        List[str]: Target paths which were extracted.
+
+    Raises:
+        SyncFailed: If the bundle could not be downloaded.
+    """
+    os.makedirs(install_dir, exist_ok=True)
+    part_path = os.path.join(install_dir, BUNDLE_PART_NAME + PART_SUFFIX)
+    url = storage_url + bundle.yan_obj_storage
+    try:
+        _fetch_verified(url, part_path, bundle.hash)
+    except (URLError, OSError) as error:
+        raise SyncFailed(f"Unable to download {url}: {error}") from error
+    cache = StatCache(os.path.join(install_dir, SYNC_CACHE_NAME)).load()
+    try:
+        return extract_bundle(
+            part_path,
+            bundle.encoding,
+            install_dir,
+            {
+                file_info.dist_file_path.replace("\\", "/"): file_info.hash
+                for file_info in file_infos
+            },
+            cache,
+        )
+    finally:
+        cache.save()
+        os.remove(part_path)
+
+
+def _needs_bundle(file_infos: List[FileInfo], install_dir: str) -> bool:
+    """Return True if most files of a group are missing locally."""
+    if not file_infos:
+        return False
+    missing = sum(
+        not os.path.isfile(
+            resolve_dist_path(install_dir, file_info.dist_file_path)
+        )
+        for file_info in file_infos
+    )
+    return missing >= len(file_infos) * BUNDLE_MISSING_RATIO
+
+
+def sync_modpack(
+    map_json: MapJson,
+    modpack_name: str,
+    install_dir: str,
+    groups: Iterable[str] = (),
+    verify_only: bool = False,
+    workers: int = DOWNLOAD_WORKERS,
+    storage_url: str = YAN_OBJ_STORAGE_URL,
+) -> SyncReport:
+    """
+    Synchronize main_data and chosen additional groups of a modpack.
+
+    Groups which are mostly missing (a cold install) are installed
+    from their bundles first, if the manifest has them. The remaining
+    files are then synchronized one by one.
+    """
+    groups = list(groups)
+    file_infos = files_for_modpack(map_json, modpack_name, groups)
+    bundled = []
+    if not verify_only:
+        modpack = map_json.modpacks[modpack_name]
+        group_files = {"main_data": modpack.main_data}
+        for group in groups:
+            group_files[group] = modpack.client_additional_data[group]
+        for group, bundle in modpack.bundles.items():
+            if group not in group_files or not _needs_bundle(
+                group_files[group], install_dir
+            ):
+                continue
+            try:
+                bundled.extend(
+                    install_bundle(
+                        bundle, group_files[group], install_dir, storage_url
+                    )
+                )
+            except SyncFailed as error:
+                log.warning(f"Bundle is not used: {error}")
+    report = sync_files(
+        file_infos,
+        install_dir,
+        verify_only=verify_only,
+        workers=workers,
+        storage_url=storage_url,
+    )
+    report.bundled = bundled
+    return report
+
+
+def blob_store_path(blob_store_dir: str, file_hash: str) -> str:
+    """Return the path of a blob inside of the shared blob store."""
+    return os.path.join(blob_store_dir, file_hash[:2], file_hash)
+
+
+def link_or_copy(source_path: str, target_path: str) -> None:
+    """
+    Place a copy of source_path at target_path atomically.
+
+    A hardlink is used where the file system allows it, so several
+    installs share one copy of the bytes.
+    """
+    os.makedirs(os.path.dirname(target_path) or ".", exist_ok=True)
+    tmp_path = target_path + TMP_SUFFIX
+    if os.path.lexists(tmp_path):
+        os.remove(tmp_path)
+    try:
+        os.link(source_path, tmp_path)
+    except OSError:
+        shutil.copy2(source_path, tmp_path)
+    os.replace(tmp_path, target_path)
+
+
+def sync_normalized_modpack(
+    normalized: NormalizedMapJson,
+    modpack_name: str,
+    install_dir: str,
+    blob_store_dir: str,
+    groups: Iterable[str] = (),
+    verify_only: bool = False,
+    workers: int = DOWNLOAD_WORKERS,
+    storage_url: str = YAN_OBJ_STORAGE_URL,
+) -> SyncReport:
+    """
+    Synchronize a modpack from a map with a shared blob table.
+
+    Every blob is downloaded once into blob_store_dir and linked into
+    the install directory. Installs of other modpacks using the same
+    store reuse blobs which are already there.
+
+    Args:
+        normalized (NormalizedMapJson): The normalized manifest.
+        modpack_name (str): The name of the modpack.
+        install_dir (str): The local install directory.
+        blob_store_dir (str): A directory shared by all installs.
+        groups (Iterable[str]): Names of client_additional_data groups
+            to install together with main_data.
+        verify_only (bool): Only report missing and changed files.
+        workers (int): The number of parallel downloads.
+        storage_url (str): The public url of the object storage bucket.
+
+    Returns:
+        SyncReport: What was checked, downloaded (or linked) and failed.
+    """
+    file_infos = files_for_modpack(
+        denormalize_map_json(normalized), modpack_name, groups
+    )
+    cache = StatCache(os.path.join(install_dir, SYNC_CACHE_NAME)).load()
+    report = SyncReport(checked=len(file_infos))
+    try:
+        report.tasks = plan_sync(file_infos, install_dir, cache)
+        if verify_only or not report.tasks:
+            return report
+
+        blobs: Dict[str, FileInfo] = {}
+        for task in report.tasks:
+            blobs.setdefault(
+                task.file_info.hash,
+                task.file_info.model_copy(
+                    update={
+                        "dist_file_path": os.path.relpath(
+                            blob_store_path(
+                                blob_store_dir, task.file_info.hash
+                            ),
+                            blob_store_dir,
+                        )
+                    }
+                ),
+            )
+        store_report = sync_files(
+            blobs.values(),
+            blob_store_dir,
+            workers=workers,
+            storage_url=storage_url,
+        )
+        failed_blobs = {os.path.basename(path) for path in store_report.failed}
+        for task in report.tasks:
+            if task.file_info.hash in failed_blobs:
+                report.failed.append(task.target_path)
+                continue
+            link_or_copy(
+                blob_store_path(blob_store_dir, task.file_info.hash),
+                task.target_path,
+            )
+            cache.set(task.target_path, {"hash": task.file_info.hash})
+            report.downloaded.append(task.target_path)
+    finally:
+        cache.save()
+    return report
+
+
+def fetch_map_json(
+    storage_url: str = YAN_OBJ_STORAGE_URL,
+    pointer_key: str = POINTER_KEY,
+) -> MapJson:
+    """
+    Fetch the manifest of the current generation from the bucket.
+
+    Raises:
+        SyncFailed: If the pointer or the manifest can not be loaded.
+    """
+    try:
+        with _open_url(storage_url + pointer_key) as response:
+            pointer = json.load(response)
+        with _open_url(storage_url + pointer["manifest_key"]) as response:
+            return MapJson(**json.load(response))
+    except (URLError, OSError, ValueError, KeyError) as error:
+        raise SyncFailed(f"Unable to fetch the manifest: {error}") from error
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("map_json")
+    parser.add_argument("modpack")
+    parser.add_argument("install_dir")
+    parser.add_argument("--group", action="append", default=[])
+    parser.add_argument("--verify-only", action="store_true")
+    parser.add_argument("--workers", type=int, default=DOWNLOAD_WORKERS)
+    args = parser.parse_args(argv)
+    storage_url = YAN_OBJ_STORAGE_URL
+    if args.map_json.startswith(("http://", "https://")):
+        storage_url = args.map_json.rstrip("/") + "/"
+        map_json = fetch_map_json(storage_url)
+    else:
+        with open(args.map_json, encoding="utf-8") as fr:
+            map_json = MapJson(**json.load(fr))
+    report = sync_modpack(
+        map_json,
+        args.modpack,
+        args.install_dir,
+        groups=args.group,
+        verify_only=args.verify_only,
+        workers=args.workers,
+        storage_url=storage_url,
+    )
+    if report.bundled:
+        log.info(f"Extracted from bundles: {len(report.bundled)}")
+    for task in report.tasks:
+        log.info(f"{task.reason}: {task.target_path}")
+    if args.verify_only:
+        return 1 if report.tasks else 0
+    return 0 if report.ok else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
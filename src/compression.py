@@ -0,0 +1,216 @@
+"""
+Precompressed transfer variants for compressible modpack files.
+
+Files which compress well (configs, servers.dat, text resources) get
+a compressed copy uploaded next to the original object. Launchers
+download the smaller copy and decompress it locally. Already compressed
+formats (jars, zips, images) are skipped without measuring.
+"""
+import gzip
+import hashlib
+import os
+from typing import Iterator, Optional
+
+from loguru import logger as log
+
+from src.pydantic_models import CompressedVariant, FileInfo, MapJson
+from src.stat_cache import StatCache
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+COMPRESSED_DIR = os.path.join("data", "compressed")
+COMPRESSION_CACHE_PATH = os.path.join("data", "compression_cache.json")
+# A variant is published only if it is smaller than this share
+# of the original size.
+COMPRESSION_RATIO_THRESHOLD = 0.8
+# Smaller files are not worth an extra object.
+MIN_COMPRESSIBLE_SIZE = 1024
+INCOMPRESSIBLE_SUFFIXES = frozenset(
+    {
+        ".jar",
+        ".zip",
+        ".gz",
+        ".zst",
+        ".xz",
+        ".7z",
+        ".rar",
+        ".jpg",
+        ".jpeg",
+        ".png",
+        ".ogg",
+        ".mp3",
+    }
+)
+ENCODING_SUFFIXES = {"gzip": ".gz", "zstd": ".zst"}
+# zstandard is optional, so it is used only when requested explicitly and
+# map.json does not depend on the packages installed on the machine.
+DEFAULT_ENCODING = "gzip"
+
+
+class CompressionFailed(RuntimeError):
+    """Raises if a compressed variant could not be produced."""
+
+    def __init__(self, message="Compression failed.") -> None:
+        super().__init__(message)
+
+
+def compress_bytes(data: bytes, encoding: str) -> bytes:
+    """
+    Compress data with the given encoding.
+
+    Output is deterministic: gzip headers carry no mtime, so the same
+    input always gives the same compressed hash.
+
+    Args:
+        data (bytes): The data to compress.
+        encoding (str): "gzip" or "zstd".
+
+    Returns:
+        bytes: Compressed data.
+
+    Raises:
+        CompressionFailed: If the encoding is unknown or not available.
+    """
+    if encoding == "gzip":
+        return gzip.compress(data, compresslevel=9, mtime=0)
+    if encoding == "zstd":
+        if zstandard is None:
+            raise CompressionFailed("zstandard package is not installed.")
+        return zstandard.ZstdCompressor(level=19).compress(data)
+    raise CompressionFailed(f"Unknown encoding: {encoding}")
+
+
+def decompress_bytes(data: bytes, encoding: str) -> bytes:
+    """
+    Decompress data produced by compress_bytes().
+
+    Raises:
+        CompressionFailed: If the encoding is unknown or not available.
+    """
+    if encoding == "gzip":
+        return gzip.decompress(data)
+    if encoding == "zstd":
+        if zstandard is None:
+            raise CompressionFailed("zstandard package is not installed.")
+        return zstandard.ZstdDecompressor().decompress(data)
+    raise CompressionFailed(f"Unknown encoding: {encoding}")
+
+
+def is_compressible_candidate(file_path: str) -> bool:
+    """Check by name and size if a file is worth measuring."""
+    suffix = os.path.splitext(file_path)[1].lower()
+    if suffix in INCOMPRESSIBLE_SUFFIXES:
+        return False
+    return os.path.getsize(file_path) >= MIN_COMPRESSIBLE_SIZE
+
+
+def variant_local_path(variant: CompressedVariant) -> str:
+    """Return the local path where the variant payload is kept."""
+    return os.path.join(COMPRESSED_DIR, variant.yan_obj_storage)
+
+
+def measure_compressed_variant(
+    file_info: FileInfo,
+    encoding: str,
+    cache: StatCache,
+) -> Optional[CompressedVariant]:
+    """
+    Build a compressed variant for a file if it compresses well enough.
+
+    The file is read from its object key, which is a path relative to
+    the repository root. The compressed payload is written into
+    COMPRESSED_DIR so it can be uploaded later.
+
+    Args:
+        file_info (FileInfo): The file to measure.
+        encoding (str): "gzip" or "zstd".
+        cache (StatCache): Results of previous measurements.
+
+    Returns:
+        Optional[CompressedVariant]: The variant, or None if the file
+            is not worth compressing.
+    """
+    file_path = file_info.yan_obj_storage
+    if not is_compressible_candidate(file_path):
+        return None
+    cached = cache.get(file_path)
+    if (
+        cached is not None
+        and cached.get("hash") == file_info.hash
+        and cached.get("encoding") == encoding
+    ):
+        if cached["variant"] is None:
+            return None
+        cached_variant = CompressedVariant(**cached["variant"])
+        local_path = variant_local_path(cached_variant)
+        if (
+            os.path.isfile(local_path)
+            and os.path.getsize(local_path) == cached_variant.size
+        ):
+            return cached_variant
+
+    with open(file_path, "rb") as fr:
+        data = fr.read()
+    compressed = compress_bytes(data, encoding)
+    variant: Optional[CompressedVariant] = None
+    if len(compressed) <= len(data) * COMPRESSION_RATIO_THRESHOLD:
+        variant = CompressedVariant(
+            encoding=encoding,
+            yan_obj_storage=(
+                file_info.yan_obj_storage + ENCODING_SUFFIXES[encoding]
+            ),
+            hash=hashlib.sha256(compressed).hexdigest(),
+            size=len(compressed),
+        )
+        local_path = variant_local_path(variant)
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        with open(local_path, "wb") as fw:
+            fw.write(compressed)
+        log.debug(
+            f"Compressed variant: {variant.yan_obj_storage}, "
+            f"{len(data)} -> {len(compressed)} bytes"
+        )
+    cache.set(
+        file_path,
+        {
+            "hash": file_info.hash,
+            "encoding": encoding,
+            "variant": variant.model_dump() if variant else None,
+        },
+    )
+    return variant
+
+
+def iter_all_file_infos(map_json: MapJson) -> Iterator[FileInfo]:
+    """Iterate over every FileInfo in the map, server icons included."""
+    for modpack in map_json.modpacks.values():
+        yield modpack.server_config.server_icon
+        yield from modpack.main_data
+        for additional_data in modpack.client_additional_data.values():
+            yield from additional_data
+
+
+def attach_compressed_variants(
+    map_json: MapJson,
+    cache: StatCache,
+    encoding: str = DEFAULT_ENCODING,
+) -> MapJson:
+    """
+    Set the `compressed` field on every FileInfo of the map.
+
+    Args:
+        map_json (MapJson): The map to update in place.
+        cache (StatCache): Results of previous measurements.
+        encoding (str): Compression format, gzip by default.
+
+    Returns:
+        MapJson: The same map instance.
+    """
+    for file_info in iter_all_file_infos(map_json):
+        file_info.compressed = measure_compressed_variant(
+            file_info, encoding, cache
+        )
+    return map_json
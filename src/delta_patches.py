@@ -0,0 +1,450 @@
+"""
+Binary patches between successive versions of a file.
+
+When a file changes in place (same dist_file_path, new hash), the
+publisher builds a patch from the previous version and advertises it in
+FileInfo.patches, so clients holding the previous version download the
+patch instead of the whole file.
+
+The previous bytes are taken from git and verified against the old hash.
+The pre-commit hook records HEAD as source_commit, while the files of
+that map are committed together with it, so the commit which last
+changed map.json is tried first, then HEAD and source_commit. Patches
+are made with a block delta compressed with lzma. zstd with the old
+version as a raw content dictionary (the --patch-from approach) can be
+requested explicitly if zstandard is installed. Every patch is applied
+and checked against the new hash before it is published, and kept only
+if it is much smaller than the file.
+"""
+import hashlib
+import json
+import lzma
+import os
+import re
+import struct
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Sequence
+
+from loguru import logger as log
+
+from src.compression import iter_all_file_infos, zstandard
+from src.git_hash_provider import GitUnavailable, current_commit, run_git
+from src.map_diff import diff_map_json
+from src.pydantic_models import FileInfo, MapJson, PatchInfo
+
+PATCHES_DIR = os.path.join("data", "patches")
+PATCH_KEY_PREFIX = "modpacks/patches/"
+# A patch is published only if it is at most this share of the file.
+PATCH_RATIO_THRESHOLD = 0.5
+MIN_PATCH_FILE_SIZE = 64 * 1024
+# Compressing the literals of a rewritten file with lzma takes about a
+# second per 2 MiB, larger files are downloaded whole.
+MAX_PATCH_FILE_SIZE = 32 * 1024 * 1024
+BLOCK_SIZE = 64
+# Anchor bytes are chosen from a sample of at most this many bytes.
+ANCHOR_SAMPLE_SIZE = 1024 * 1024
+BLOCK_DELTA_MAGIC = b"HBD1"
+PATCH_SUFFIXES = {"zstd-dict": ".zst", "block-lzma": ".xz"}
+# zstandard is optional, patch names and formats must not depend on it.
+DEFAULT_PATCH_ENCODING = "block-lzma"
+
+
+class PatchFailed(ValueError):
+    """Raises if a patch could not be made or applied."""
+
+    def __init__(self, message="Patch failed.") -> None:
+        super().__init__(message)
+
+
+def _anchor_pattern(data: bytes) -> "re.Pattern[bytes]":
+    """
+    Choose the bytes at which blocks are indexed and looked up.
+
+    The rarest byte values of a sample of data are taken until about one
+    position in BLOCK_SIZE is an anchor, so text and binary files alike
+    get blocks of roughly BLOCK_SIZE between anchors.
+    """
+    sample = data[:: max(1, len(data) // ANCHOR_SAMPLE_SIZE)]
+    chosen = []
+    total = 0
+    for value, count in sorted(
+        Counter(sample).items(), key=lambda item: (item[1], item[0])
+    ):
+        if total * BLOCK_SIZE >= len(sample):
+            break
+        chosen.append(value)
+        total += count
+    return re.compile(
+        b"["
+        + b"".join(re.escape(bytes([value])) for value in chosen or [0])
+        + b"]"
+    )
+
+
+def _common_length(same: Callable[[int, int], bool], limit: int) -> int:
+    """
+    Return the length of a match, at most limit.
+
+    same(low, high) tells whether the bytes from low to high match.
+    Ranges of doubling length are compared, then the first difference
+    is found by bisection, so a long match takes a few comparisons of
+    slices instead of a loop over its bytes.
+    """
+    low, step = 0, BLOCK_SIZE
+    while True:
+        high = min(low + step, limit)
+        if low == high:
+            return low
+        if not same(low, high):
+            break
+        low = high
+        step *= 2
+    while high - low > 1:
+        middle = (low + high) // 2
+        if same(low, middle):
+            low = middle
+        else:
+            high = middle
+    return low
+
+
+def _common_prefix(
+    a: bytes, a_start: int, b: bytes, b_start: int, limit: int
+) -> int:
+    """Return how many bytes match from a[a_start] and b[b_start] on."""
+
+    def same(low: int, high: int) -> bool:
+        return (
+            a[a_start + low : a_start + high]
+            == b[b_start + low : b_start + high]
+        )
+
+    return _common_length(same, limit)
+
+
+def _common_suffix(
+    a: bytes, a_end: int, b: bytes, b_end: int, limit: int
+) -> int:
+    """Return how many bytes before a[a_end] and b[b_end] match."""
+
+    def same(low: int, high: int) -> bool:
+        return a[a_end - high : a_end - low] == b[b_end - high : b_end - low]
+
+    return _common_length(same, limit)
+
+
+def make_block_delta(old: bytes, new: bytes) -> bytes:
+    """
+    Describe new as copies from old and literal bytes.
+
+    Blocks of old starting at anchor bytes are indexed and new is looked
+    up only at its own anchors: unchanged regions have the same anchors
+    in both versions. Each match is extended in both directions.
+    """
+    anchors = _anchor_pattern(old)
+    index: Dict[bytes, int] = {}
+    for anchor in anchors.finditer(old, 0, max(0, len(old) - BLOCK_SIZE + 1)):
+        offset = anchor.start()
+        index.setdefault(old[offset : offset + BLOCK_SIZE], offset)
+    ops = bytearray()
+
+    def add_literal(data: bytes) -> None:
+        if data:
+            ops.extend(b"A" + struct.pack(">I", len(data)) + data)
+
+    literal_start = position = 0
+    end = max(0, len(new) - BLOCK_SIZE + 1)
+    while True:
+        match = anchors.search(new, position, end)
+        if match is None:
+            break
+        position = match.start()
+        old_offset = index.get(new[position : position + BLOCK_SIZE])
+        if old_offset is None:
+            position += 1
+            continue
+        before = _common_suffix(
+            new,
+            position,
+            old,
+            old_offset,
+            min(position - literal_start, old_offset),
+        )
+        after = _common_prefix(
+            new,
+            position,
+            old,
+            old_offset,
+            min(len(new) - position, len(old) - old_offset),
+        )
+        add_literal(new[literal_start : position - before])
+        ops.extend(
+            b"C" + struct.pack(">QI", old_offset - before, before + after)
+        )
+        literal_start = position = position + after
+    add_literal(new[literal_start:])
+    return BLOCK_DELTA_MAGIC + lzma.compress(bytes(ops))
+
+
+def apply_block_delta(old: bytes, patch: bytes) -> bytes:
+    """
+    Rebuild the new version from old and a block delta.
+
+    Raises:
+        PatchFailed: If the patch is broken.
+    """
+    if not patch.startswith(BLOCK_DELTA_MAGIC):
+        raise PatchFailed("Not a block delta")
+    try:
+        ops = lzma.decompress(patch[len(BLOCK_DELTA_MAGIC) :])
+    except lzma.LZMAError as error:
+        raise PatchFailed(str(error)) from error
+    result = bytearray()
+    position = 0
+    try:
+        while position < len(ops):
+            op = ops[position : position + 1]
+            if op == b"A":
+                (length,) = struct.unpack_from(">I", ops, position + 1)
+                position += 5
+                result.extend(ops[position : position + length])
+                position += length
+            elif op == b"C":
+                offset, length = struct.unpack_from(">QI", ops, position + 1)
+                position += 13
+                if offset + length > len(old):
+                    raise PatchFailed("Copy beyond the end of the source")
+                result.extend(old[offset : offset + length])
+            else:
+                raise PatchFailed(f"Unknown operation: {op!r}")
+    except struct.error as error:
+        raise PatchFailed(str(error)) from error
+    return bytes(result)
+
+
+def make_patch(old: bytes, new: bytes, encoding: str) -> bytes:
+    """
+    Make a patch turning old into new.
+
+    Raises:
+        PatchFailed: If the encoding is not supported.
+    """
+    if encoding == "block-lzma":
+        return make_block_delta(old, new)
+    if encoding == "zstd-dict" and zstandard is not None:
+        dictionary = zstandard.ZstdCompressionDict(
+            old, dict_type=zstandard.DICT_TYPE_RAWCONTENT
+        )
+        return zstandard.ZstdCompressor(
+            level=19, dict_data=dictionary
+        ).compress(new)
+    raise PatchFailed(f"Unsupported patch encoding: {encoding}")
+
+
+def apply_patch(old: bytes, patch: bytes, encoding: str) -> bytes:
+    """
+    Apply a patch made by make_patch().
+
+    Raises:
+        PatchFailed: If the patch is broken or the encoding is not
+            supported.
+    """
+    if encoding == "block-lzma":
+        return apply_block_delta(old, patch)
+    if encoding == "zstd-dict" and zstandard is not None:
+        dictionary = zstandard.ZstdCompressionDict(
+            old, dict_type=zstandard.DICT_TYPE_RAWCONTENT
+        )
+        try:
+            return zstandard.ZstdDecompressor(dict_data=dictionary).decompress(
+                patch
+            )
+        except zstandard.ZstdError as error:
+            raise PatchFailed(str(error)) from error
+    raise PatchFailed(f"Unsupported patch encoding: {encoding}")
+
+
+def patch_key(from_hash: str, to_hash: str, encoding: str) -> str:
+    """Return the object key of a patch, named after both versions."""
+    return (
+        f"{PATCH_KEY_PREFIX}{from_hash[:2]}/{from_hash[:16]}-{to_hash[:16]}"
+        f"{PATCH_SUFFIXES[encoding]}"
+    )
+
+
+def patch_local_path(patch: PatchInfo) -> str:
+    """Return the local path where the patch is kept."""
+    return os.path.join(PATCHES_DIR, patch.yan_obj_storage)
+
+
+def read_git_blob(
+    commit: str, file_path: str, expected_hash: str
+) -> Optional[bytes]:
+    """
+    Read a file as it was at a commit.
+
+    Returns:
+        Optional[bytes]: The content, None if git does not have it or its
+            hash differs from expected_hash.
+    """
+    try:
+        data = run_git(["cat-file", "blob", f"{commit}:{file_path}"])
+    except GitUnavailable:
+        return None
+    if hashlib.sha256(data).hexdigest() != expected_hash:
+        return None
+    return data
+
+
+def base_commits(
+    old_map_json: MapJson, map_json_path: str = "map.json"
+) -> List[str]:
+    """
+    List commits which may hold the files of old_map_json, best first.
+
+    Returns:
+        List[str]: The commit which last changed map_json_path, HEAD and
+            source_commit, without duplicates. Empty without git.
+    """
+    commits: List[Optional[str]] = []
+    try:
+        commits.append(
+            run_git(["log", "-1", "--format=%H", "--", map_json_path])
+            .decode("ascii")
+            .strip()
+        )
+    except GitUnavailable:
+        pass
+    commits.append(current_commit())
+    commits.append(old_map_json.source_commit)
+    return list(dict.fromkeys(commit for commit in commits if commit))
+
+
+def ensure_patch(
+    old_info: FileInfo,
+    new_info: FileInfo,
+    commits: Sequence[str],
+    encoding: str,
+) -> Optional[PatchInfo]:
+    """
+    Return the patch from old_info to new_info, making it if needed.
+
+    The result is remembered in a sidecar JSON file, including the
+    decision not to publish a patch, so every pair is tried once.
+
+    Args:
+        old_info (FileInfo): The previous version of the file.
+        new_info (FileInfo): The current version of the file.
+        commits (Sequence[str]): Commits the previous version is looked
+            up in, in order.
+        encoding (str): The patch format.
+
+    Returns:
+        Optional[PatchInfo]: The verified patch, or None if the old
+            version is not available or the patch is not small enough.
+    """
+    key = patch_key(old_info.hash, new_info.hash, encoding)
+    local_path = os.path.join(PATCHES_DIR, key)
+    info_path = f"{local_path}.json"
+    try:
+        with open(info_path, encoding="utf-8") as fr:
+            data = json.load(fr)
+        if data.get("rejected"):
+            return None
+        patch = PatchInfo(**data)
+        if os.path.getsize(local_path) == patch.size:
+            return patch
+    except (OSError, ValueError):
+        pass
+
+    for commit in commits:
+        old = read_git_blob(commit, old_info.yan_obj_storage, old_info.hash)
+        if old is not None:
+            break
+    else:
+        return None
+    with open(new_info.yan_obj_storage, "rb") as fr:
+        new = fr.read()
+    if hashlib.sha256(new).hexdigest() != new_info.hash:
+        return None
+    data = make_patch(old, new, encoding)
+    os.makedirs(os.path.dirname(local_path), exist_ok=True)
+    if (
+        len(data) > len(new) * PATCH_RATIO_THRESHOLD
+        or hashlib.sha256(apply_patch(old, data, encoding)).hexdigest()
+        != new_info.hash
+    ):
+        with open(info_path, "w", encoding="utf-8") as fw:
+            json.dump({"rejected": True}, fw)
+        return None
+    tmp_path = f"{local_path}.tmp"
+    with open(tmp_path, "wb") as fw:
+        fw.write(data)
+    os.replace(tmp_path, local_path)
+    patch = PatchInfo(
+        from_hash=old_info.hash,
+        yan_obj_storage=key,
+        hash=hashlib.sha256(data).hexdigest(),
+        size=len(data),
+        encoding=encoding,
+    )
+    log.info(f"Patch {key}: {patch.size} bytes instead of {len(new)} bytes")
+    with open(info_path, "w", encoding="utf-8") as fw:
+        json.dump(patch.model_dump(), fw)
+    return patch
+
+
+def is_patchable(file_info: FileInfo) -> bool:
+    """Only mid-sized and large files get patches."""
+    return (
+        file_info.size is not None
+        and MIN_PATCH_FILE_SIZE <= file_info.size <= MAX_PATCH_FILE_SIZE
+    )
+
+
+def attach_patches(
+    old_map_json: MapJson,
+    new_map_json: MapJson,
+    encoding: str = DEFAULT_PATCH_ENCODING,
+) -> MapJson:
+    """
+    Set FileInfo.patches of files changed since old_map_json.
+
+    Unchanged files keep the patches they had in old_map_json, so
+    clients one generation behind can still use them.
+
+    Args:
+        old_map_json (MapJson): The previous generation. Previous
+            versions are read from the commits base_commits() lists.
+        new_map_json (MapJson): The map to update in place.
+        encoding (str): The patch format.
+
+    Returns:
+        MapJson: The same new_map_json instance.
+    """
+    old_patches = {
+        (file_info.yan_obj_storage, file_info.hash): file_info.patches
+        for file_info in iter_all_file_infos(old_map_json)
+    }
+    for file_info in iter_all_file_infos(new_map_json):
+        file_info.patches = list(
+            old_patches.get((file_info.yan_obj_storage, file_info.hash), [])
+        )
+    commits = base_commits(old_map_json)
+    if not commits:
+        return new_map_json
+    new_files = {
+        file_info.yan_obj_storage: file_info
+        for file_info in iter_all_file_infos(new_map_json)
+    }
+    for change in diff_map_json(old_map_json, new_map_json).changed:
+        old_info, new_info = change.old, change.new
+        if old_info is None or new_info is None:
+            continue
+        if not is_patchable(new_info):
+            continue
+        patch = ensure_patch(old_info, new_info, commits, encoding)
+        new_files[new_info.yan_obj_storage].patches = (
+            [patch] if patch is not None else []
+        )
+    return new_map_json
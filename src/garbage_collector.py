@@ -0,0 +1,341 @@
+"""
+Generational garbage collection of publish targets.
+
+Objects stay in the bucket while one of the latest generations uses them.
+The manifests of the last N generations under generations_prefix are
+loaded and every object they reference is marked, then the bucket is
+listed with paged ListObjectsV2 and every unmarked key under the manifest
+directory is deleted with DeleteObjects requests of up to 1000 keys.
+Generations older than the last N are deleted together with their
+manifests.
+
+Objects referenced by the live manifest (the one current.json points to
+and the one at manifest_key) are never deleted, and nothing is deleted if
+a live or retained manifest can not be read. Objects uploaded during the
+grace period are kept as well, they may belong to a generation which is
+being published right now.
+"""
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, List, Optional, Set
+
+from loguru import logger as log
+from pydantic import BaseModel
+
+from src.publishing import (
+    PUBLISH_STATE_DIR,
+    TargetState,
+    collect_objects,
+    create_client,
+    generation_manifest_key,
+    list_bucket,
+    referenced_keys,
+)
+from src.pydantic_models import MapJson, PublishTarget
+
+DEFAULT_KEEP_GENERATIONS = 5
+# DeleteObjects accepts up to 1000 keys per request.
+DELETE_BATCH_SIZE = 1000
+# Objects younger than this are never deleted.
+GC_GRACE_PERIOD = 24 * 60 * 60
+
+
+class GarbageCollectionAborted(RuntimeError):
+    """Raises if it is not safe to delete anything."""
+
+    def __init__(self, message="Garbage collection aborted.") -> None:
+        super().__init__(message)
+
+
+# pylint: disable=R0903
+class GcReport(BaseModel):
+    """
+    The result of garbage collection of a single target.
+
+    Attributes:
+        name (str): The name of the target.
+        dry_run (bool): True if nothing was deleted.
+        generations (List[str]): Retained generations, oldest first.
+        expired_generations (List[str]): Generations older than the
+            retained ones.
+        retained (int): The number of objects referenced by the
+            retained generations or the live manifest.
+        garbage (List[str]): Keys which are not referenced.
+        deleted (List[str]): Keys which were deleted.
+        error (Optional[str]): Why the collection was aborted.
+    """
+
+    name: str
+    dry_run: bool = False
+    generations: List[str] = []
+    expired_generations: List[str] = []
+    retained: int = 0
+    garbage: List[str] = []
+    deleted: List[str] = []
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        """True if the collection was not aborted."""
+        return self.error is None
+
+
+def delete_objects_batched(
+    client, bucket_name: str, keys: Iterable[str]
+) -> List[str]:
+    """
+    Delete objects with DeleteObjects requests of up to 1000 keys.
+
+    Returns:
+        List[str]: Keys which were deleted.
+    """
+    keys = list(keys)
+    deleted: List[str] = []
+    for start in range(0, len(keys), DELETE_BATCH_SIZE):
+        batch = keys[start : start + DELETE_BATCH_SIZE]
+        response = client.delete_objects(
+            Bucket=bucket_name,
+            Delete={"Objects": [{"Key": key} for key in batch], "Quiet": True},
+        )
+        errors = {error["Key"] for error in response.get("Errors", [])}
+        for error in response.get("Errors", []):
+            log.error(f"Unable to delete {error['Key']}: {error['Message']}")
+        deleted.extend(key for key in batch if key not in errors)
+    return deleted
+
+
+def generation_of(target: PublishTarget, key: str) -> Optional[str]:
+    """Return the generation a key belongs to, None outside of them."""
+    if not key.startswith(target.generations_prefix):
+        return None
+    rest = key[len(target.generations_prefix) :]
+    generation, separator, _ = rest.partition("/")
+    return generation if separator and generation else None
+
+
+def read_json(client, bucket_name: str, key: str) -> dict:
+    """
+    Read a JSON object from the bucket.
+
+    Raises:
+        GarbageCollectionAborted: If the object can not be read.
+    """
+    try:
+        body = client.get_object(Bucket=bucket_name, Key=key)["Body"]
+        return json.loads(body.read())
+    except Exception as error:
+        raise GarbageCollectionAborted(
+            f"unable to read {key}: {error}"
+        ) from error
+
+
+def read_manifest(client, bucket_name: str, key: str) -> MapJson:
+    """
+    Read a map.json manifest from the bucket.
+
+    Raises:
+        GarbageCollectionAborted: If the manifest can not be read.
+    """
+    try:
+        return MapJson(**read_json(client, bucket_name, key))
+    except ValueError as error:
+        raise GarbageCollectionAborted(
+            f"unable to parse {key}: {error}"
+        ) from error
+
+
+def live_manifest_keys(
+    client, target: PublishTarget, remote_keys: Set[str]
+) -> List[str]:
+    """
+    List keys of the manifests clients may be using right now.
+
+    Raises:
+        GarbageCollectionAborted: If there is no live manifest or the
+            pointer can not be read.
+    """
+    keys = []
+    if target.pointer_key is not None and target.pointer_key in remote_keys:
+        pointer = read_json(client, target.bucket_name, target.pointer_key)
+        manifest_key = pointer.get("manifest_key")
+        if not isinstance(manifest_key, str):
+            raise GarbageCollectionAborted(
+                f"{target.pointer_key} has no manifest_key"
+            )
+        keys.append(manifest_key)
+    if target.manifest_key in remote_keys:
+        keys.append(target.manifest_key)
+    if not keys:
+        raise GarbageCollectionAborted(
+            f"no live manifest found at {target.manifest_key}"
+        )
+    return keys
+
+
+def collect_target(
+    target: PublishTarget,
+    map_json: Optional[MapJson] = None,
+    keep: int = DEFAULT_KEEP_GENERATIONS,
+    dry_run: bool = False,
+    grace_period: float = GC_GRACE_PERIOD,
+    prefix: Optional[str] = None,
+    state_dir: str = PUBLISH_STATE_DIR,
+) -> GcReport:
+    """
+    Delete objects no retained generation of a target references.
+
+    Args:
+        target (PublishTarget): The target to collect.
+        map_json (Optional[MapJson]): A local map whose objects are
+            retained too, e.g. one which is not published yet.
+        keep (int): The number of latest generations to retain.
+        dry_run (bool): Only report what would be deleted.
+        grace_period (float): Objects uploaded less than this many
+            seconds ago are retained.
+        prefix (Optional[str]): Only keys under this prefix are listed
+            and can be deleted. The manifest directory by default.
+        state_dir (str): The directory with per-target publish states.
+            Deleted objects are dropped from the state, so they are
+            uploaded again if a later map references them.
+
+    Returns:
+        GcReport: Retained generations and garbage keys.
+
+    Raises:
+        GarbageCollectionAborted: If keep is less than 1, the bucket can
+            not be listed, a manifest which must be retained can not be
+            read or the garbage can not be deleted.
+    """
+    if keep < 1:
+        raise GarbageCollectionAborted("at least one generation is kept")
+    if prefix is None:
+        prefix = target.manifest_key.rpartition("/")[0]
+        prefix = f"{prefix}/" if prefix else ""
+    try:
+        client = create_client(target)
+        remote_objects = list_bucket(client, target.bucket_name, prefix)
+        if not target.generations_prefix.startswith(prefix):
+            remote_objects.update(
+                list_bucket(
+                    client, target.bucket_name, target.generations_prefix
+                )
+            )
+    except Exception as error:
+        raise GarbageCollectionAborted(
+            f"unable to list {prefix}: {error}"
+        ) from error
+    generations = sorted(
+        {
+            generation
+            for generation in (
+                generation_of(target, key) for key in remote_objects
+            )
+            if generation is not None
+        }
+    )
+    report = GcReport(
+        name=target.name,
+        dry_run=dry_run,
+        generations=generations[-keep:],
+        expired_generations=generations[:-keep],
+    )
+
+    # Mark
+    retained: Set[str] = set()
+    for generation in report.generations:
+        retained.update(
+            referenced_keys(
+                read_manifest(
+                    client,
+                    target.bucket_name,
+                    generation_manifest_key(
+                        target, generation, target.manifest_key
+                    ),
+                )
+            )
+        )
+    live: Set[str] = set()
+    live_keys = live_manifest_keys(client, target, set(remote_objects))
+    for key in live_keys:
+        live.update(
+            referenced_keys(read_manifest(client, target.bucket_name, key))
+        )
+    if not live <= retained:
+        log.warning(
+            f"[{target.name}] The live manifest is older than the retained "
+            f"generations, {len(live - retained)} more objects are kept"
+        )
+        retained |= live
+    if map_json is not None:
+        retained.update(collect_objects(map_json))
+    report.retained = len(retained)
+
+    # Sweep
+    protected = {
+        target.manifest_key,
+        target.normalized_manifest_key,
+        target.pointer_key,
+    }
+    kept_generations = set(report.generations)
+    for key in live_keys:
+        live_generation = generation_of(target, key)
+        if live_generation is not None:
+            kept_generations.add(live_generation)
+    now = time.time()
+    report.garbage = sorted(
+        key
+        for key, remote in remote_objects.items()
+        if key not in retained
+        and key not in protected
+        and generation_of(target, key) not in kept_generations
+        and (
+            remote.last_modified is None
+            or now - remote.last_modified >= grace_period
+        )
+    )
+    if dry_run:
+        for key in report.garbage:
+            log.info(f"[{target.name}] Would delete: {key}")
+    elif report.garbage:
+        try:
+            report.deleted = delete_objects_batched(
+                client, target.bucket_name, report.garbage
+            )
+        except Exception as error:
+            raise GarbageCollectionAborted(
+                f"unable to delete garbage: {error}"
+            ) from error
+        state = TargetState.for_target(target, state_dir)
+        for key in report.deleted:
+            state.objects.pop(key, None)
+        state.save()
+    log.info(
+        f"[{target.name}] generations: {len(report.generations)}, "
+        f"expired: {len(report.expired_generations)}, "
+        f"retained: {report.retained}, garbage: {len(report.garbage)}, "
+        f"deleted: {len(report.deleted)}"
+    )
+    return report
+
+
+def collect_garbage(
+    targets: Iterable[PublishTarget],
+    map_json: Optional[MapJson] = None,
+    keep: int = DEFAULT_KEEP_GENERATIONS,
+    dry_run: bool = False,
+) -> List[GcReport]:
+    """Collect garbage of every target concurrently."""
+
+    def collect(target: PublishTarget) -> GcReport:
+        try:
+            return collect_target(target, map_json, keep, dry_run)
+        except GarbageCollectionAborted as error:
+            log.error(f"[{target.name}] Nothing deleted: {error}")
+            return GcReport(
+                name=target.name, dry_run=dry_run, error=str(error)
+            )
+
+    targets = list(targets)
+    with ThreadPoolExecutor(max_workers=max(len(targets), 1)) as executor:
+        return list(executor.map(collect, targets))
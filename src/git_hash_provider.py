@@ -0,0 +1,166 @@
+"""
+Hash provider backed by the git index.
+
+The hook runs inside of the repository, and git already knows which files
+changed since a commit (it compares index stat data and only reads files
+whose stat data changed). Files under the modpacks directory which did not
+change since the commit recorded in map.json keep their hashes from
+map.json, only changed and untracked files are hashed again. Files which
+already differed from that commit when map.json was generated are listed
+in map.json as well and are hashed again too.
+"""
+import subprocess  # nosec B404
+from typing import Dict, List, Optional, Set, Tuple
+
+from loguru import logger as log
+
+from src.compression import iter_all_file_infos
+from src.pydantic_models import MapJson
+
+
+class GitUnavailable(RuntimeError):
+    """Raises if git could not answer a query."""
+
+    def __init__(self, message="Git is not available.") -> None:
+        super().__init__(message)
+
+
+def run_git(args: List[str], cwd: str = ".") -> bytes:
+    """
+    Run a git command and return its output.
+
+    Raises:
+        GitUnavailable: If git is not installed or the command failed.
+    """
+    try:
+        return subprocess.run(  # nosec B603 B607
+            ["git", *args],
+            cwd=cwd,
+            check=True,
+            capture_output=True,
+        ).stdout
+    except (OSError, subprocess.CalledProcessError) as error:
+        raise GitUnavailable(
+            f"git {' '.join(args)} failed: {error}"
+        ) from error
+
+
+def _split_paths(output: bytes) -> Set[str]:
+    return {path.decode("utf-8") for path in output.split(b"\0") if path}
+
+
+def current_commit(cwd: str = ".") -> Optional[str]:
+    """Return the commit HEAD points to, None outside of a repository."""
+    try:
+        return run_git(["rev-parse", "HEAD"], cwd).decode("ascii").strip()
+    except GitUnavailable:
+        return None
+
+
+def changed_since(commit: str, pathspec: str, cwd: str = ".") -> Set[str]:
+    """
+    List paths which may differ from the commit.
+
+    Tracked files changed in later commits, in the index or in the work
+    tree are listed, together with every untracked file (ignored ones
+    too, as the generator does not skip them).
+
+    Args:
+        commit (str): The commit to compare with.
+        pathspec (str): Only paths under it are listed.
+        cwd (str): The repository root.
+
+    Returns:
+        Set[str]: Paths relative to the repository root.
+
+    Raises:
+        GitUnavailable: If the commit is unknown or git failed.
+    """
+    changed = _split_paths(
+        run_git(
+            ["diff", "--name-only", "--no-renames", "-z", commit]
+            + ["--", pathspec],
+            cwd,
+        )
+    )
+    changed |= _split_paths(
+        run_git(["ls-files", "--others", "-z", "--", pathspec], cwd)
+    )
+    return changed
+
+
+def source_state(
+    pathspec: str, cwd: str = "."
+) -> Tuple[Optional[str], List[str]]:
+    """
+    Describe the work tree for map.json.source_commit/source_changes.
+
+    Returns:
+        Tuple[Optional[str], List[str]]: HEAD and the paths which differ
+            from it, or (None, []) if git can not tell.
+    """
+    commit = current_commit(cwd)
+    if commit is None:
+        return None, []
+    try:
+        return commit, sorted(changed_since(commit, pathspec, cwd))
+    except GitUnavailable:
+        return None, []
+
+
+class GitHashProvider:
+    """
+    Provides hashes of unchanged files from the previous map.json.
+
+    Attributes:
+        known_hashes (Dict[str, str]): Hashes from the previous map
+            keyed by object key.
+        changed (Set[str]): Paths which must be hashed again.
+        reused (int): The number of hashes which were carried over.
+    """
+
+    def __init__(self, known_hashes: Dict[str, str], changed: Set[str]):
+        self.known_hashes = known_hashes
+        self.changed = changed
+        self.reused = 0
+
+    @classmethod
+    def from_map_json(
+        cls,
+        map_json: Optional[MapJson],
+        pathspec: str,
+        cwd: str = ".",
+    ) -> Optional["GitHashProvider"]:
+        """
+        Create a provider for the map generated at map_json.source_commit.
+
+        Returns:
+            Optional[GitHashProvider]: None if the map does not record
+                a commit or git can not compare with it. Every file is
+                hashed in that case.
+        """
+        if map_json is None or not map_json.source_commit:
+            return None
+        try:
+            changed = changed_since(map_json.source_commit, pathspec, cwd)
+        except GitUnavailable as error:
+            log.warning(f"Git index is not used: {error}")
+            return None
+        changed.update(map_json.source_changes)
+        return cls(
+            {
+                file_info.yan_obj_storage: file_info.hash
+                for file_info in iter_all_file_infos(map_json)
+            },
+            changed,
+        )
+
+    def get(self, file_path: str) -> Optional[str]:
+        """Return the known hash of an unchanged file, None otherwise."""
+        key = file_path.replace("\\", "/")
+        if key in self.changed:
+            return None
+        file_hash = self.known_hashes.get(key)
+        if file_hash is not None:
+            self.reused += 1
+        return file_hash
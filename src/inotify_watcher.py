@@ -0,0 +1,178 @@
+"""
+A minimal recursive inotify watcher built on ctypes.
+
+Only Linux provides inotify. InotifyUnavailable is raised on other
+platforms, so callers can report that watch mode is not supported.
+"""
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import time
+from typing import Dict, Optional, Set
+
+from loguru import logger as log
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0x00000800
+IN_CLOEXEC = 0x00080000
+
+WATCH_MASK = (
+    IN_CLOSE_WRITE
+    | IN_CREATE
+    | IN_DELETE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+)
+EVENT_HEADER = struct.Struct("iIII")
+READ_BUFFER_SIZE = 64 * 1024
+# A burst of events is finished after this much silence.
+DEBOUNCE_SECONDS = 0.2
+# Never wait longer than this for a burst to finish.
+MAX_BATCH_SECONDS = 2.0
+
+
+class InotifyUnavailable(OSError):
+    """Raises if inotify is not supported by the platform."""
+
+    def __init__(self, message="inotify is not available.") -> None:
+        super().__init__(message)
+
+
+class QueueOverflow(RuntimeError):
+    """Raises if the kernel dropped events, a full rescan is needed."""
+
+    def __init__(self, message="inotify event queue overflow.") -> None:
+        super().__init__(message)
+
+
+def _load_libc():
+    library = ctypes.util.find_library("c")
+    if not library or not hasattr(os, "O_CLOEXEC"):
+        raise InotifyUnavailable()
+    libc = ctypes.CDLL(library, use_errno=True)
+    if not hasattr(libc, "inotify_init1"):
+        raise InotifyUnavailable()
+    return libc
+
+
+class InotifyWatcher:
+    """
+    Watch a directory tree and report changed paths.
+
+    Attributes:
+        root (str): The watched directory.
+    """
+
+    def __init__(self, root: str) -> None:
+        self.root = root
+        self._libc = _load_libc()
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise InotifyUnavailable(os.strerror(ctypes.get_errno()))
+        self._watches: Dict[int, str] = {}
+        self.add_tree(root)
+
+    def close(self) -> None:
+        """Release the inotify file descriptor."""
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+    def __enter__(self) -> "InotifyWatcher":
+        return self
+
+    def __exit__(self, *_args) -> None:
+        self.close()
+
+    def add_tree(self, directory: str) -> None:
+        """Watch a directory and all its subdirectories."""
+        for root, _directories, _files in os.walk(directory):
+            self._add_watch(root)
+
+    def _add_watch(self, directory: str) -> None:
+        wd = self._libc.inotify_add_watch(
+            self._fd, os.fsencode(directory), WATCH_MASK
+        )
+        if wd < 0:
+            log.warning(
+                f"Unable to watch {directory}: "
+                f"{os.strerror(ctypes.get_errno())}"
+            )
+            return
+        self._watches[wd] = directory
+
+    def _read_events(self, timeout: Optional[float]) -> Set[str]:
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return set()
+        try:
+            buffer = os.read(self._fd, READ_BUFFER_SIZE)
+        except BlockingIOError:
+            return set()
+        changed = set()
+        offset = 0
+        while offset < len(buffer):
+            wd, mask, _cookie, length = EVENT_HEADER.unpack_from(
+                buffer, offset
+            )
+            offset += EVENT_HEADER.size
+            name = buffer[offset : offset + length].rstrip(b"\0")
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                raise QueueOverflow()
+            directory = self._watches.get(wd)
+            if mask & IN_IGNORED:
+                self._watches.pop(wd, None)
+                continue
+            if directory is None:
+                continue
+            path = (
+                os.path.join(directory, os.fsdecode(name))
+                if name
+                else directory
+            )
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                self.add_tree(path)
+            changed.add(path)
+        return changed
+
+    def wait_for_changes(self, timeout: Optional[float] = None) -> Set[str]:
+        """
+        Block until a burst of events has finished.
+
+        Args:
+            timeout (Optional[float]): How long to wait for the first
+                event. None waits forever.
+
+        Returns:
+            Set[str]: Paths which were created, written, moved or
+                deleted. Empty if the timeout expired.
+
+        Raises:
+            QueueOverflow: If events were lost.
+        """
+        changed = self._read_events(timeout)
+        if not changed:
+            return changed
+        deadline = time.monotonic() + MAX_BATCH_SECONDS
+        while time.monotonic() < deadline:
+            more = self._read_events(DEBOUNCE_SECONDS)
+            if not more:
+                break
+            changed |= more
+        return changed
@@ -0,0 +1,452 @@
+"""
+SQLite store of map.json generations.
+
+Every generation written by the hook is recorded together with its files
+(indexed by object key and by hash) and the changes since the previous
+generation, so questions like "which modpacks hold this content" or
+"what changed recently" are answered with index lookups instead of scanning
+map.json files. The store also keeps the hashes of local files keyed by
+size and mtime, and serves as a hash provider when git can not tell which
+files changed.
+
+The store lives in data/ and is local to a clone: the committed map.json
+stays the base the next generation is compared with.
+
+Usage:
+    python -m src.manifest_store export map.json [--generation ID]
+    python -m src.manifest_store find <hash> [--last N]
+    python -m src.manifest_store changes [--last N]
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import time
+from typing import Iterable, List, Optional
+
+from loguru import logger as log
+from pydantic import BaseModel
+
+from src.map_diff import ChangeSet, index_modpack
+from src.pydantic_models import FileInfo, MapJson
+
+MANIFEST_STORE_PATH = os.path.join("data", "manifest.sqlite3")
+# Older generations are dropped from the store.
+MAX_STORED_GENERATIONS = 50
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS generations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at TEXT NOT NULL,
+    source_commit TEXT,
+    manifest_hash TEXT NOT NULL,
+    map_json TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS files (
+    generation_id INTEGER NOT NULL,
+    modpack TEXT NOT NULL,
+    file_group TEXT NOT NULL,
+    dist_file_path TEXT NOT NULL,
+    yan_obj_storage TEXT NOT NULL,
+    hash TEXT NOT NULL,
+    size INTEGER,
+    pack_key TEXT,
+    PRIMARY KEY (generation_id, modpack, file_group, dist_file_path)
+);
+CREATE INDEX IF NOT EXISTS files_by_hash ON files (hash);
+CREATE INDEX IF NOT EXISTS files_by_key ON files (yan_obj_storage);
+CREATE TABLE IF NOT EXISTS changes (
+    generation_id INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    modpack TEXT NOT NULL,
+    file_group TEXT NOT NULL,
+    dist_file_path TEXT NOT NULL,
+    old_hash TEXT,
+    new_hash TEXT
+);
+CREATE INDEX IF NOT EXISTS changes_by_generation ON changes (generation_id);
+CREATE TABLE IF NOT EXISTS stats (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    hash TEXT NOT NULL
+);
+"""
+
+
+class GenerationNotFound(LookupError):
+    """Raises if the store does not hold the requested generation."""
+
+    def __init__(self, message="Generation is not in the store.") -> None:
+        super().__init__(message)
+
+
+# pylint: disable=R0903
+class StoredChange(BaseModel):
+    """
+    A file change recorded for a generation.
+
+    Attributes:
+        generation_id (int): The generation which made the change.
+        created_at (str): When the generation was recorded (UTC).
+        kind (str): "added", "removed", "changed" or "moved".
+        modpack (str): The name of the modpack.
+        group (str): "main_data" or "client_additional_data/<name>".
+        dist_file_path (str): The dist path with forward slashes, the new
+            one for moved files.
+        old_hash (Optional[str]): The hash before the change.
+        new_hash (Optional[str]): The hash after the change.
+    """
+
+    generation_id: int
+    created_at: str
+    kind: str
+    modpack: str
+    group: str
+    dist_file_path: str
+    old_hash: Optional[str] = None
+    new_hash: Optional[str] = None
+
+
+class StoredFile(BaseModel):
+    """
+    A file of a recorded generation.
+
+    Attributes:
+        generation_id (int): The generation holding the file.
+        modpack (str): The name of the modpack.
+        group (str): "main_data" or "client_additional_data/<name>".
+        dist_file_path (str): The dist path with forward slashes.
+        yan_obj_storage (str): The object key of the file.
+        pack_key (Optional[str]): The key of the pack holding the file,
+            None for files which are not packed.
+    """
+
+    generation_id: int
+    modpack: str
+    group: str
+    dist_file_path: str
+    yan_obj_storage: str
+    pack_key: Optional[str] = None
+
+
+def manifest_hash(map_json: MapJson) -> str:
+    """Return the sha256 hash of the map as written to map.json."""
+    return hashlib.sha256(
+        json.dumps(map_json.model_dump(mode="json")).encode("utf-8")
+    ).hexdigest()
+
+
+class ManifestStore:
+    """
+    Generations, files and local file hashes in one SQLite database.
+
+    Attributes:
+        db_path (str): The path to the database file.
+        reused (int): The number of hashes served from the stats table.
+    """
+
+    def __init__(self, db_path: str = MANIFEST_STORE_PATH) -> None:
+        self.db_path = db_path
+        self.reused = 0
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._db = sqlite3.connect(db_path)
+        self._db.executescript(SCHEMA)
+
+    def close(self) -> None:
+        """Close the database."""
+        self._db.close()
+
+    def __enter__(self) -> "ManifestStore":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    @staticmethod
+    def _normalize(file_path: str) -> str:
+        return str(file_path).replace("\\", "/")
+
+    def get(self, file_path: str) -> Optional[str]:
+        """
+        Return the stored hash of a file which kept its size and mtime.
+
+        This makes the store a hash provider for hash_file().
+        """
+        row = self._db.execute(
+            "SELECT size, mtime_ns, hash FROM stats WHERE path = ?",
+            (self._normalize(file_path),),
+        ).fetchone()
+        if row is None:
+            return None
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+        if (row[0], row[1]) != (stat.st_size, stat.st_mtime_ns):
+            return None
+        self.reused += 1
+        return row[2]
+
+    def update_stats(self, file_infos: Iterable[FileInfo]) -> None:
+        """Remember hashes of the local files the map was made from."""
+        rows = []
+        for file_info in file_infos:
+            try:
+                stat = os.stat(file_info.yan_obj_storage)
+            except OSError:
+                continue
+            rows.append(
+                (
+                    self._normalize(file_info.yan_obj_storage),
+                    stat.st_size,
+                    stat.st_mtime_ns,
+                    file_info.hash,
+                )
+            )
+        with self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO stats VALUES (?, ?, ?, ?)", rows
+            )
+
+    def record_generation(
+        self,
+        map_json: MapJson,
+        changes: Optional[ChangeSet] = None,
+        keep: int = MAX_STORED_GENERATIONS,
+    ) -> int:
+        """
+        Record a generation with its files and changes.
+
+        Args:
+            map_json (MapJson): The map of the generation.
+            changes (Optional[ChangeSet]): Changes since the previous
+                generation.
+            keep (int): The number of latest generations to keep.
+
+        Returns:
+            int: The id of the new generation.
+        """
+        with self._db:
+            cursor = self._db.execute(
+                "INSERT INTO generations"
+                " (created_at, source_commit, manifest_hash, map_json)"
+                " VALUES (?, ?, ?, ?)",
+                (
+                    time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                    map_json.source_commit,
+                    manifest_hash(map_json),
+                    json.dumps(map_json.model_dump(mode="json")),
+                ),
+            )
+            if cursor.lastrowid is None:
+                raise sqlite3.DatabaseError("The generation was not inserted")
+            generation_id = cursor.lastrowid
+            self._db.executemany(
+                "INSERT INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    (
+                        generation_id,
+                        name,
+                        group,
+                        dist_file_path,
+                        file_info.yan_obj_storage,
+                        file_info.hash,
+                        file_info.size,
+                        (
+                            file_info.pack.yan_obj_storage
+                            if file_info.pack is not None
+                            else None
+                        ),
+                    )
+                    for name, modpack in map_json.modpacks.items()
+                    for (group, dist_file_path), file_info in index_modpack(
+                        modpack
+                    ).items()
+                ),
+            )
+            if changes is not None:
+                self._db.executemany(
+                    "INSERT INTO changes VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    _change_rows(generation_id, changes),
+                )
+            self._prune(keep)
+        return generation_id
+
+    def _prune(self, keep: int) -> None:
+        stale = [
+            row[0]
+            for row in self._db.execute(
+                "SELECT id FROM generations ORDER BY id DESC LIMIT -1"
+                " OFFSET ?",
+                (keep,),
+            )
+        ]
+        for table, column in (
+            ("files", "generation_id"),
+            ("changes", "generation_id"),
+            ("generations", "id"),
+        ):
+            self._db.executemany(
+                f"DELETE FROM {table} WHERE {column} = ?",  # nosec B608
+                ((generation_id,) for generation_id in stale),
+            )
+        if stale:
+            log.debug(f"Dropped {len(stale)} generations from the store")
+
+    def latest_generation(self) -> Optional[int]:
+        """Return the id of the latest generation, None if empty."""
+        row = self._db.execute("SELECT MAX(id) FROM generations").fetchone()
+        return row[0]
+
+    def load_map_json(self, generation_id: Optional[int] = None) -> MapJson:
+        """
+        Load the map of a generation, the latest one by default.
+
+        Raises:
+            GenerationNotFound: If the store does not hold it.
+        """
+        if generation_id is None:
+            generation_id = self.latest_generation()
+        row = self._db.execute(
+            "SELECT map_json FROM generations WHERE id = ?", (generation_id,)
+        ).fetchone()
+        if row is None:
+            raise GenerationNotFound(f"Generation {generation_id} not found")
+        return MapJson(**json.loads(row[0]))
+
+    def export_map_json(
+        self, map_json_path: str, generation_id: Optional[int] = None
+    ) -> None:
+        """Write the map of a generation to map_json_path atomically."""
+        map_json = self.load_map_json(generation_id)
+        tmp_path = f"{map_json_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as fw:
+            json.dump(map_json.model_dump(mode="json"), fw)
+        os.replace(tmp_path, map_json_path)
+
+    def modpacks_containing(
+        self, file_hash: str, generations: int = 1
+    ) -> List[StoredFile]:
+        """Return files with the content in the last generations."""
+        return [
+            StoredFile(
+                generation_id=row[0],
+                modpack=row[1],
+                group=row[2],
+                dist_file_path=row[3],
+                yan_obj_storage=row[4],
+                pack_key=row[5],
+            )
+            for row in self._db.execute(
+                "SELECT generation_id, modpack, file_group, dist_file_path,"
+                " yan_obj_storage, pack_key FROM files"
+                " WHERE hash = ? AND generation_id IN"
+                " (SELECT id FROM generations ORDER BY id DESC LIMIT ?)"
+                " ORDER BY generation_id DESC, modpack, file_group,"
+                " dist_file_path",
+                (file_hash, generations),
+            )
+        ]
+
+    def recent_changes(self, generations: int = 1) -> List[StoredChange]:
+        """Return file changes of the last generations, newest first."""
+        return [
+            StoredChange(
+                generation_id=row[0],
+                created_at=row[1],
+                kind=row[2],
+                modpack=row[3],
+                group=row[4],
+                dist_file_path=row[5],
+                old_hash=row[6],
+                new_hash=row[7],
+            )
+            for row in self._db.execute(
+                "SELECT c.generation_id, g.created_at, c.kind, c.modpack,"
+                " c.file_group, c.dist_file_path, c.old_hash, c.new_hash"
+                " FROM changes c JOIN generations g"
+                " ON g.id = c.generation_id"
+                " WHERE c.generation_id IN"
+                " (SELECT id FROM generations ORDER BY id DESC LIMIT ?)"
+                " ORDER BY c.generation_id DESC, c.rowid",
+                (generations,),
+            )
+        ]
+
+
+def _change_rows(generation_id: int, changes: ChangeSet) -> List[tuple]:
+    rows = []
+    for kind, file_changes in (
+        ("added", changes.added),
+        ("removed", changes.removed),
+        ("changed", changes.changed),
+    ):
+        for change in file_changes:
+            rows.append(
+                (
+                    generation_id,
+                    kind,
+                    change.modpack,
+                    change.group,
+                    change.dist_file_path,
+                    change.old.hash if change.old is not None else None,
+                    change.new.hash if change.new is not None else None,
+                )
+            )
+    for move in changes.moved:
+        rows.append(
+            (
+                generation_id,
+                "moved",
+                move.modpack,
+                move.new_group,
+                move.new_path,
+                move.old.hash,
+                move.new.hash,
+            )
+        )
+    return rows
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Query the manifest store."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--db", default=MANIFEST_STORE_PATH)
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export")
+    export_parser.add_argument("map_json")
+    export_parser.add_argument("--generation", type=int)
+    find_parser = commands.add_parser("find")
+    find_parser.add_argument("hash")
+    find_parser.add_argument("--last", type=int, default=1)
+    changes_parser = commands.add_parser("changes")
+    changes_parser.add_argument("--last", type=int, default=1)
+    args = parser.parse_args(argv)
+    with ManifestStore(args.db) as store:
+        if args.command == "export":
+            store.export_map_json(args.map_json, args.generation)
+        elif args.command == "find":
+            for stored in store.modpacks_containing(args.hash, args.last):
+                sys.stdout.write(
+                    f"{stored.generation_id} {stored.modpack}: "
+                    f"{stored.group}/{stored.dist_file_path}"
+                    + (f" (in {stored.pack_key})" if stored.pack_key else "")
+                    + "\n"
+                )
+        else:
+            for change in store.recent_changes(args.last):
+                sys.stdout.write(
+                    f"{change.generation_id} {change.created_at} "
+                    f"{change.kind} {change.modpack}: "
+                    f"{change.group}/{change.dist_file_path}\n"
+                )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,336 @@
+"""
+Structural diff of two map.json generations.
+
+Both maps are indexed by (modpack, group, dist_file_path), so a diff takes
+linear time. The result is a typed change set: added, removed, content
+changed and moved files, metadata-only changes (urls, compressed variants,
+pack offsets), server_config changes including the server icon, and
+changed bundles or packs. ChangeSet.changelog() renders it as text that
+fits into a commit message.
+
+Usage:
+    python -m src.map_diff old_map.json new_map.json
+"""
+import argparse
+import json
+import sys
+from typing import Dict, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+from src.pydantic_models import FileInfo, MapJson, Modpack
+
+MAIN_DATA_GROUP = "main_data"
+ADDITIONAL_DATA_GROUP = "client_additional_data/"
+
+FileIndex = Dict[Tuple[str, str], FileInfo]
+
+
+# pylint: disable=R0903
+class FileChange(BaseModel):
+    """
+    A change of a single file entry.
+
+    Attributes:
+        modpack (str): The name of the modpack.
+        group (str): "main_data" or "client_additional_data/<name>".
+        dist_file_path (str): The dist path with forward slashes.
+        old (Optional[FileInfo]): The entry in the old map.
+        new (Optional[FileInfo]): The entry in the new map.
+    """
+
+    modpack: str
+    group: str
+    dist_file_path: str
+    old: Optional[FileInfo] = None
+    new: Optional[FileInfo] = None
+
+
+class FileMove(BaseModel):
+    """
+    A file whose content moved to another dist path or group.
+
+    Attributes:
+        modpack (str): The name of the modpack.
+        old_group (str): The group in the old map.
+        old_path (str): The dist path in the old map.
+        new_group (str): The group in the new map.
+        new_path (str): The dist path in the new map.
+        old (FileInfo): The entry in the old map.
+        new (FileInfo): The entry in the new map.
+    """
+
+    modpack: str
+    old_group: str
+    old_path: str
+    new_group: str
+    new_path: str
+    old: FileInfo
+    new: FileInfo
+
+
+class ConfigChange(BaseModel):
+    """
+    Changed server_config fields of a modpack.
+
+    Attributes:
+        modpack (str): The name of the modpack.
+        fields (Dict[str, Tuple[str, str]]): Old and new values keyed by
+            field name. The server icon is compared by hash.
+    """
+
+    modpack: str
+    fields: Dict[str, Tuple[str, str]]
+
+
+class ChangeSet(BaseModel):
+    """
+    Everything that differs between two maps.
+
+    Attributes:
+        modpacks_added (List[str]): Modpacks only in the new map.
+        modpacks_removed (List[str]): Modpacks only in the old map.
+        added (List[FileChange]): New files.
+        removed (List[FileChange]): Deleted files.
+        changed (List[FileChange]): Files whose hash changed.
+        moved (List[FileMove]): Files moved within a modpack.
+        metadata_changed (List[FileChange]): Files with the same hash
+            whose other fields changed.
+        config_changed (List[ConfigChange]): server_config changes.
+        artifacts_changed (List[str]): Modpacks whose bundles or
+            packs changed.
+    """
+
+    modpacks_added: List[str] = []
+    modpacks_removed: List[str] = []
+    added: List[FileChange] = []
+    removed: List[FileChange] = []
+    changed: List[FileChange] = []
+    moved: List[FileMove] = []
+    metadata_changed: List[FileChange] = []
+    config_changed: List[ConfigChange] = []
+    artifacts_changed: List[str] = []
+
+    @property
+    def empty(self) -> bool:
+        """True if both maps describe the same content."""
+        return not any(
+            (
+                self.modpacks_added,
+                self.modpacks_removed,
+                self.added,
+                self.removed,
+                self.changed,
+                self.moved,
+                self.metadata_changed,
+                self.config_changed,
+                self.artifacts_changed,
+            )
+        )
+
+    def changelog(self) -> str:
+        """Render the change set as a short text, one line per change."""
+        lines = []
+        for name in self.modpacks_added:
+            lines.append(f"Added modpack {name}")
+        for name in self.modpacks_removed:
+            lines.append(f"Removed modpack {name}")
+        for config in self.config_changed:
+            for field, (old, new) in sorted(config.fields.items()):
+                lines.append(f"{config.modpack}: {field}: {old} -> {new}")
+        for prefix, changes in (
+            ("+", self.added),
+            ("-", self.removed),
+            ("~", self.changed),
+        ):
+            for change in changes:
+                lines.append(
+                    f"{change.modpack}: {prefix} "
+                    f"{change.group}/{change.dist_file_path}"
+                )
+        for move in self.moved:
+            lines.append(
+                f"{move.modpack}: > {move.old_group}/{move.old_path} -> "
+                f"{move.new_group}/{move.new_path}"
+            )
+        if self.metadata_changed:
+            lines.append(
+                f"Metadata updated for {len(self.metadata_changed)} files"
+            )
+        for name in self.artifacts_changed:
+            lines.append(f"{name}: bundles or packs rebuilt")
+        return "\n".join(lines)
+
+
+def normalize_dist_path(dist_file_path: str) -> str:
+    """Return the dist path with forward slashes."""
+    return dist_file_path.replace("\\", "/")
+
+
+def index_modpack(modpack: Modpack) -> FileIndex:
+    """Index files of a modpack by (group, dist_file_path)."""
+    index: FileIndex = {}
+    for file_info in modpack.main_data:
+        index[
+            (MAIN_DATA_GROUP, normalize_dist_path(file_info.dist_file_path))
+        ] = file_info
+    for group, file_infos in modpack.client_additional_data.items():
+        for file_info in file_infos:
+            index[
+                (
+                    ADDITIONAL_DATA_GROUP + group,
+                    normalize_dist_path(file_info.dist_file_path),
+                )
+            ] = file_info
+    return index
+
+
+def diff_server_config(
+    name: str, old: Modpack, new: Modpack
+) -> Optional[ConfigChange]:
+    """Compare server configs, the icon is compared by hash."""
+    old_config = old.server_config.model_dump(exclude={"server_icon"})
+    new_config = new.server_config.model_dump(exclude={"server_icon"})
+    fields = {
+        field: (str(old_config.get(field)), str(value))
+        for field, value in new_config.items()
+        if old_config.get(field) != value
+    }
+    old_icon = old.server_config.server_icon
+    new_icon = new.server_config.server_icon
+    if old_icon.hash != new_icon.hash:
+        fields["server_icon"] = (old_icon.hash[:12], new_icon.hash[:12])
+    elif old_icon != new_icon:
+        fields["server_icon"] = (old_icon.hash[:12], "metadata updated")
+    return ConfigChange(modpack=name, fields=fields) if fields else None
+
+
+def _diff_files(
+    name: str, old_index: FileIndex, new_index: FileIndex, changes: ChangeSet
+) -> None:
+    removed: Dict[Tuple[str, str], FileInfo] = {}
+    for key, old_info in old_index.items():
+        new_info = new_index.get(key)
+        if new_info is None:
+            removed[key] = old_info
+        elif new_info.hash != old_info.hash:
+            changes.changed.append(
+                FileChange(
+                    modpack=name,
+                    group=key[0],
+                    dist_file_path=key[1],
+                    old=old_info,
+                    new=new_info,
+                )
+            )
+        elif new_info != old_info:
+            changes.metadata_changed.append(
+                FileChange(
+                    modpack=name,
+                    group=key[0],
+                    dist_file_path=key[1],
+                    old=old_info,
+                    new=new_info,
+                )
+            )
+
+    removed_by_hash: Dict[str, List[Tuple[str, str]]] = {}
+    for key, old_info in removed.items():
+        removed_by_hash.setdefault(old_info.hash, []).append(key)
+    for key, new_info in new_index.items():
+        if key in old_index:
+            continue
+        sources = removed_by_hash.get(new_info.hash)
+        if sources:
+            old_key = sources.pop()
+            del removed[old_key]
+            changes.moved.append(
+                FileMove(
+                    modpack=name,
+                    old_group=old_key[0],
+                    old_path=old_key[1],
+                    new_group=key[0],
+                    new_path=key[1],
+                    old=old_index[old_key],
+                    new=new_info,
+                )
+            )
+            continue
+        changes.added.append(
+            FileChange(
+                modpack=name, group=key[0], dist_file_path=key[1], new=new_info
+            )
+        )
+    for key, old_info in removed.items():
+        changes.removed.append(
+            FileChange(
+                modpack=name, group=key[0], dist_file_path=key[1], old=old_info
+            )
+        )
+
+
+def diff_map_json(old: MapJson, new: MapJson) -> ChangeSet:
+    """
+    Compute the change set between two maps.
+
+    source_commit and source_changes are not compared, they describe
+    where a map came from rather than what it holds. Files of added and
+    removed modpacks are listed as added and removed as well, so the
+    change set is enough to decide what to upload.
+
+    Args:
+        old (MapJson): The previous generation.
+        new (MapJson): The current generation.
+
+    Returns:
+        ChangeSet: The changes, empty if the maps hold the same content.
+    """
+    changes = ChangeSet()
+    empty_index: FileIndex = {}
+    for name in sorted(old.modpacks.keys() | new.modpacks.keys()):
+        old_modpack = old.modpacks.get(name)
+        new_modpack = new.modpacks.get(name)
+        old_index = empty_index
+        new_index = empty_index
+        if old_modpack is not None:
+            old_index = index_modpack(old_modpack)
+        if new_modpack is not None:
+            new_index = index_modpack(new_modpack)
+        _diff_files(name, old_index, new_index, changes)
+        if old_modpack is None:
+            changes.modpacks_added.append(name)
+        elif new_modpack is None:
+            changes.modpacks_removed.append(name)
+        else:
+            config_change = diff_server_config(name, old_modpack, new_modpack)
+            if config_change is not None:
+                changes.config_changed.append(config_change)
+            if (
+                old_modpack.bundles != new_modpack.bundles
+                or old_modpack.packs != new_modpack.packs
+            ):
+                changes.artifacts_changed.append(name)
+    return changes
+
+
+def read_map_json(path: str) -> MapJson:
+    """Read a map.json file."""
+    with open(path, encoding="utf-8") as fr:
+        return MapJson(**json.load(fr))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Print the changelog between two map.json files."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("old_map_json")
+    parser.add_argument("new_map_json")
+    args = parser.parse_args(argv)
+    changes = diff_map_json(
+        read_map_json(args.old_map_json), read_map_json(args.new_map_json)
+    )
+    sys.stdout.write(f"{changes.changelog() or 'No changes'}\n")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,207 @@
+"""
+Pack objects for small files.
+
+Files below PACK_SIZE_THRESHOLD are concatenated into shared pack objects
+and every FileInfo records its (pack key, offset, length). Clients fetch
+many small files with one ranged GET instead of a request per file.
+
+A file always goes into the same pack bucket, chosen by a hash of its
+object key, and pack keys are named after a digest of their members. An
+update changes only the packs whose members changed, the other packs keep
+their keys and are not uploaded again.
+"""
+import hashlib
+import json
+import os
+from typing import Dict, List
+
+from loguru import logger as log
+
+from src.pydantic_models import (
+    FileInfo,
+    MapJson,
+    Modpack,
+    PackInfo,
+    PackRef,
+)
+
+PACKS_DIR = os.path.join("data", "packs")
+PACK_SIZE_THRESHOLD = 64 * 1024
+PACK_BUCKETS = 16
+
+
+def pack_bucket(object_key: str, buckets: int = PACK_BUCKETS) -> int:
+    """Return the pack bucket of a file, stable across generations."""
+    digest = hashlib.sha256(object_key.encode("utf-8")).digest()
+    return int.from_bytes(digest[:4], "big") % buckets
+
+
+def pack_key(modpack_name: str, bucket: int, members: List[FileInfo]):
+    """Return the object key of a pack named after its members."""
+    hasher = hashlib.sha256()
+    for file_info in members:
+        hasher.update(
+            f"{file_info.yan_obj_storage}\0{file_info.hash}\n".encode("utf-8")
+        )
+    return (
+        f"modpacks/{modpack_name}/packs/"
+        f"{bucket:02x}-{hasher.hexdigest()[:16]}.pack"
+    )
+
+
+def pack_local_path(pack: PackInfo) -> str:
+    """Return the local path where the pack object is kept."""
+    return os.path.join(PACKS_DIR, pack.yan_obj_storage)
+
+
+def is_packable(file_info: FileInfo, threshold: int) -> bool:
+    """Only files with a known size below the threshold are packed."""
+    return file_info.size is not None and file_info.size < threshold
+
+
+def build_pack(members: List[FileInfo], output_path: str) -> PackInfo:
+    """
+    Write the members one after another into a pack file.
+
+    Args:
+        members (List[FileInfo]): Files in pack order.
+        output_path (str): Where the pack is written.
+
+    Returns:
+        PackInfo: The pack, yan_obj_storage is not set yet.
+
+    Raises:
+        OSError: If a member can not be read or its size changed.
+    """
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    hasher = hashlib.sha256()
+    size = 0
+    tmp_path = f"{output_path}.tmp"
+    try:
+        with open(tmp_path, "wb") as fw:
+            for file_info in members:
+                with open(file_info.yan_obj_storage, "rb") as fr:
+                    data = fr.read()
+                if len(data) != file_info.size:
+                    raise OSError(
+                        f"{file_info.yan_obj_storage} changed while packing"
+                    )
+                hasher.update(data)
+                fw.write(data)
+                size += len(data)
+    except OSError:
+        os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, output_path)
+    return PackInfo(yan_obj_storage="", hash=hasher.hexdigest(), size=size)
+
+
+def ensure_pack(key: str, members: List[FileInfo]) -> PackInfo:
+    """
+    Return a pack, building it only if it does not exist locally.
+
+    A sidecar JSON file next to the pack keeps its hash and size.
+    """
+    local_path = os.path.join(PACKS_DIR, key)
+    info_path = f"{local_path}.json"
+    try:
+        with open(info_path, encoding="utf-8") as fr:
+            pack = PackInfo(**json.load(fr))
+        if os.path.getsize(local_path) == pack.size:
+            return pack
+    except (OSError, ValueError):
+        pass
+    log.info(f"Building pack: {key}")
+    pack = build_pack(members, local_path)
+    pack.yan_obj_storage = key
+    with open(info_path, "w", encoding="utf-8") as fw:
+        json.dump(pack.model_dump(), fw)
+    return pack
+
+
+def remove_stale_packs(map_json: MapJson) -> None:
+    """Delete local packs the map does not reference."""
+    referenced = {
+        os.path.normpath(pack_local_path(pack))
+        for modpack in map_json.modpacks.values()
+        for pack in modpack.packs
+    }
+    for root, _directories, files in os.walk(PACKS_DIR):
+        for file_name in files:
+            path = os.path.join(root, file_name)
+            if os.path.normpath(path.removesuffix(".json")) not in referenced:
+                os.remove(path)
+
+
+def modpack_files(modpack: Modpack) -> List[FileInfo]:
+    """Return the files of main_data and all client_additional_data."""
+    file_infos = list(modpack.main_data)
+    for group_files in modpack.client_additional_data.values():
+        file_infos.extend(group_files)
+    return file_infos
+
+
+def pack_refs(pack: PackInfo, members: List[FileInfo]) -> Dict[str, PackRef]:
+    """Return the ranges of the members in pack order, by object key."""
+    refs = {}
+    offset = 0
+    for file_info in members:
+        if file_info.size is None:  # never packed, see is_packable
+            continue
+        refs[file_info.yan_obj_storage] = PackRef(
+            yan_obj_storage=pack.yan_obj_storage,
+            offset=offset,
+            length=file_info.size,
+        )
+        offset += file_info.size
+    return refs
+
+
+def attach_packs(
+    map_json: MapJson,
+    threshold: int = PACK_SIZE_THRESHOLD,
+    buckets: int = PACK_BUCKETS,
+) -> MapJson:
+    """
+    Pack small files of every modpack and set their `pack` fields.
+
+    Files of main_data and of all client_additional_data groups are
+    packed. The server icon is not. If a pack can not be built, its files
+    are left unpacked and downloaded one by one.
+
+    Args:
+        map_json (MapJson): The map to update in place.
+        threshold (int): Files smaller than this are packed.
+        buckets (int): The number of packs per modpack.
+
+    Returns:
+        MapJson: The same map instance.
+    """
+    for modpack_name, modpack in map_json.modpacks.items():
+        members: Dict[int, Dict[str, FileInfo]] = {}
+        file_infos = modpack_files(modpack)
+        for file_info in file_infos:
+            file_info.pack = None
+            if is_packable(file_info, threshold):
+                members.setdefault(
+                    pack_bucket(file_info.yan_obj_storage, buckets), {}
+                )[file_info.yan_obj_storage] = file_info
+
+        packs = []
+        refs: Dict[str, PackRef] = {}
+        for bucket, bucket_files in sorted(members.items()):
+            ordered = [bucket_files[key] for key in sorted(bucket_files)]
+            try:
+                pack = ensure_pack(
+                    pack_key(modpack_name, bucket, ordered), ordered
+                )
+            except OSError as error:
+                log.warning(f"Skipping a pack of {modpack_name}: {error}")
+                continue
+            packs.append(pack)
+            refs.update(pack_refs(pack, ordered))
+        for file_info in file_infos:
+            file_info.pack = refs.get(file_info.yan_obj_storage)
+        modpack.packs = packs
+    remove_stale_packs(map_json)
+    return map_json
@@ -0,0 +1,599 @@
+"""
+Concurrent publishing of modpacks to several object storage targets.
+
+The map is generated and hashed once. Every target then uploads the
+objects it does not have yet with its own worker pool, tracking what it
+holds in its own state file. The state is checked against a bucket
+listing before it is trusted, as another clone may have collected the
+objects since. A target's manifest is uploaded only after
+every object it references was uploaded, so no target ever serves
+a manifest pointing to missing objects.
+
+Manifests are published as a generation: immutable copies under
+generations/<generation>/ are uploaded first, then the small pointer
+current.json is swapped to the new generation, and only then map.json is
+overwritten for older clients. Files and their compressed variants are
+stored under content-addressed keys (objects/<ff>/<sha256>), which the
+published manifests reference instead of repository paths, so uploading
+a generation never overwrites an object a previous generation uses.
+Objects are cached for a year and manifests expire after a minute.
+"""
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import boto3
+from loguru import logger as log
+from pydantic import BaseModel
+
+from src.blob_table import normalize_map_json
+from src.bundles import bundle_local_path
+from src.compression import iter_all_file_infos, variant_local_path
+from src.delta_patches import patch_local_path
+from src.packing import pack_local_path
+from src.pydantic_models import MapJson, PublishTarget
+
+PUBLISH_STATE_DIR = os.path.join("data", "publish_state")
+PUBLISH_TARGETS_PATH = "publish_targets.json"
+SHA256_METADATA_KEY = "sha256"
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+MANIFEST_CACHE_CONTROL = "public, max-age=60"
+CONTENT_KEY_PREFIX = "modpacks/objects/"
+
+
+class PublishFailed(RuntimeError):
+    """Raises if publishing to a target failed."""
+
+    def __init__(self, message="Publishing failed.") -> None:
+        super().__init__(message)
+
+
+# pylint: disable=R0903
+class PublishObject(BaseModel):
+    """
+    A single object which has to exist in a bucket.
+
+    Attributes:
+        key (str): The object key.
+        hash (str): The sha256 hash of the object.
+        local_path (str): The local file with the object content.
+        size (Optional[int]): The size of the object in bytes.
+    """
+
+    key: str
+    hash: str
+    local_path: str
+    size: Optional[int] = None
+
+
+class TargetReport(BaseModel):
+    """
+    The result of publishing to a single target.
+
+    Attributes:
+        name (str): The name of the target.
+        uploaded (List[str]): Keys of uploaded objects.
+        skipped (int): The number of objects the target already had.
+        failed (Dict[str, str]): Failed object keys with error messages.
+        manifest_published (bool): True if the manifest was uploaded.
+        generation (Optional[str]): The published generation.
+    """
+
+    name: str
+    uploaded: List[str] = []
+    skipped: int = 0
+    failed: Dict[str, str] = {}
+    manifest_published: bool = False
+    generation: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        """True if the target is fully up to date."""
+        return not self.failed
+
+
+class RemoteObject(BaseModel):
+    """
+    An object from the bucket listing.
+
+    Attributes:
+        size (int): The size of the object in bytes.
+        etag (str): The ETag without quotes.
+        last_modified (Optional[float]): The upload time as a unix
+            timestamp.
+    """
+
+    size: int
+    etag: str
+    last_modified: Optional[float] = None
+
+
+def content_key(file_hash: str) -> str:
+    """Return the object key of a file or variant named after its hash."""
+    return f"{CONTENT_KEY_PREFIX}{file_hash[:2]}/{file_hash}"
+
+
+def content_addressed(map_json: MapJson) -> MapJson:
+    """
+    Return a copy of the map referencing files and compressed variants
+    by their content keys, as the published manifests do.
+    """
+    map_json = map_json.model_copy(deep=True)
+    for file_info in iter_all_file_infos(map_json):
+        file_info.yan_obj_storage = content_key(file_info.hash)
+        if file_info.compressed is not None:
+            file_info.compressed.yan_obj_storage = content_key(
+                file_info.compressed.hash
+            )
+    return map_json
+
+
+def collect_objects(map_json: MapJson) -> Dict[str, PublishObject]:
+    """
+    Collect every object referenced by the map, including compressed
+    variants, patches, bundles and packs.
+
+    Files and compressed variants are keyed by content_key(), their
+    content is read from the paths of the map.
+
+    Args:
+        map_json (MapJson): The map to publish.
+
+    Returns:
+        Dict[str, PublishObject]: Objects keyed by object key.
+    """
+    objects = {}
+    for file_info in iter_all_file_infos(map_json):
+        key = content_key(file_info.hash)
+        objects[key] = PublishObject(
+            key=key,
+            hash=file_info.hash,
+            local_path=file_info.yan_obj_storage,
+            size=file_info.size,
+        )
+        if file_info.compressed is not None:
+            variant = file_info.compressed
+            key = content_key(variant.hash)
+            objects[key] = PublishObject(
+                key=key,
+                hash=variant.hash,
+                local_path=variant_local_path(variant),
+                size=variant.size,
+            )
+        for patch in file_info.patches:
+            objects[patch.yan_obj_storage] = PublishObject(
+                key=patch.yan_obj_storage,
+                hash=patch.hash,
+                local_path=patch_local_path(patch),
+                size=patch.size,
+            )
+    for modpack in map_json.modpacks.values():
+        for bundle in modpack.bundles.values():
+            objects[bundle.yan_obj_storage] = PublishObject(
+                key=bundle.yan_obj_storage,
+                hash=bundle.hash,
+                local_path=bundle_local_path(bundle),
+                size=bundle.size,
+            )
+        for pack in modpack.packs:
+            objects[pack.yan_obj_storage] = PublishObject(
+                key=pack.yan_obj_storage,
+                hash=pack.hash,
+                local_path=pack_local_path(pack),
+                size=pack.size,
+            )
+    return objects
+
+
+def referenced_keys(manifest: MapJson) -> Set[str]:
+    """
+    Return the keys of every object a published manifest references.
+
+    Keys of files are taken as written as well, so objects of manifests
+    published before content keys were used are found too.
+    """
+    keys = set(collect_objects(manifest))
+    for file_info in iter_all_file_infos(manifest):
+        keys.add(file_info.yan_obj_storage)
+        if file_info.compressed is not None:
+            keys.add(file_info.compressed.yan_obj_storage)
+    return keys
+
+
+def _map_json_for_target(map_json: MapJson, target: PublishTarget) -> MapJson:
+    map_json = content_addressed(map_json)
+    if not target.public_url:
+        return map_json
+    base_url = target.public_url.rstrip("/") + "/"
+    for file_info in iter_all_file_infos(map_json):
+        file_info.api_url = base_url + file_info.yan_obj_storage
+    return map_json
+
+
+def manifest_for_target(map_json: MapJson, target: PublishTarget) -> bytes:
+    """
+    Serialize the manifest served by a target.
+
+    Files are referenced by content keys. If the target has a public_url,
+    api_url of every file points to it.
+    """
+    map_json = _map_json_for_target(map_json, target)
+    return json.dumps(map_json.model_dump(mode="json")).encode("utf-8")
+
+
+def manifests_for_target(
+    map_json: MapJson, target: PublishTarget
+) -> Dict[str, bytes]:
+    """
+    Serialize every manifest served by a target, keyed by object key.
+
+    The main manifest is always the last item, so it is uploaded after
+    the manifests derived from it.
+    """
+    manifests = {}
+    if target.normalized_manifest_key:
+        normalized = normalize_map_json(_map_json_for_target(map_json, target))
+        manifests[target.normalized_manifest_key] = json.dumps(
+            normalized.model_dump(mode="json")
+        ).encode("utf-8")
+    manifests[target.manifest_key] = manifest_for_target(map_json, target)
+    return manifests
+
+
+def generation_id(manifest_hash: str) -> str:
+    """Return a generation name which sorts by publishing time."""
+    return (
+        time.strftime("%Y%m%dT%H%M%SZ", time.gmtime())
+        + f"-{manifest_hash[:12]}"
+    )
+
+
+def generation_manifest_key(
+    target: PublishTarget, generation: str, manifest_key: str
+) -> str:
+    """Return the key of a manifest copy inside of a generation."""
+    return (
+        f"{target.generations_prefix}{generation}/"
+        f"{posixpath.basename(manifest_key)}"
+    )
+
+
+def manifest_uploads(
+    target: PublishTarget,
+    manifests: Dict[str, bytes],
+    generation: str,
+) -> List[Tuple[str, bytes, str]]:
+    """
+    List manifest uploads of a generation in the order they must happen.
+
+    Immutable generation copies come first, then the pointer, then the
+    manifests at their fixed keys.
+
+    Returns:
+        List[Tuple[str, bytes, str]]: (key, body, Cache-Control) tuples.
+    """
+    if target.pointer_key is None:
+        return [
+            (key, manifest, MANIFEST_CACHE_CONTROL)
+            for key, manifest in manifests.items()
+        ]
+    uploads = [
+        (
+            generation_manifest_key(target, generation, key),
+            manifest,
+            IMMUTABLE_CACHE_CONTROL,
+        )
+        for key, manifest in manifests.items()
+    ]
+    pointer = {
+        "generation": generation,
+        "manifest_key": generation_manifest_key(
+            target, generation, target.manifest_key
+        ),
+        "normalized_manifest_key": (
+            generation_manifest_key(
+                target, generation, target.normalized_manifest_key
+            )
+            if target.normalized_manifest_key
+            else None
+        ),
+    }
+    uploads.append(
+        (
+            target.pointer_key,
+            json.dumps(pointer).encode("utf-8"),
+            MANIFEST_CACHE_CONTROL,
+        )
+    )
+    uploads.extend(
+        (key, manifest, MANIFEST_CACHE_CONTROL)
+        for key, manifest in manifests.items()
+    )
+    return uploads
+
+
+def load_targets(
+    targets_path: str = PUBLISH_TARGETS_PATH,
+    default: Optional[PublishTarget] = None,
+) -> List[PublishTarget]:
+    """
+    Load publish targets from a JSON list.
+
+    Args:
+        targets_path (str): The path to the JSON file.
+        default (Optional[PublishTarget]): A target used if the file
+            does not exist.
+
+    Raises:
+        PublishFailed: If the file is broken or names are not unique.
+    """
+    try:
+        with open(targets_path, encoding="utf-8") as fr:
+            targets = [PublishTarget(**item) for item in json.load(fr)]
+    except FileNotFoundError:
+        targets = [default] if default is not None else []
+    except Exception as error:
+        raise PublishFailed(
+            f"unable to parse targets file: {error}"
+        ) from error
+    names = [target.name for target in targets]
+    if len(names) != len(set(names)):
+        raise PublishFailed("Target names should be unique")
+    return targets
+
+
+def create_client(target: PublishTarget):
+    """Create a Boto3 S3 client for the target."""
+    session = boto3.session.Session()
+    return session.client(
+        "s3",
+        endpoint_url=target.endpoint_url,
+        aws_access_key_id=target.access_key_id,
+        aws_secret_access_key=os.environ.get(target.secret_key_env),
+    )
+
+
+def list_bucket(client, bucket_name: str, prefix: str = "") -> Dict:
+    """
+    List all objects under a prefix with paged ListObjectsV2 calls.
+
+    Returns:
+        Dict[str, RemoteObject]: Objects keyed by object key.
+    """
+    objects = {}
+    paginator = client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
+        for item in page.get("Contents", []):
+            objects[item["Key"]] = RemoteObject(
+                size=item["Size"],
+                etag=item["ETag"].strip('"'),
+                last_modified=(
+                    item["LastModified"].timestamp()
+                    if "LastModified" in item
+                    else None
+                ),
+            )
+    return objects
+
+
+def key_prefix(keys: Iterable[str]) -> str:
+    """Return the longest directory prefix shared by the keys."""
+    prefix = posixpath.commonprefix(list(keys)).rpartition("/")[0]
+    return f"{prefix}/" if prefix else ""
+
+
+class TargetState:
+    """
+    What a target is known to hold: object hashes and the manifest hash.
+
+    Attributes:
+        state_path (str): The path to the JSON state file.
+        objects (Dict[str, str]): Uploaded object keys and hashes.
+        manifest_hash (Optional[str]): Hash of the uploaded manifest.
+    """
+
+    def __init__(self, state_path: str) -> None:
+        self.state_path = state_path
+        self.objects: Dict[str, str] = {}
+        self.manifest_hash: Optional[str] = None
+
+    @classmethod
+    def for_target(
+        cls, target: PublishTarget, state_dir: str = PUBLISH_STATE_DIR
+    ) -> "TargetState":
+        """Load the state of a target."""
+        state = cls(os.path.join(state_dir, f"{target.name}.json"))
+        try:
+            with open(state.state_path, encoding="utf-8") as fr:
+                data = json.load(fr)
+            state.objects = data.get("objects", {})
+            state.manifest_hash = data.get("manifest_hash")
+        except (FileNotFoundError, json.JSONDecodeError):
+            pass
+        return state
+
+    def save(self) -> None:
+        """Write the state to disk."""
+        os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as fw:
+            json.dump(
+                {"objects": self.objects, "manifest_hash": self.manifest_hash},
+                fw,
+            )
+        os.replace(tmp_path, self.state_path)
+
+
+def upload_object(client, target: PublishTarget, obj: PublishObject) -> None:
+    """
+    Upload a single object to the target bucket.
+
+    Every object key changes with the content, so objects are cached
+    forever. The sha256 hash is stored in object metadata, so the bucket can be
+    audited without downloading objects.
+    """
+    content_type, _encoding = mimetypes.guess_type(obj.key)
+    client.upload_file(
+        obj.local_path,
+        target.bucket_name,
+        obj.key,
+        ExtraArgs={
+            "Metadata": {SHA256_METADATA_KEY: obj.hash},
+            "CacheControl": IMMUTABLE_CACHE_CONTROL,
+            "ContentType": content_type or "application/octet-stream",
+        },
+    )
+
+
+def upload_manifest(
+    client,
+    target: PublishTarget,
+    manifest_key: str,
+    manifest: bytes,
+    cache_control: str = MANIFEST_CACHE_CONTROL,
+) -> None:
+    """Upload a manifest to the target bucket."""
+    client.put_object(
+        Bucket=target.bucket_name,
+        Key=manifest_key,
+        Body=manifest,
+        ContentType="application/json",
+        CacheControl=cache_control,
+    )
+
+
+def publish_to_target(
+    target: PublishTarget,
+    map_json: MapJson,
+    objects: Dict[str, PublishObject],
+    state_dir: str = PUBLISH_STATE_DIR,
+) -> TargetReport:
+    """
+    Publish objects and the manifest to a single target.
+
+    Args:
+        target (PublishTarget): The target.
+        map_json (MapJson): The map to publish.
+        objects (Dict[str, PublishObject]): Objects referenced by the map.
+        state_dir (str): The directory with per-target state files.
+
+    Returns:
+        TargetReport: What was uploaded, skipped or failed.
+    """
+    report = TargetReport(name=target.name)
+    state = TargetState.for_target(target, state_dir)
+    client = create_client(target)
+    known = [
+        obj
+        for obj in objects.values()
+        if state.objects.get(obj.key) == obj.hash
+    ]
+    if known:
+        prefix = key_prefix(obj.key for obj in known)
+        try:
+            remote_objects = list_bucket(client, target.bucket_name, prefix)
+        except Exception as error:
+            log.error(f"[{target.name}] Unable to list {prefix}: {error}")
+            report.failed[prefix] = str(error)
+            return report
+        for obj in known:
+            remote = remote_objects.get(obj.key)
+            if remote is None or (
+                obj.size is not None and remote.size != obj.size
+            ):
+                log.warning(f"[{target.name}] Not in the bucket: {obj.key}")
+                state.objects.pop(obj.key, None)
+    pending = [
+        obj
+        for obj in objects.values()
+        if state.objects.get(obj.key) != obj.hash
+    ]
+    report.skipped = len(objects) - len(pending)
+    try:
+        with ThreadPoolExecutor(max_workers=target.workers) as executor:
+            futures = {
+                executor.submit(upload_object, client, target, obj): obj
+                for obj in pending
+            }
+            for future in as_completed(futures):
+                obj = futures[future]
+                try:
+                    future.result()
+                except Exception as error:
+                    log.error(f"[{target.name}] Upload failed: {obj.key}")
+                    report.failed[obj.key] = str(error)
+                else:
+                    log.info(f"[{target.name}] Uploaded: {obj.key}")
+                    state.objects[obj.key] = obj.hash
+                    report.uploaded.append(obj.key)
+
+        if report.failed:
+            log.error(
+                f"[{target.name}] Manifest not published, "
+                f"{len(report.failed)} objects failed"
+            )
+            return report
+        manifests = manifests_for_target(map_json, target)
+        hasher = hashlib.sha256()
+        for manifest_key, manifest in manifests.items():
+            hasher.update(manifest_key.encode("utf-8") + b"\0" + manifest)
+        manifest_hash = hasher.hexdigest()
+        if manifest_hash != state.manifest_hash:
+            generation = generation_id(manifest_hash)
+            for key, manifest, cache_control in manifest_uploads(
+                target, manifests, generation
+            ):
+                try:
+                    upload_manifest(
+                        client, target, key, manifest, cache_control
+                    )
+                except Exception as error:
+                    report.failed[key] = str(error)
+                    return report
+            state.manifest_hash = manifest_hash
+            report.manifest_published = True
+            report.generation = generation
+    finally:
+        state.save()
+    return report
+
+
+def publish(
+    targets: Iterable[PublishTarget],
+    map_json: MapJson,
+    state_dir: str = PUBLISH_STATE_DIR,
+) -> List[TargetReport]:
+    """
+    Publish the map to every target concurrently.
+
+    Args:
+        targets (Iterable[PublishTarget]): Targets to publish to.
+        map_json (MapJson): The map to publish.
+        state_dir (str): The directory with per-target state files.
+
+    Returns:
+        List[TargetReport]: Reports in the order of targets.
+    """
+    targets = list(targets)
+    objects = collect_objects(map_json)
+    with ThreadPoolExecutor(max_workers=max(len(targets), 1)) as executor:
+        reports = list(
+            executor.map(
+                lambda target: publish_to_target(
+                    target, map_json, objects, state_dir
+                ),
+                targets,
+            )
+        )
+    for report in reports:
+        log.info(
+            f"[{report.name}] uploaded: {len(report.uploaded)}, "
+            f"skipped: {report.skipped}, failed: {len(report.failed)}, "
+            f"manifest published: {report.manifest_published}"
+        )
+    return reports
@@ -1,10 +1,67 @@
 """A module with Pydantic models."""
-from typing import Dict, List
+from typing import Dict, List, Optional
 
 from pydantic import BaseModel
 
 
 # pylint: disable=R0903
+class CompressedVariant(BaseModel):
+    """
+    Represents a precompressed copy of a file stored next to it
+    in Yandex Object Storage.
+
+    Attributes:
+        encoding (str): The compression format ("gzip" or "zstd").
+        yan_obj_storage (str): The object key to the compressed file in
+            Yandex Object Storage.
+        hash (str): The hash value of the compressed file.
+        size (int): The size of the compressed file in bytes.
+    """
+
+    encoding: str
+    yan_obj_storage: str
+    hash: str
+    size: int
+
+
+class PackRef(BaseModel):
+    """
+    Represents the location of a small file inside of a shared pack
+    object, so it can be fetched with a ranged request.
+
+    Attributes:
+        yan_obj_storage (str): The object key of the pack in
+            Yandex Object Storage.
+        offset (int): The offset of the file in the pack.
+        length (int): The size of the file in bytes.
+    """
+
+    yan_obj_storage: str
+    offset: int
+    length: int
+
+
+class PatchInfo(BaseModel):
+    """
+    Represents a binary patch turning a previous version of a file
+    into the current one.
+
+    Attributes:
+        from_hash (str): The hash of the version the patch applies to.
+        yan_obj_storage (str): The object key of the patch in
+            Yandex Object Storage.
+        hash (str): The hash value of the patch.
+        size (int): The size of the patch in bytes.
+        encoding (str): The patch format ("zstd-dict" or "block-lzma").
+    """
+
+    from_hash: str
+    yan_obj_storage: str
+    hash: str
+    size: int
+    encoding: str
+
+
 class FileInfo(BaseModel):
     """
     Represents information about a file in the modpack.
@@ -19,6 +76,14 @@ class FileInfo(BaseModel):
         hash (str): The hash value of the file.
         dist_file_path (str): The path where the file should
             be downloaded.
+        size (Optional[int]): The size of the file in bytes. Could be
+            None in maps generated by older versions.
+        compressed (Optional[CompressedVariant]): A precompressed
+            copy of the file, if the file compresses well.
+        pack (Optional[PackRef]): The location of the file inside of
+            a pack object, set for small files only.
+        patches (List[PatchInfo]): Patches from previous versions of
+            the file at the same dist_file_path.
     """
 
     file_name: str
@@ -26,6 +91,50 @@ class FileInfo(BaseModel):
     yan_obj_storage: str
     hash: str
     dist_file_path: str
+    size: Optional[int] = None
+    compressed: Optional[CompressedVariant] = None
+    pack: Optional[PackRef] = None
+    patches: List[PatchInfo] = []
+
+
+class BundleInfo(BaseModel):
+    """
+    Represents a tar archive with all files of a data group, used for
+    first-time installs with a single download.
+
+    Attributes:
+        yan_obj_storage (str): The object key of the archive in
+            Yandex Object Storage.
+        hash (str): The hash value of the archive.
+        size (int): The size of the archive in bytes.
+        encoding (Optional[str]): The compression of the archive
+            ("zstd", "gzip") or None for a plain tar.
+        content_digest (str): A digest of dist paths and hashes of
+            the bundled files.
+    """
+
+    yan_obj_storage: str
+    hash: str
+    size: int
+    encoding: Optional[str] = None
+    content_digest: str
+
+
+class PackInfo(BaseModel):
+    """
+    Represents a pack object holding many small files one after another.
+
+    Attributes:
+        yan_obj_storage (str): The object key of the pack in
+            Yandex Object Storage.
+        hash (str): The hash value of the pack.
+        size (int): The size of the pack in bytes.
+    """
+
+    yan_obj_storage: str
+    hash: str
+    size: int
+
 
 class ServerConfig(BaseModel):
     """
@@ -63,11 +172,17 @@ class Modpack(BaseModel):
         main_data (List[FileInfo]): Essential data files.
         client_additional_data [Dict[str, List[FileInfo]]]:
             Additional files that can be added if needed.
+        bundles (Dict[str, BundleInfo]): Archives of data groups keyed
+            by "main_data" or a client_additional_data group name.
+        packs (List[PackInfo]): Pack objects referenced by small files
+            of the modpack.
     """
 
     server_config: ServerConfig
     main_data: List[FileInfo]
     client_additional_data: Dict[str, List[FileInfo]]
+    bundles: Dict[str, BundleInfo] = {}
+    packs: List[PackInfo] = []
 
 
 class MapJson(BaseModel):
@@ -78,6 +193,129 @@ class MapJson(BaseModel):
     Attributes:
         modpacks (Dict[str, Modpack]): A dictionary where keys
             are modpack names and values are Modpack instances.
+        source_commit (Optional[str]): The git commit HEAD pointed to
+            when the map was generated.
+        source_changes (List[str]): Paths which differed from
+            source_commit when the map was generated.
     """
 
     modpacks: Dict[str, Modpack]
+    source_commit: Optional[str] = None
+    source_changes: List[str] = []
+
+
+class PublishTarget(BaseModel):
+    """
+    Represents an object storage bucket the modpacks are published to.
+
+    Attributes:
+        name (str): A unique name of the target. It is used for the
+            local state file and in reports.
+        endpoint_url (str): The S3 compatible endpoint.
+        bucket_name (str): The name of the bucket.
+        access_key_id (str): The access key id.
+        secret_key_env (str): The name of the environment variable
+            holding the secret key.
+        public_url (Optional[str]): The public base URL of the bucket.
+            If set, api_url of every file in this target's manifest
+            points into the bucket instead of GitHub.
+        manifest_key (str): The object key of the manifest.
+        normalized_manifest_key (Optional[str]): The object key of the
+            manifest with a shared blob table. It is not published
+            if None.
+        generations_prefix (str): The prefix for generation-stamped
+            copies of the manifests.
+        pointer_key (Optional[str]): The object key of a small JSON
+            pointing to the current generation. Generations are not
+            published if None.
+        workers (int): The number of parallel uploads.
+    """
+
+    name: str
+    endpoint_url: str
+    bucket_name: str
+    access_key_id: str
+    secret_key_env: str
+    public_url: Optional[str] = None
+    manifest_key: str = "modpacks/map.json"
+    normalized_manifest_key: Optional[str] = "modpacks/map_blobs.json"
+    generations_prefix: str = "modpacks/generations/"
+    pointer_key: Optional[str] = "modpacks/current.json"
+    workers: int = 8
+
+
+class BlobInfo(BaseModel):
+    """
+    Represents unique file content shared by any number of modpacks.
+
+    Attributes:
+        size (Optional[int]): The size of the content in bytes.
+        yan_obj_storage (str): The object key of the content in
+            Yandex Object Storage.
+        api_url (str): The API URL on github for downloading
+            the content.
+        compressed (Optional[CompressedVariant]): A precompressed
+            copy of the content.
+        pack (Optional[PackRef]): The location of the content inside
+            of a pack object, set for small files only.
+        patches (List[PatchInfo]): Patches from previous versions.
+    """
+
+    size: Optional[int] = None
+    yan_obj_storage: str
+    api_url: str
+    compressed: Optional[CompressedVariant] = None
+    pack: Optional[PackRef] = None
+    patches: List[PatchInfo] = []
+
+
+class BlobRef(BaseModel):
+    """
+    Represents a file of a modpack in a normalized map.
+
+    Attributes:
+        hash (str): The hash of the content, a key of the blob table.
+        file_name (str): The name of the file.
+        dist_file_path (str): The path where the file should
+            be downloaded.
+    """
+
+    hash: str
+    file_name: str
+    dist_file_path: str
+
+
+class NormalizedModpack(BaseModel):
+    """
+    Represents a modpack whose files reference the blob table.
+
+    Attributes:
+        server_config (ServerConfig): The configuration data
+            for the modpack.
+        main_data (List[BlobRef]): Essential data files.
+        client_additional_data (Dict[str, List[BlobRef]]):
+            Additional files that can be added if needed.
+        bundles (Dict[str, BundleInfo]): Archives of data groups.
+        packs (List[PackInfo]): Pack objects referenced by small files
+            of the modpack.
+    """
+
+    server_config: ServerConfig
+    main_data: List[BlobRef]
+    client_additional_data: Dict[str, List[BlobRef]]
+    bundles: Dict[str, BundleInfo] = {}
+    packs: List[PackInfo] = []
+
+
+class NormalizedMapJson(BaseModel):
+    """
+    Represents map.json with identical files stored only once.
+
+    Attributes:
+        blobs (Dict[str, BlobInfo]): Unique contents keyed by hash.
+        modpacks (Dict[str, NormalizedModpack]): Modpacks referencing
+            the blobs.
+    """
+
+    blobs: Dict[str, BlobInfo]
+    modpacks: Dict[str, NormalizedModpack]
@@ -0,0 +1,103 @@
+"""
+A small JSON-backed cache keyed by file path, size and mtime.
+
+Values stored in the cache are only returned while the file keeps the
+same size and modification time, so expensive per-file work (hashing,
+compression measuring) is skipped for unchanged files.
+"""
+import json
+import os
+from typing import Any, Dict, Optional
+
+from loguru import logger as log
+
+
+class StatCache:
+    """
+    Cache of per-file values invalidated by file size and mtime.
+
+    Attributes:
+        cache_path (str): The path to the JSON file backing the cache.
+        entries (Dict[str, Dict[str, Any]]): Cached entries keyed by
+            normalized file path.
+    """
+
+    def __init__(self, cache_path: str) -> None:
+        self.cache_path = cache_path
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self._dirty = False
+
+    @staticmethod
+    def _normalize(file_path: str) -> str:
+        return str(file_path).replace("\\", "/")
+
+    def load(self) -> "StatCache":
+        """Load entries from disk. A missing or broken file is ignored."""
+        try:
+            with open(self.cache_path, encoding="utf-8") as fr:
+                entries = json.load(fr)
+        except (FileNotFoundError, json.JSONDecodeError):
+            entries = {}
+        self.entries = entries if isinstance(entries, dict) else {}
+        self._dirty = False
+        return self
+
+    def save(self) -> None:
+        """Write entries to disk if anything has changed."""
+        if not self._dirty:
+            return
+        cache_dir = os.path.dirname(self.cache_path)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = f"{self.cache_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as fw:
+            json.dump(self.entries, fw)
+        os.replace(tmp_path, self.cache_path)
+        self._dirty = False
+
+    def get(self, file_path: str) -> Optional[Dict[str, Any]]:
+        """
+        Get cached values for a file.
+
+        Args:
+            file_path (str): The path to the file.
+
+        Returns:
+            Optional[Dict[str, Any]]: Cached values, or None if the file
+                does not exist or was changed since it was cached.
+        """
+        entry = self.entries.get(self._normalize(file_path))
+        if entry is None:
+            return None
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+        if (
+            entry.get("size") != stat.st_size
+            or entry.get("mtime_ns") != stat.st_mtime_ns
+        ):
+            return None
+        return entry.get("values")
+
+    def set(self, file_path: str, values: Dict[str, Any]) -> None:
+        """
+        Store values for a file together with its current size and mtime.
+
+        Args:
+            file_path (str): The path to the file.
+            values (Dict[str, Any]): JSON serializable values to cache.
+        """
+        stat = os.stat(file_path)
+        self.entries[self._normalize(file_path)] = {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "values": values,
+        }
+        self._dirty = True
+
+    def discard(self, file_path: str) -> None:
+        """Remove a file from the cache."""
+        if self.entries.pop(self._normalize(file_path), None) is not None:
+            self._dirty = True
+            log.debug(f"Cache entry dropped: {file_path}")
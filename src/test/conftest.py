@@ -0,0 +1,190 @@
+"""Shared fixtures and factories of the tests."""
+# pylint:disable = E0401, C0411
+import hashlib
+import io
+import os
+import subprocess  # nosec B404
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional
+from unittest.mock import MagicMock
+
+import pytest
+from src.pydantic_models import (
+    FileInfo,
+    MapJson,
+    Modpack,
+    PublishTarget,
+    ServerConfig,
+)
+
+STORAGE_URL = "https://storage.example.com/bucket/"
+MAIN_DATA_PREFIX = "modpacks/pack/main_data/"
+OLD = datetime(2020, 1, 1, tzinfo=timezone.utc)
+
+
+def git(repo, *args) -> str:
+    """Run git inside of a test repository and return its output."""
+    return (
+        subprocess.run(  # nosec B603 B607
+            ["git", *args], cwd=str(repo), check=True, capture_output=True
+        )
+        .stdout.decode("utf-8")
+        .strip()
+    )
+
+
+def make_file_info(
+    key: str,
+    content: bytes = b"",
+    dist_file_path: Optional[str] = None,
+    file_hash: Optional[str] = None,
+    write: bool = False,
+) -> FileInfo:
+    """
+    Create a FileInfo for the given object key and content.
+
+    Args:
+        key (str): The object key, also the path of the file relative to
+            the current directory.
+        content (bytes): The content of the file.
+        dist_file_path (Optional[str]): The dist path. The part of the key
+            after main_data/ or the file name by default.
+        file_hash (Optional[str]): A hash to use instead of the hash of
+            the content. The size is not set in that case.
+        write (bool): Write the content to the key.
+    """
+    if dist_file_path is None:
+        _, separator, dist_file_path = key.partition("/main_data/")
+        if not separator:
+            dist_file_path = key.rsplit("/", 1)[-1]
+    if write:
+        os.makedirs(os.path.dirname(key) or ".", exist_ok=True)
+        with open(key, "wb") as fw:
+            fw.write(content)
+    return FileInfo(
+        file_name=key.rsplit("/", 1)[-1],
+        api_url=f"https://github.example.com/{key}",
+        yan_obj_storage=key,
+        hash=file_hash or hashlib.sha256(content).hexdigest(),
+        dist_file_path=dist_file_path,
+        size=None if file_hash else len(content),
+    )
+
+
+def make_dist_file_info(
+    dist_file_path: str, content: bytes, write: bool = False
+) -> FileInfo:
+    """Create a FileInfo of main_data of modpack "pack" by dist path."""
+    return make_file_info(
+        MAIN_DATA_PREFIX + dist_file_path.replace("\\", "/"),
+        content,
+        dist_file_path=dist_file_path,
+        write=write,
+    )
+
+
+def dist_files(files: Dict[str, bytes], write: bool = False) -> List[FileInfo]:
+    """Create FileInfos from contents keyed by dist path."""
+    return [
+        make_dist_file_info(path, content, write)
+        for path, content in files.items()
+    ]
+
+
+def make_modpack(
+    main_data: List[FileInfo],
+    server_icon: Optional[FileInfo] = None,
+    client_additional_data: Optional[Dict[str, List[FileInfo]]] = None,
+    display_name: str = "Pack",
+    minecraft_version: str = "1.19.2",
+) -> Modpack:
+    """Create a modpack, with an icon at modpacks/pack/icon.jpg by default."""
+    if server_icon is None:
+        server_icon = make_file_info("modpacks/pack/icon.jpg", b"icon")
+    return Modpack(
+        server_config=ServerConfig(
+            display_name=display_name,
+            minecraft_version=minecraft_version,
+            forge_version="1.19.2-43.3.8",
+            minecraft_profile="1.19.2-forge-43.3.8",
+            minecraft_server_ip="127.0.0.1",
+            minecraft_server_port="25565",
+            description="",
+            server_icon=server_icon,
+        ),
+        main_data=main_data,
+        client_additional_data=client_additional_data or {},
+    )
+
+
+def make_map_json(main_data: List[FileInfo], **modpack_kwargs) -> MapJson:
+    """Create a map with a single modpack named "pack"."""
+    return MapJson(
+        modpacks={"pack": make_modpack(main_data, **modpack_kwargs)}
+    )
+
+
+def make_target(name: str = "main", **kwargs) -> PublishTarget:
+    """Create a publish target."""
+    return PublishTarget(
+        name=name,
+        endpoint_url="https://s3.example.com",
+        bucket_name=kwargs.pop("bucket_name", "bucket"),
+        access_key_id="key",
+        secret_key_env="SECRET",
+        **kwargs,
+    )
+
+
+def fake_bucket_client(
+    objects: Dict[str, bytes], fresh: Iterable[str] = ()
+) -> MagicMock:
+    """
+    Create a fake S3 client serving objects, which may change later.
+
+    Listings, HEAD and GET requests read objects. Keys in fresh were
+    modified just now, the other ones in 2020.
+    """
+    fresh = set(fresh)
+    fake = MagicMock()
+    fake.get_paginator.return_value.paginate.side_effect = (
+        lambda Bucket, Prefix: [
+            {
+                "Contents": [
+                    {
+                        "Key": key,
+                        "Size": len(content),
+                        "ETag": f'"{hashlib.md5(content).hexdigest()}"',
+                        "LastModified": (
+                            datetime.now(timezone.utc)
+                            if key in fresh
+                            else OLD
+                        ),
+                    }
+                    for key, content in sorted(objects.items())
+                    if key.startswith(Prefix)
+                ]
+            }
+        ]
+    )
+    fake.head_object.side_effect = lambda Bucket, Key: {
+        "Metadata": {"sha256": hashlib.sha256(objects[Key]).hexdigest()}
+    }
+    fake.get_object.side_effect = lambda Bucket, Key: {
+        "Body": io.BytesIO(objects[Key])
+    }
+    fake.delete_objects.return_value = {}
+    return fake
+
+
+@pytest.fixture
+def workdir(tmpdir, monkeypatch):
+    """Run a test inside a temporary directory."""
+    monkeypatch.chdir(tmpdir)
+    return tmpdir
+
+
+@pytest.fixture
+def target():
+    """A publish target."""
+    return make_target()
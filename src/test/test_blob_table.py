@@ -0,0 +1,143 @@
+"""Tests for src/blob_table.py"""
+# pylint:disable = E0401, C0411
+import hashlib
+import io
+import os
+
+import pytest
+from src import blob_table, client_sync
+from src.pydantic_models import MapJson, Modpack, PackInfo, PackRef
+from src.test.conftest import STORAGE_URL, make_file_info, make_modpack
+
+
+def sample_modpack(name: str, files) -> Modpack:
+    """Create a modpack with main_data built from (path, content) pairs."""
+    return make_modpack(
+        [
+            make_file_info(f"{name}/main_data/{path}", content)
+            for path, content in files
+        ],
+        server_icon=make_file_info(f"{name}/icon.jpg", name.encode()),
+        display_name=name,
+    )
+
+
+def sample_map_json() -> MapJson:
+    """Create two modpacks sharing authlib."""
+    return MapJson(
+        modpacks={
+            "pack_b": sample_modpack(
+                "pack_b",
+                [("libraries/authlib.jar", b"authlib"), ("b.jar", b"b")],
+            ),
+            "pack_a": sample_modpack(
+                "pack_a",
+                [("libraries/authlib.jar", b"authlib"), ("a.jar", b"a")],
+            ),
+        }
+    )
+
+
+def test_build_blob_table_deduplicates_identical_files():
+    """Test that identical files become a single blob."""
+    blobs = blob_table.build_blob_table(sample_map_json())
+    authlib_hash = hashlib.sha256(b"authlib").hexdigest()
+
+    # authlib, a.jar, b.jar and two icons
+    assert len(blobs) == 5
+    assert (
+        blobs[authlib_hash].yan_obj_storage
+        == "pack_a/main_data/libraries/authlib.jar"
+    )
+
+
+def test_normalized_map_references_blobs():
+    """Test that modpack entries only reference hashes and paths."""
+    normalized = blob_table.normalize_map_json(sample_map_json())
+
+    refs = normalized.modpacks["pack_b"].main_data
+    assert refs[0].dist_file_path == "libraries/authlib.jar"
+    assert refs[0].hash in normalized.blobs
+
+
+def test_denormalize_round_trip_keeps_files():
+    """Test that hashes, dist paths and packs survive a round trip."""
+    map_json = sample_map_json()
+    for name, modpack in map_json.modpacks.items():
+        pack_key = f"modpacks/packs/{name}.pack"
+        modpack.packs = [PackInfo(yan_obj_storage=pack_key, hash=name, size=9)]
+        for offset, file_info in enumerate(modpack.main_data):
+            file_info.pack = PackRef(
+                yan_obj_storage=pack_key, offset=offset, length=1
+            )
+
+    restored = blob_table.denormalize_map_json(
+        blob_table.normalize_map_json(map_json)
+    )
+
+    for name, modpack in map_json.modpacks.items():
+        assert [
+            (info.hash, info.dist_file_path) for info in modpack.main_data
+        ] == [
+            (info.hash, info.dist_file_path)
+            for info in restored.modpacks[name].main_data
+        ]
+        assert restored.modpacks[name].packs == modpack.packs
+        assert all(
+            info.pack is not None for info in restored.modpacks[name].main_data
+        )
+    assert restored.modpacks["pack_a"].main_data[1].pack == (
+        map_json.modpacks["pack_a"].main_data[1].pack
+    )
+
+
+def test_resolve_ref_with_missing_blob():
+    """Test that a dangling reference raises BlobNotFound."""
+    normalized = blob_table.normalize_map_json(sample_map_json())
+    ref = normalized.modpacks["pack_a"].main_data[0]
+    normalized.blobs.pop(ref.hash)
+
+    with pytest.raises(blob_table.BlobNotFound):
+        blob_table.resolve_ref(normalized, ref)
+
+
+def test_sync_normalized_downloads_shared_blob_once(tmpdir, mocker):
+    """Test that two installs share one downloaded copy of a blob."""
+    normalized = blob_table.normalize_map_json(sample_map_json())
+    contents = {b"authlib", b"a", b"b"}
+    objects = {
+        STORAGE_URL + blob.yan_obj_storage: content
+        for content in contents
+        for file_hash, blob in normalized.blobs.items()
+        if file_hash == hashlib.sha256(content).hexdigest()
+    }
+    requests = []
+
+    def open_url(url, offset=0):
+        requests.append(url)
+        response = io.BytesIO(objects[url][offset:])
+        response.status = 200
+        return response
+
+    mocker.patch.object(client_sync, "_open_url", side_effect=open_url)
+    store = str(tmpdir.join("store"))
+
+    for name in ("pack_a", "pack_b"):
+        report = client_sync.sync_normalized_modpack(
+            normalized,
+            name,
+            str(tmpdir.join(name)),
+            store,
+            storage_url=STORAGE_URL,
+        )
+        assert report.ok
+
+    assert len(requests) == 3
+    assert (
+        tmpdir.join("pack_b", "libraries", "authlib.jar").read_binary()
+        == b"authlib"
+    )
+    assert os.path.samefile(
+        str(tmpdir.join("pack_a", "libraries", "authlib.jar")),
+        str(tmpdir.join("pack_b", "libraries", "authlib.jar")),
+    )
@@ -0,0 +1,112 @@
+"""Tests for src/bucket_audit.py"""
+# pylint:disable = E0401, C0411
+import hashlib
+
+import pytest
+from src import bucket_audit, publishing
+from src.pydantic_models import MapJson
+from src.test.conftest import (
+    fake_bucket_client,
+    make_file_info,
+    make_map_json,
+)
+
+FILES = {
+    "modpacks/pack/icon.jpg": b"icon",
+    "modpacks/pack/main_data/ok.jar": b"ok",
+    "modpacks/pack/main_data/stale.jar": b"new",
+    "modpacks/pack/main_data/missing.jar": b"missing",
+}
+
+
+def object_key(content: bytes) -> str:
+    """Return the content key the content is published under."""
+    return publishing.content_key(hashlib.sha256(content).hexdigest())
+
+
+def sample_map_json() -> MapJson:
+    """Create a map referencing FILES, the first one is the icon."""
+    icon, *main_data = [
+        make_file_info(key, content) for key, content in FILES.items()
+    ]
+    return make_map_json(main_data, server_icon=icon)
+
+
+@pytest.fixture
+def client(mocker):
+    """A fake bucket holding a stale object and an orphan."""
+    fake = fake_bucket_client(
+        {
+            object_key(b"icon"): b"icon",
+            object_key(b"ok"): b"ok",
+            object_key(b"new"): b"old",
+            "modpacks/pack/main_data/removed.jar": b"removed",
+            "modpacks/map.json": b"{}",
+        }
+    )
+    mocker.patch.object(bucket_audit, "create_client", return_value=fake)
+    return fake
+
+
+def run_audit(tmpdir, target, **kwargs):
+    """Run audit_target with caches kept in tmpdir."""
+    return bucket_audit.audit_target(
+        target,
+        sample_map_json(),
+        cache_dir=str(tmpdir.join("audit")),
+        state_dir=str(tmpdir.join("state")),
+        **kwargs,
+    )
+
+
+def test_audit_reports_missing_mismatched_and_orphaned(tmpdir, client, target):
+    """Test that every kind of problem is reported."""
+    report = run_audit(tmpdir, target)
+
+    assert report.checked == 4
+    assert report.missing == [object_key(b"missing")]
+    assert report.mismatched == [object_key(b"new")]
+    assert report.orphaned == ["modpacks/pack/main_data/removed.jar"]
+    assert not report.ok
+    client.get_paginator.return_value.paginate.assert_called_once_with(
+        Bucket="bucket", Prefix="modpacks/"
+    )
+
+
+def test_audit_uses_cached_etags(tmpdir, client, target):
+    """Test that verified objects are not requested again."""
+    run_audit(tmpdir, target)
+    client.head_object.reset_mock()
+
+    run_audit(tmpdir, target)
+
+    client.head_object.assert_not_called()
+
+
+def test_audit_repair_uploads_and_keeps_orphans(
+    tmpdir, client, target, mocker
+):
+    """Test that repair uploads bad objects and leaves orphans to gc."""
+    upload = mocker.patch.object(bucket_audit, "upload_object")
+
+    report = run_audit(tmpdir, target, repair=True)
+
+    assert sorted(call.args[2].key for call in upload.call_args_list) == (
+        sorted([object_key(b"missing"), object_key(b"new")])
+    )
+    assert report.orphaned == ["modpacks/pack/main_data/removed.jar"]
+    client.delete_objects.assert_not_called()
+
+
+def test_audit_orphans_do_not_fail_the_report(tmpdir, mocker, target):
+    """Test that objects kept for older generations are only reported."""
+    objects = {object_key(content): content for content in FILES.values()}
+    objects["modpacks/pack/main_data/removed.jar"] = b"removed"
+    mocker.patch.object(
+        bucket_audit, "create_client", return_value=fake_bucket_client(objects)
+    )
+
+    report = run_audit(tmpdir, target)
+
+    assert report.orphaned == ["modpacks/pack/main_data/removed.jar"]
+    assert report.ok
@@ -0,0 +1,102 @@
+"""Tests for src/bundles.py"""
+# pylint:disable = E0401, C0411
+import io
+import os
+
+import pytest
+from src import bundles, client_sync
+from src.test.conftest import STORAGE_URL, dist_files, make_map_json
+
+FILES = {
+    "mods/a.jar": b"a" * 100,
+    "mods/b.jar": b"b" * 200,
+    "config\\c.cfg": b"option=true\n",
+}
+
+
+@pytest.mark.usefixtures("workdir")
+def test_content_digest_does_not_depend_on_order():
+    """Test that the digest only depends on paths and hashes."""
+    file_infos = (
+        make_map_json(dist_files(FILES, write=True)).modpacks["pack"].main_data
+    )
+
+    assert bundles.content_digest(file_infos) == bundles.content_digest(
+        list(reversed(file_infos))
+    )
+
+
+@pytest.mark.usefixtures("workdir")
+def test_build_bundle_is_deterministic():
+    """Test that the same files always give the same archive."""
+    file_infos = (
+        make_map_json(dist_files(FILES, write=True)).modpacks["pack"].main_data
+    )
+
+    first = bundles.build_bundle(file_infos, "first.tar.gz", "gzip")
+    os.utime(file_infos[0].yan_obj_storage, (0, 12345))
+    second = bundles.build_bundle(
+        list(reversed(file_infos)), "second.tar.gz", "gzip"
+    )
+
+    assert first.hash == second.hash
+    assert first.size == os.path.getsize("first.tar.gz")
+
+
+@pytest.mark.usefixtures("workdir")
+def test_attach_bundles_rebuilds_only_changed_groups(mocker):
+    """Test that an unchanged group reuses the existing bundle."""
+    map_json = bundles.attach_bundles(
+        make_map_json(dist_files(FILES, write=True)), encoding="gzip"
+    )
+    bundle = map_json.modpacks["pack"].bundles[bundles.MAIN_DATA_BUNDLE]
+    assert os.path.isfile(bundles.bundle_local_path(bundle))
+
+    build = mocker.spy(bundles, "build_bundle")
+    bundles.attach_bundles(
+        make_map_json(dist_files(FILES, write=True)), encoding="gzip"
+    )
+    build.assert_not_called()
+
+    changed = bundles.attach_bundles(
+        make_map_json(dist_files({**FILES, "mods/a.jar": b"new"}, write=True)),
+        encoding="gzip",
+    )
+    build.assert_called_once()
+    new_bundle = changed.modpacks["pack"].bundles[bundles.MAIN_DATA_BUNDLE]
+    assert new_bundle.yan_obj_storage != bundle.yan_obj_storage
+    assert not os.path.exists(bundles.bundle_local_path(bundle))
+
+
+def test_sync_modpack_cold_install_uses_bundle(workdir, mocker):
+    """Test that a cold install makes a single download."""
+    map_json = bundles.attach_bundles(
+        make_map_json(dist_files(FILES, write=True)), encoding="gzip"
+    )
+    bundle = map_json.modpacks["pack"].bundles[bundles.MAIN_DATA_BUNDLE]
+    with open(bundles.bundle_local_path(bundle), "rb") as fr:
+        archive = fr.read()
+    requests = []
+
+    def open_url(url, offset=0):
+        requests.append(url)
+        assert url == STORAGE_URL + bundle.yan_obj_storage
+        response = io.BytesIO(archive[offset:])
+        response.status = 200
+        return response
+
+    mocker.patch.object(client_sync, "_open_url", side_effect=open_url)
+    install_dir = str(workdir.join("install"))
+
+    report = client_sync.sync_modpack(
+        map_json, "pack", install_dir, storage_url=STORAGE_URL
+    )
+
+    assert report.ok
+    assert len(requests) == 1
+    assert len(report.bundled) == 3
+    assert not report.tasks
+    assert (
+        workdir.join("install", "config", "c.cfg").read_binary()
+        == b"option=true\n"
+    )
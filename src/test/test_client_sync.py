@@ -0,0 +1,223 @@
+"""Tests for src/client_sync.py"""
+# pylint:disable = E0401, C0411
+import gzip
+import hashlib
+import io
+import json
+import os
+
+import pytest
+from src import client_sync, delta_patches
+from src.pydantic_models import CompressedVariant, PatchInfo
+from src.stat_cache import StatCache
+from src.test.conftest import STORAGE_URL, make_dist_file_info
+
+
+class FakeResponse(io.BytesIO):
+    """A minimal urlopen() response."""
+
+    def __init__(self, data: bytes, status: int = 200) -> None:
+        super().__init__(data)
+        self.status = status
+
+
+def fake_server(mocker, objects):
+    """Serve objects from a dict of url -> bytes, honoring Range."""
+    requests = []
+
+    def open_url(url, offset=0):
+        requests.append((url, offset))
+        if url not in objects:
+            raise client_sync.URLError("not found")
+        data = objects[url]
+        if offset:
+            return FakeResponse(data[offset:], status=206)
+        return FakeResponse(data)
+
+    mocker.patch.object(client_sync, "_open_url", side_effect=open_url)
+    return requests
+
+
+def test_resolve_dist_path_accepts_windows_separators(tmpdir):
+    """Test that manifest paths with backslashes are resolved."""
+    assert client_sync.resolve_dist_path(
+        str(tmpdir), "mods\\mod.jar"
+    ) == os.path.join(str(tmpdir), "mods", "mod.jar")
+
+
+def test_resolve_dist_path_rejects_parent_dirs(tmpdir):
+    """Test that a path escaping the install dir is rejected."""
+    with pytest.raises(client_sync.SyncFailed):
+        client_sync.resolve_dist_path(str(tmpdir), "..\\evil.jar")
+
+
+def test_plan_sync_reports_missing_and_changed(tmpdir):
+    """Test that only missing and changed files are planned."""
+    same = make_dist_file_info("same.txt", b"same")
+    changed = make_dist_file_info("mods\\changed.jar", b"new content")
+    missing = make_dist_file_info("missing.txt", b"missing")
+    tmpdir.join("same.txt").write_binary(b"same")
+    tmpdir.mkdir("mods").join("changed.jar").write_binary(b"old content")
+    cache = StatCache(str(tmpdir.join("cache.json")))
+
+    tasks = client_sync.plan_sync([same, changed, missing], str(tmpdir), cache)
+
+    assert [(task.file_info, task.reason) for task in tasks] == [
+        (changed, "changed"),
+        (missing, "missing"),
+    ]
+
+
+def test_plan_sync_warm_install_does_not_read_files(tmpdir, mocker):
+    """Test that cached files are verified without hashing."""
+    file_info = make_dist_file_info("same.txt", b"same")
+    tmpdir.join("same.txt").write_binary(b"same")
+    cache = StatCache(str(tmpdir.join("cache.json")))
+    client_sync.plan_sync([file_info], str(tmpdir), cache)
+
+    spy = mocker.spy(client_sync, "hash_local_file")
+    assert not client_sync.plan_sync([file_info], str(tmpdir), cache)
+    spy.assert_not_called()
+
+
+def test_sync_files_downloads_and_verifies(tmpdir, mocker):
+    """Test that missing files are downloaded into place."""
+    file_info = make_dist_file_info("mods\\mod.jar", b"mod bytes")
+    fake_server(
+        mocker, {STORAGE_URL + file_info.yan_obj_storage: b"mod bytes"}
+    )
+
+    report = client_sync.sync_files(
+        [file_info], str(tmpdir), storage_url=STORAGE_URL
+    )
+
+    assert report.ok
+    assert tmpdir.join("mods", "mod.jar").read_binary() == b"mod bytes"
+    assert not os.path.exists(str(tmpdir.join("mods", "mod.jar.part")))
+
+
+def test_sync_files_verify_only_does_not_download(tmpdir, mocker):
+    """Test that verify-only mode never downloads."""
+    file_info = make_dist_file_info("mod.jar", b"mod bytes")
+    requests = fake_server(mocker, {})
+
+    report = client_sync.sync_files(
+        [file_info], str(tmpdir), verify_only=True, storage_url=STORAGE_URL
+    )
+
+    assert [task.reason for task in report.tasks] == ["missing"]
+    assert not requests
+
+
+def test_download_resumes_partial_file(tmpdir, mocker):
+    """Test that an existing partial file is continued with Range."""
+    file_info = make_dist_file_info("mod.jar", b"0123456789")
+    tmpdir.join("mod.jar.part").write_binary(b"01234")
+    requests = fake_server(
+        mocker, {STORAGE_URL + file_info.yan_obj_storage: b"0123456789"}
+    )
+
+    report = client_sync.sync_files(
+        [file_info], str(tmpdir), storage_url=STORAGE_URL
+    )
+
+    assert report.ok
+    assert requests[0][1] == 5
+    assert tmpdir.join("mod.jar").read_binary() == b"0123456789"
+
+
+def test_download_falls_back_on_hash_mismatch(tmpdir, mocker):
+    """Test that a corrupted storage object falls back to api_url."""
+    file_info = make_dist_file_info("mod.jar", b"good")
+    fake_server(
+        mocker,
+        {
+            STORAGE_URL + file_info.yan_obj_storage: b"bad",
+            file_info.api_url: b"good",
+        },
+    )
+
+    report = client_sync.sync_files(
+        [file_info], str(tmpdir), storage_url=STORAGE_URL
+    )
+
+    assert report.ok
+    assert tmpdir.join("mod.jar").read_binary() == b"good"
+
+
+def test_download_prefers_compressed_variant(tmpdir, mocker):
+    """Test that a gzip variant is downloaded and decompressed."""
+    content = b"option=true\n" * 100
+    compressed = gzip.compress(content, mtime=0)
+    file_info = make_dist_file_info("config.cfg", content)
+    file_info.compressed = CompressedVariant(
+        encoding="gzip",
+        yan_obj_storage=file_info.yan_obj_storage + ".gz",
+        hash=hashlib.sha256(compressed).hexdigest(),
+        size=len(compressed),
+    )
+    requests = fake_server(
+        mocker,
+        {STORAGE_URL + file_info.compressed.yan_obj_storage: compressed},
+    )
+
+    report = client_sync.sync_files(
+        [file_info], str(tmpdir), storage_url=STORAGE_URL
+    )
+
+    assert report.ok
+    assert len(requests) == 1
+    assert tmpdir.join("config.cfg").read_binary() == content
+
+
+def test_download_applies_patch_to_local_version(tmpdir, mocker):
+    """Test that a changed file is patched instead of downloaded."""
+    old = b"line of a config file\n" * 1000
+    new = old + b"new line\n"
+    patch_data = delta_patches.make_block_delta(old, new)
+    file_info = make_dist_file_info("config.cfg", new)
+    file_info.patches = [
+        PatchInfo(
+            from_hash=hashlib.sha256(old).hexdigest(),
+            yan_obj_storage="modpacks/patches/config.xz",
+            hash=hashlib.sha256(patch_data).hexdigest(),
+            size=len(patch_data),
+            encoding="block-lzma",
+        )
+    ]
+    tmpdir.join("config.cfg").write_binary(old)
+    requests = fake_server(
+        mocker, {STORAGE_URL + "modpacks/patches/config.xz": patch_data}
+    )
+
+    report = client_sync.sync_files(
+        [file_info], str(tmpdir), storage_url=STORAGE_URL
+    )
+
+    assert report.ok
+    assert [url for url, _ in requests] == [
+        STORAGE_URL + "modpacks/patches/config.xz"
+    ]
+    assert tmpdir.join("config.cfg").read_binary() == new
+
+
+def test_fetch_map_json_follows_pointer(mocker):
+    """Test that the manifest is loaded from the current generation."""
+    manifest_key = "modpacks/generations/20260101T000000Z-abc/map.json"
+    fake_server(
+        mocker,
+        {
+            STORAGE_URL
+            + client_sync.POINTER_KEY: json.dumps(
+                {
+                    "generation": "20260101T000000Z-abc",
+                    "manifest_key": manifest_key,
+                }
+            ).encode(),
+            STORAGE_URL + manifest_key: b'{"modpacks": {}}',
+        },
+    )
+
+    map_json = client_sync.fetch_map_json(STORAGE_URL)
+
+    assert map_json.modpacks == {}
@@ -0,0 +1,93 @@
+"""Tests for src/compression.py"""
+# pylint:disable = E0401, C0411
+import hashlib
+import os
+
+import pytest
+from src import compression
+from src.stat_cache import StatCache
+from src.test.conftest import make_file_info
+
+
+def test_compress_bytes_is_deterministic():
+    """Test that gzip output does not depend on the current time."""
+    data = b"servers.dat" * 100
+    assert compression.compress_bytes(
+        data, "gzip"
+    ) == compression.compress_bytes(data, "gzip")
+    assert (
+        compression.decompress_bytes(
+            compression.compress_bytes(data, "gzip"), "gzip"
+        )
+        == data
+    )
+
+
+def test_compress_bytes_unknown_encoding():
+    """Test that an unknown encoding raises CompressionFailed."""
+    with pytest.raises(compression.CompressionFailed):
+        compression.compress_bytes(b"data", "brotli")
+
+
+def test_measure_creates_variant_for_compressible_file(workdir):
+    """Test that a well compressible file gets a variant."""
+    file_info = make_file_info(
+        "pack/config.cfg", b"option=true\n" * 500, write=True
+    )
+    cache = StatCache(str(workdir.join("cache.json")))
+
+    variant = compression.measure_compressed_variant(file_info, "gzip", cache)
+
+    assert variant is not None
+    assert variant.yan_obj_storage == "pack/config.cfg.gz"
+    with open(compression.variant_local_path(variant), "rb") as fr:
+        payload = fr.read()
+    assert len(payload) == variant.size
+    assert hashlib.sha256(payload).hexdigest() == variant.hash
+    assert compression.decompress_bytes(payload, "gzip") == (
+        b"option=true\n" * 500
+    )
+
+
+def test_measure_skips_jars_and_small_files(workdir):
+    """Test that jars and tiny files are never compressed."""
+    cache = StatCache(str(workdir.join("cache.json")))
+
+    for file_info in (
+        make_file_info("pack/mod.jar", b"a" * 5000, write=True),
+        make_file_info("pack/tiny.cfg", b"a" * 10, write=True),
+    ):
+        assert (
+            compression.measure_compressed_variant(file_info, "gzip", cache)
+            is None
+        )
+
+
+def test_measure_skips_incompressible_data(workdir):
+    """Test that random data does not get a variant."""
+    file_info = make_file_info("pack/random.bin", os.urandom(4096), write=True)
+    cache = StatCache(str(workdir.join("cache.json")))
+
+    assert (
+        compression.measure_compressed_variant(file_info, "gzip", cache)
+        is None
+    )
+
+
+def test_measure_uses_cache_for_unchanged_files(workdir, mocker):
+    """Test that unchanged files are not compressed again."""
+    file_info = make_file_info(
+        "pack/config.cfg", b"option=true\n" * 500, write=True
+    )
+    cache_path = str(workdir.join("cache.json"))
+    cache = StatCache(cache_path)
+    first = compression.measure_compressed_variant(file_info, "gzip", cache)
+    cache.save()
+
+    spy = mocker.spy(compression, "compress_bytes")
+    second = compression.measure_compressed_variant(
+        file_info, "gzip", StatCache(cache_path).load()
+    )
+
+    assert second == first
+    spy.assert_not_called()
@@ -0,0 +1,153 @@
+"""Tests for src/delta_patches.py"""
+# pylint:disable = E0401, C0411
+import hashlib
+import lzma
+import os
+import random
+
+import pytest
+from src import delta_patches
+from src.pydantic_models import MapJson, PatchInfo
+from src.test.conftest import git, make_file_info, make_map_json
+
+KEY = "modpacks/pack/mods/mod.jar"
+
+
+def make_content(seed: int, size: int = 128 * 1024) -> bytes:
+    """Create reproducible incompressible content."""
+    return random.Random(seed).randbytes(size)
+
+
+def sample_map_json(content: bytes, source_commit=None) -> MapJson:
+    """Create a map with one modpack holding a single mod."""
+    map_json = make_map_json(
+        [make_file_info(KEY, content, dist_file_path="mods\\mod.jar")]
+    )
+    map_json.source_commit = source_commit
+    return map_json
+
+
+@pytest.fixture
+def workdir(tmpdir, monkeypatch):
+    """A git repository with a committed mod as the working directory."""
+    monkeypatch.chdir(tmpdir)
+    git(tmpdir, "init", "-q")
+    git(tmpdir, "config", "user.email", "test@example.com")
+    git(tmpdir, "config", "user.name", "test")
+    tmpdir.join(KEY).write_binary(make_content(1), ensure=True)
+    git(tmpdir, "add", ".")
+    git(tmpdir, "commit", "-q", "-m", "init")
+    return tmpdir
+
+
+def test_block_delta_round_trip():
+    """Test that a small edit produces a small patch that applies."""
+    old = make_content(1)
+    new = old[:1000] + b"inserted" + old[1000:50000] + old[50100:]
+
+    patch = delta_patches.make_block_delta(old, new)
+
+    assert len(patch) < 1024
+    assert delta_patches.apply_block_delta(old, patch) == new
+    with pytest.raises(delta_patches.PatchFailed):
+        delta_patches.apply_block_delta(old, b"broken")
+
+
+def test_block_delta_copies_unchanged_text():
+    """Test that matches are found in text, not only in random bytes."""
+    old = "".join(f"option_{i}=true\n" for i in range(20000)).encode()
+    new = old[:5000] + b"option=false\n" + old[5000:]
+
+    patch = delta_patches.make_block_delta(old, new)
+
+    ops = lzma.decompress(patch[len(delta_patches.BLOCK_DELTA_MAGIC) :])
+    assert len(ops) < 100
+    assert delta_patches.apply_block_delta(old, patch) == new
+
+
+def test_attach_patches_builds_patch_from_source_commit(workdir):
+    """Test that a changed file gets a verified patch from git."""
+    old_content = make_content(1)
+    old_map_json = sample_map_json(
+        old_content, git(workdir, "rev-parse", "HEAD")
+    )
+    new_content = old_content[:-100] + b"changed"
+    workdir.join(KEY).write_binary(new_content)
+    new_map_json = sample_map_json(new_content)
+
+    delta_patches.attach_patches(old_map_json, new_map_json, "block-lzma")
+
+    (patch,) = new_map_json.modpacks["pack"].main_data[0].patches
+    assert patch.from_hash == hashlib.sha256(old_content).hexdigest()
+    with open(delta_patches.patch_local_path(patch), "rb") as fr:
+        data = fr.read()
+    assert patch.size == len(data) < len(new_content) // 10
+    assert (
+        delta_patches.apply_patch(old_content, data, patch.encoding)
+        == new_content
+    )
+
+
+def test_attach_patches_follows_hook_order(workdir):
+    """
+    Test that the previous version is found in the commit of map.json,
+    not at its source_commit, the parent of that commit.
+    """
+    old_content = make_content(2)
+    workdir.join(KEY).write_binary(old_content)
+    old_map_json = sample_map_json(
+        old_content, git(workdir, "rev-parse", "HEAD")
+    )
+    workdir.join("map.json").write(old_map_json.model_dump_json())
+    git(workdir, "add", ".")
+    git(workdir, "commit", "-q", "-m", "mod v2")
+    new_content = old_content[:-100] + b"changed"
+    workdir.join(KEY).write_binary(new_content)
+    workdir.join("map.json").write("{}")
+    new_map_json = sample_map_json(new_content)
+
+    delta_patches.attach_patches(old_map_json, new_map_json, "block-lzma")
+
+    (patch,) = new_map_json.modpacks["pack"].main_data[0].patches
+    assert patch.from_hash == hashlib.sha256(old_content).hexdigest()
+
+
+def test_attach_patches_rejects_large_patches(workdir):
+    """Test that a rewritten file gets no patch and is not tried again."""
+    old_map_json = sample_map_json(
+        make_content(1), git(workdir, "rev-parse", "HEAD")
+    )
+    new_content = make_content(2)
+    workdir.join(KEY).write_binary(new_content)
+    new_map_json = sample_map_json(new_content)
+
+    delta_patches.attach_patches(old_map_json, new_map_json, "block-lzma")
+
+    assert not new_map_json.modpacks["pack"].main_data[0].patches
+    key = delta_patches.patch_key(
+        old_map_json.modpacks["pack"].main_data[0].hash,
+        new_map_json.modpacks["pack"].main_data[0].hash,
+        "block-lzma",
+    )
+    assert os.path.isfile(
+        os.path.join(delta_patches.PATCHES_DIR, key + ".json")
+    )
+
+
+def test_attach_patches_keeps_patches_of_unchanged_files(workdir):
+    """Test that patches survive generations without a content change."""
+    content = make_content(1)
+    old_map_json = sample_map_json(content, "0" * 40)
+    patch = PatchInfo(
+        from_hash="f" * 64,
+        yan_obj_storage="modpacks/patches/ff/patch.xz",
+        hash="0" * 64,
+        size=10,
+        encoding="block-lzma",
+    )
+    old_map_json.modpacks["pack"].main_data[0].patches = [patch]
+    new_map_json = sample_map_json(content)
+
+    delta_patches.attach_patches(old_map_json, new_map_json)
+
+    assert new_map_json.modpacks["pack"].main_data[0].patches == [patch]
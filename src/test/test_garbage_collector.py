@@ -0,0 +1,174 @@
+"""Tests for src/garbage_collector.py"""
+# pylint:disable = E0401, C0411
+import json
+from unittest.mock import MagicMock
+
+from src import garbage_collector
+from src.test.conftest import (
+    fake_bucket_client,
+    make_file_info,
+    make_map_json,
+)
+
+
+def make_manifest(*keys) -> bytes:
+    """Create a serialized map referencing the keys and an icon."""
+    map_json = make_map_json([make_file_info(key, b"data") for key in keys])
+    return json.dumps(map_json.model_dump(mode="json")).encode()
+
+
+def make_bucket(pointer_generation="g3", fresh=()):
+    """
+    Objects of three generations: a.jar is only used by g1, b.jar by
+    every generation and c.jar by g3.
+    """
+    manifests = {
+        "g1": make_manifest("modpacks/pack/a.jar", "modpacks/pack/b.jar"),
+        "g2": make_manifest("modpacks/pack/b.jar"),
+        "g3": make_manifest("modpacks/pack/b.jar", "modpacks/pack/c.jar"),
+    }
+    objects = {
+        f"modpacks/generations/{name}/map.json": manifest
+        for name, manifest in manifests.items()
+    }
+    objects.update(
+        {
+            "modpacks/map.json": manifests["g3"],
+            "modpacks/current.json": json.dumps(
+                {
+                    "generation": pointer_generation,
+                    "manifest_key": (
+                        f"modpacks/generations/{pointer_generation}/map.json"
+                    ),
+                }
+            ).encode(),
+            "modpacks/pack/icon.jpg": b"icon",
+            "modpacks/pack/a.jar": b"data",
+            "modpacks/pack/b.jar": b"data",
+            "modpacks/pack/c.jar": b"data",
+            "modpacks/pack/uploading.jar": b"data",
+        }
+    )
+    return objects, set(fresh)
+
+
+def fake_client(mocker, bucket):
+    """A fake S3 client serving the bucket."""
+    fake = fake_bucket_client(*bucket)
+    mocker.patch.object(garbage_collector, "create_client", return_value=fake)
+    return fake
+
+
+def deleted_keys(client):
+    """Keys passed to delete_objects."""
+    return sorted(
+        item["Key"]
+        for call in client.delete_objects.call_args_list
+        for item in call.kwargs["Delete"]["Objects"]
+    )
+
+
+def test_gc_deletes_objects_of_expired_generations(tmpdir, mocker, target):
+    """Test that only objects of old generations are deleted."""
+    client = fake_client(
+        mocker, make_bucket(fresh=["modpacks/pack/uploading.jar"])
+    )
+
+    report = garbage_collector.collect_target(
+        target, keep=2, state_dir=str(tmpdir)
+    )
+
+    assert report.generations == ["g2", "g3"]
+    assert report.expired_generations == ["g1"]
+    assert report.deleted == [
+        "modpacks/generations/g1/map.json",
+        "modpacks/pack/a.jar",
+    ]
+    assert deleted_keys(client) == report.deleted
+    client.delete_objects.assert_called_once()
+
+
+def test_gc_dry_run_does_not_delete(tmpdir, mocker, target):
+    """Test that a dry run only reports garbage."""
+    client = fake_client(mocker, make_bucket())
+
+    report = garbage_collector.collect_target(
+        target, keep=1, dry_run=True, state_dir=str(tmpdir)
+    )
+
+    assert report.garbage == [
+        "modpacks/generations/g1/map.json",
+        "modpacks/generations/g2/map.json",
+        "modpacks/pack/a.jar",
+        "modpacks/pack/uploading.jar",
+    ]
+    assert not report.deleted
+    client.delete_objects.assert_not_called()
+
+
+def test_gc_keeps_objects_of_live_generation(tmpdir, mocker, target):
+    """Test that a rolled back pointer keeps its generation alive."""
+    client = fake_client(mocker, make_bucket(pointer_generation="g1"))
+
+    report = garbage_collector.collect_target(
+        target, keep=1, state_dir=str(tmpdir)
+    )
+
+    assert "modpacks/pack/a.jar" not in report.deleted
+    assert "modpacks/generations/g1/map.json" not in report.deleted
+    assert deleted_keys(client) == [
+        "modpacks/generations/g2/map.json",
+        "modpacks/pack/uploading.jar",
+    ]
+
+
+def test_gc_aborts_if_live_manifest_is_unreadable(mocker, target):
+    """Test that nothing is deleted without a readable live manifest."""
+    objects, fresh = make_bucket()
+    objects["modpacks/current.json"] = b"not json"
+    client = fake_client(mocker, (objects, fresh))
+
+    (report,) = garbage_collector.collect_garbage([target], keep=1)
+
+    assert not report.ok
+    assert "modpacks/current.json" in report.error
+    client.delete_objects.assert_not_called()
+
+
+def test_gc_aborts_if_pointer_has_no_manifest_key(mocker, target):
+    """Test that a malformed pointer aborts the target."""
+    objects, fresh = make_bucket()
+    objects["modpacks/current.json"] = b'{"generation": "g3"}'
+    client = fake_client(mocker, (objects, fresh))
+
+    (report,) = garbage_collector.collect_garbage([target], keep=1)
+
+    assert "has no manifest_key" in report.error
+    client.delete_objects.assert_not_called()
+
+
+def test_gc_reports_listing_errors(mocker, target):
+    """Test that a failing target does not stop the others."""
+    client = fake_client(mocker, make_bucket())
+    client.get_paginator.return_value.paginate.side_effect = OSError("down")
+
+    (report,) = garbage_collector.collect_garbage([target], keep=1)
+
+    assert not report.ok
+    assert "unable to list modpacks/: down" in report.error
+
+
+def test_delete_objects_batched_splits_requests():
+    """Test that deletes are sent in batches of 1000 keys."""
+    fake = MagicMock()
+    fake.delete_objects.return_value = {
+        "Errors": [{"Key": "key_5", "Message": "AccessDenied"}]
+    }
+
+    deleted = garbage_collector.delete_objects_batched(
+        fake, "bucket", [f"key_{i}" for i in range(2500)]
+    )
+
+    assert fake.delete_objects.call_count == 3
+    assert len(deleted) == 2499
+    assert "key_5" not in deleted
@@ -0,0 +1,83 @@
+"""Tests for src/git_hash_provider.py"""
+# pylint:disable = E0401, C0411
+import hashlib
+
+import pytest
+from src import git_hash_provider
+from src.pydantic_models import MapJson
+from src.test.conftest import git, make_file_info, make_map_json
+
+
+def sample_map_json(repo, source_commit, source_changes=()) -> MapJson:
+    """Create a map with a FileInfo for every file under modpacks/pack."""
+    file_infos = [
+        make_file_info(path.relto(repo).replace("\\", "/"), path.read_binary())
+        for path in sorted(repo.join("modpacks", "pack").visit(fil="*.cfg"))
+    ]
+    map_json = make_map_json(file_infos, server_icon=file_infos[0])
+    map_json.source_commit = source_commit
+    map_json.source_changes = list(source_changes)
+    return map_json
+
+
+@pytest.fixture
+def repo(tmpdir):
+    """A git repository with two committed files."""
+    git(tmpdir, "init", "-q")
+    git(tmpdir, "config", "user.email", "test@example.com")
+    git(tmpdir, "config", "user.name", "test")
+    tmpdir.join("modpacks", "pack", "a.cfg").write("a", ensure=True)
+    tmpdir.join("modpacks", "pack", "b.cfg").write("b", ensure=True)
+    git(tmpdir, "add", ".")
+    git(tmpdir, "commit", "-q", "-m", "init")
+    return tmpdir
+
+
+def test_provider_reuses_hashes_of_unchanged_files(repo):
+    """Test that only modified and untracked files are hashed again."""
+    commit = git_hash_provider.current_commit(str(repo))
+    map_json = sample_map_json(repo, commit)
+    repo.join("modpacks", "pack", "b.cfg").write("changed")
+    repo.join("modpacks", "pack", "c.cfg").write("new")
+
+    provider = git_hash_provider.GitHashProvider.from_map_json(
+        map_json, "modpacks", str(repo)
+    )
+
+    assert (
+        provider.get("modpacks/pack/a.cfg") == hashlib.sha256(b"a").hexdigest()
+    )
+    assert provider.get("modpacks/pack/b.cfg") is None
+    assert provider.get("modpacks/pack/c.cfg") is None
+    assert provider.reused == 1
+
+
+def test_provider_skips_files_dirty_at_generation(repo):
+    """Test that a file reverted after generation is hashed again."""
+    commit = git_hash_provider.current_commit(str(repo))
+    repo.join("modpacks", "pack", "a.cfg").write("dirty")
+    source_commit, source_changes = git_hash_provider.source_state(
+        "modpacks", str(repo)
+    )
+    map_json = sample_map_json(repo, source_commit, source_changes)
+    repo.join("modpacks", "pack", "a.cfg").write("a")
+
+    provider = git_hash_provider.GitHashProvider.from_map_json(
+        map_json, "modpacks", str(repo)
+    )
+
+    assert source_commit == commit
+    assert source_changes == ["modpacks/pack/a.cfg"]
+    assert provider.get("modpacks/pack/a.cfg") is None
+
+
+def test_provider_is_disabled_for_unknown_commit(repo):
+    """Test that an unknown commit falls back to full hashing."""
+    map_json = sample_map_json(repo, "0" * 40)
+
+    assert (
+        git_hash_provider.GitHashProvider.from_map_json(
+            map_json, "modpacks", str(repo)
+        )
+        is None
+    )
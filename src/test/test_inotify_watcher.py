@@ -0,0 +1,60 @@
+"""Tests for src/inotify_watcher.py"""
+# pylint:disable = E0401, C0411
+import os
+import threading
+
+import pytest
+from src import inotify_watcher
+
+
+@pytest.fixture
+def watcher(tmpdir):
+    """An InotifyWatcher for tmpdir, skipped where inotify is missing."""
+    try:
+        instance = inotify_watcher.InotifyWatcher(str(tmpdir))
+    except inotify_watcher.InotifyUnavailable:
+        pytest.skip("inotify is not available")
+    yield instance
+    instance.close()
+
+
+def test_wait_for_changes_timeout(watcher):
+    """Test that an empty set is returned if nothing changed."""
+    assert watcher.wait_for_changes(timeout=0.05) == set()
+
+
+def test_wait_for_changes_reports_written_file(tmpdir, watcher):
+    """Test that a written file is reported."""
+    tmpdir.join("mod.jar").write("mod")
+
+    assert watcher.wait_for_changes(timeout=1) == {
+        os.path.join(str(tmpdir), "mod.jar")
+    }
+
+
+def test_wait_for_changes_watches_new_directories(tmpdir, watcher):
+    """Test that files in newly created directories are reported."""
+    tmpdir.mkdir("mods")
+    watcher.wait_for_changes(timeout=1)
+    tmpdir.join("mods", "mod.jar").write("mod")
+
+    assert os.path.join(
+        str(tmpdir), "mods", "mod.jar"
+    ) in watcher.wait_for_changes(timeout=1)
+
+
+def test_wait_for_changes_debounces_bursts(tmpdir, watcher):
+    """Test that a burst of writes is returned as a single batch."""
+
+    def write_files():
+        for i in range(5):
+            tmpdir.join(f"file{i}.cfg").write("data")
+
+    thread = threading.Thread(target=write_files)
+    thread.start()
+    changed = watcher.wait_for_changes(timeout=1)
+    thread.join()
+
+    assert changed == {
+        os.path.join(str(tmpdir), f"file{i}.cfg") for i in range(5)
+    }
@@ -7,7 +7,8 @@ from unittest.mock import MagicMock
 
 import json_maker_hook
 import pytest
-from src.pydantic_models import FileInfo, MapJson, ServerConfig
+from src.git_hash_provider import GitHashProvider
+from src.pydantic_models import MapJson, ServerConfig
 
 
 def test_incorrect_hash_value_from_calculate_hash(tmpdir):
@@ -357,84 +358,215 @@ def test_create_github_api_url_empty_path():
     )
 
 
-def test_get_all_obj_keys_empty_map_json():
-    """Test get_all_obj_keys with an empty map_json."""
-    map_json = MapJson(modpacks={})
-    # pylint: disable=C1803
-    assert json_maker_hook.get_all_obj_keys(map_json) == {}
-
-
-def test_get_all_obj_keys_single_modpack_single_dir():
-    """Test get_all_obj_keys with a single modpack and a single directory."""
-    mock_file_info1 = MagicMock(spec=FileInfo)
-    mock_file_info1.yan_obj_storage = "obj_key_1"
-    mock_file_info1.hash = "hash_value_1"
-    mock_file_info2 = MagicMock(spec=FileInfo)
-    mock_file_info2.yan_obj_storage = "obj_key_2"
-    mock_file_info2.hash = "hash_value_2"
-    map_json = MapJson(
-        modpacks={
-            "modpack_1": {
-                "main_data": [
-                    mock_file_info1,
-                    mock_file_info2,
-                ],
-                "server_config": MagicMock(spec=ServerConfig),
-                "client_additional_data": {},
-            }
-        }
+def make_modpacks_tree(tmpdir):
+    """Create a modpacks tree with one modpack and chdir into tmpdir."""
+    modpack = tmpdir.mkdir("modpacks").mkdir("modpack1")
+    main_data = modpack.mkdir("main_data")
+    main_data.join("servers.dat").write("servers")
+    main_data.mkdir("mods").join("mod1.jar").write("mod 1")
+    modpack.mkdir("client_additional_data").mkdir("shaders").join(
+        "shader.zip"
+    ).write("shader")
+    os.chdir(tmpdir)
+    return modpack
+
+
+def test_update_map_json_matches_full_regeneration(tmpdir, mocker):
+    """Test that incremental updates give the same map as generate_json."""
+    mocker.patch.object(
+        json_maker_hook,
+        "parse_config_dict",
+        return_value=MagicMock(spec=json_maker_hook.ServerConfig),
     )
-    expected_result = {
-        "obj_key_1": "hash_value_1",
-        "obj_key_2": "hash_value_2",
-    }
-    assert json_maker_hook.get_all_obj_keys(map_json) == expected_result
+    base_api_url = "https://example.com/api/"
+    original_path = os.getcwd()
+    try:
+        modpack = make_modpacks_tree(tmpdir)
+        map_json = json_maker_hook.generate_json("modpacks", base_api_url)
+
+        modpack.join("main_data", "mods", "mod1.jar").write("mod 1 v2")
+        modpack.join("main_data", "mods", "mod2.jar").write("mod 2")
+        modpack.join("main_data", "servers.dat").remove()
+        modpack.join("client_additional_data").mkdir("ui").join(
+            "ui.zip"
+        ).write("ui")
+        updated = json_maker_hook.update_map_json(
+            map_json,
+            [
+                os.path.join("modpacks", "modpack1", "main_data", "mods"),
+                os.path.join(
+                    "modpacks", "modpack1", "main_data", "mods", "mod1.jar"
+                ),
+                os.path.join(
+                    "modpacks", "modpack1", "main_data", "mods", "mod2.jar"
+                ),
+                os.path.join("modpacks", "modpack1", "main_data", "servers.dat"),
+                os.path.join(
+                    "modpacks", "modpack1", "client_additional_data", "ui"
+                ),
+            ],
+            "modpacks",
+            base_api_url,
+        )
 
+        expected = json_maker_hook.generate_json("modpacks", base_api_url)
+        assert updated == {"modpack1"}
 
-def test_get_all_obj_keys_multiple_modpacks_multiple_dirs(mocker):
-    """
-    Test get_all_obj_keys with multiple modpacks and multiple directories.
-    """
-    mock_file_info1 = MagicMock(spec=FileInfo)
-    mock_file_info1.yan_obj_storage = "obj_key_1"
-    mock_file_info1.hash = "hash_value_1"
-    mock_file_info2 = MagicMock(spec=FileInfo)
-    mock_file_info2.yan_obj_storage = "obj_key_2"
-    mock_file_info2.hash = "hash_value_2"
-    mock_file_info3 = MagicMock(spec=FileInfo)
-    mock_file_info3.yan_obj_storage = "obj_key_3"
-    mock_file_info3.hash = "hash_value_3"
-    mock_file_info4 = MagicMock(spec=FileInfo)
-    mock_file_info4.yan_obj_storage = "obj_key_4"
-    mock_file_info4.hash = "hash_value_4"
-
-    mocker.patch.object(json_maker_hook, "ServerConfig", spec=True)
-
-    map_json = MapJson(
-        modpacks={
-            "modpack_1": {
-                "main_data": [
-                    mock_file_info1,
-                    mock_file_info2,
-                ],
-                "server_config": json_maker_hook.ServerConfig(),
-                "client_additional_data": {},
-            },
-            "modpack_2": {
-                "main_data": [],
-                "client_additional_data": {
-                    "shaders_data": [mock_file_info3],
-                    "some_other_additional_data": [mock_file_info4],
-                },
-                "server_config": json_maker_hook.ServerConfig(),
-            },
-        }
+        def by_key(file_infos):
+            return sorted(file_infos, key=lambda info: info.yan_obj_storage)
+
+        assert by_key(map_json.modpacks["modpack1"].main_data) == by_key(
+            expected.modpacks["modpack1"].main_data
+        )
+        assert (
+            map_json.modpacks["modpack1"].client_additional_data
+            == expected.modpacks["modpack1"].client_additional_data
+        )
+    finally:
+        os.chdir(original_path)
+
+
+def test_update_map_json_only_hashes_changed_files(tmpdir, mocker):
+    """Test that unchanged files are not hashed again."""
+    mocker.patch.object(
+        json_maker_hook,
+        "parse_config_dict",
+        return_value=MagicMock(spec=json_maker_hook.ServerConfig),
+    )
+    base_api_url = "https://example.com/api/"
+    original_path = os.getcwd()
+    try:
+        modpack = make_modpacks_tree(tmpdir)
+        map_json = json_maker_hook.generate_json("modpacks", base_api_url)
+        modpack.join("main_data", "servers.dat").write("servers v2")
+        changed_path = os.path.join(
+            "modpacks", "modpack1", "main_data", "servers.dat"
+        )
+
+        spy = mocker.spy(json_maker_hook, "calculate_hash")
+        json_maker_hook.update_map_json(
+            map_json, [changed_path], "modpacks", base_api_url
+        )
+
+        spy.assert_called_once_with(changed_path)
+        servers_dat = map_json.modpacks["modpack1"].main_data[0]
+        assert servers_dat.file_name == "servers.dat"
+        assert servers_dat.hash == hashlib.sha256(b"servers v2").hexdigest()
+    finally:
+        os.chdir(original_path)
+
+
+def test_update_map_json_removes_deleted_modpack(tmpdir, mocker):
+    """Test that a deleted modpack directory is removed from the map."""
+    mocker.patch.object(
+        json_maker_hook,
+        "parse_config_dict",
+        return_value=MagicMock(spec=json_maker_hook.ServerConfig),
     )
+    original_path = os.getcwd()
+    try:
+        modpack = make_modpacks_tree(tmpdir)
+        map_json = json_maker_hook.generate_json(
+            "modpacks", "https://example.com/api/"
+        )
+        modpack.remove()
+
+        json_maker_hook.update_map_json(
+            map_json,
+            [os.path.join("modpacks", "modpack1")],
+            "modpacks",
+            "https://example.com/api/",
+        )
 
-    expected_result = {
-        "obj_key_1": "hash_value_1",
-        "obj_key_2": "hash_value_2",
-        "obj_key_3": "hash_value_3",
-        "obj_key_4": "hash_value_4",
+        assert map_json.modpacks == {}
+    finally:
+        os.chdir(original_path)
+
+
+def test_update_map_json_regenerates_changed_modpack_dir(tmpdir, mocker):
+    """Test that an event on the modpack directory itself is handled."""
+    mocker.patch.object(
+        json_maker_hook,
+        "parse_config_dict",
+        return_value=MagicMock(spec=json_maker_hook.ServerConfig),
+    )
+    base_api_url = "https://example.com/api/"
+    original_path = os.getcwd()
+    try:
+        modpack = make_modpacks_tree(tmpdir)
+        map_json = json_maker_hook.generate_json("modpacks", base_api_url)
+        modpack.join("main_data", "servers.dat").write("servers v2")
+
+        updated = json_maker_hook.update_map_json(
+            map_json,
+            [os.path.join("modpacks", "modpack1")],
+            "modpacks",
+            base_api_url,
+        )
+
+        expected = json_maker_hook.generate_json("modpacks", base_api_url)
+        assert updated == {"modpack1"}
+        assert (
+            map_json.modpacks["modpack1"].main_data
+            == expected.modpacks["modpack1"].main_data
+        )
+    finally:
+        os.chdir(original_path)
+
+
+def test_attach_derived_data_runs_every_step(mocker):
+    """Test that main() and watch() get the same post-generation steps."""
+    mocker.patch.object(
+        json_maker_hook, "source_state", return_value=("abc", ["a.cfg"])
+    )
+    steps = {
+        name: mocker.patch.object(json_maker_hook, name)
+        for name in (
+            "attach_cached_compressed_variants",
+            "attach_bundles",
+            "attach_packs",
+            "attach_patches",
+        )
     }
-    assert json_maker_hook.get_all_obj_keys(map_json) == expected_result
+    map_json_old = MapJson(modpacks={})
+    map_json = MapJson(modpacks={})
+
+    json_maker_hook.attach_derived_data(map_json_old, map_json)
+
+    assert map_json.source_commit == "abc"
+    assert map_json.source_changes == ["a.cfg"]
+    steps["attach_cached_compressed_variants"].assert_called_once_with(
+        map_json
+    )
+    steps["attach_bundles"].assert_called_once_with(
+        map_json, include_additional_data=True
+    )
+    steps["attach_packs"].assert_called_once_with(map_json)
+    steps["attach_patches"].assert_called_once_with(map_json_old, map_json)
+
+
+def test_hash_file_hashes_hardlinked_copies_once(tmpdir, mocker):
+    """Test that hardlinked copies of a file are read only once."""
+    original = tmpdir.join("authlib.jar")
+    original.write("authlib")
+    copy = str(tmpdir.join("authlib_copy.jar"))
+    os.link(str(original), copy)
+
+    spy = mocker.spy(json_maker_hook, "calculate_hash")
+    first = json_maker_hook.hash_file(str(original))
+    second = json_maker_hook.hash_file(copy)
+
+    assert first == second == hashlib.sha256(b"authlib").hexdigest()
+    spy.assert_called_once()
+
+
+def test_hash_file_uses_hash_provider(tmpdir, mocker):
+    """Test that a hash known to the provider is not calculated."""
+    file_path = str(tmpdir.join("servers.dat"))
+    tmpdir.join("servers.dat").write("servers")
+    provider = GitHashProvider({file_path: "known_hash"}, set())
+
+    spy = mocker.spy(json_maker_hook, "calculate_hash")
+
+    assert json_maker_hook.hash_file(file_path, provider) == "known_hash"
+    spy.assert_not_called()
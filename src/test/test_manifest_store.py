@@ -0,0 +1,110 @@
+"""Tests for src/manifest_store.py"""
+# pylint:disable = E0401, C0411
+import hashlib
+import json
+import os
+
+import pytest
+from src import manifest_store
+from src.map_diff import diff_map_json
+from src.pydantic_models import MapJson, PackRef
+from src.test.conftest import dist_files, make_dist_file_info, make_map_json
+
+
+@pytest.fixture
+def store(tmpdir):
+    """An empty store in a temporary directory."""
+    with manifest_store.ManifestStore(
+        str(tmpdir.join("data", "manifest.sqlite3"))
+    ) as opened:
+        yield opened
+
+
+def test_record_and_export_generations(store, tmpdir):
+    """Test that the latest generations are kept and can be exported."""
+    maps = [make_map_json(dist_files({"a.cfg": bytes([i])})) for i in range(3)]
+    ids = [store.record_generation(map_json, keep=2) for map_json in maps]
+
+    store.export_map_json(str(tmpdir.join("map.json")))
+
+    assert store.latest_generation() == ids[-1]
+    assert store.load_map_json(ids[1]) == maps[1]
+    with pytest.raises(manifest_store.GenerationNotFound):
+        store.load_map_json(ids[0])
+    assert MapJson(**json.loads(tmpdir.join("map.json").read())) == maps[-1]
+
+
+def test_modpacks_containing_finds_packed_files(store):
+    """Test that content is found with the pack holding it."""
+    map_json = make_map_json(dist_files({"a.cfg": b"same", "b.cfg": b"same"}))
+    map_json.modpacks["pack"].main_data[1].pack = PackRef(
+        yan_obj_storage="modpacks/pack/packs/00-abc.pack", offset=0, length=4
+    )
+    latest = store.record_generation(map_json)
+
+    found = store.modpacks_containing(hashlib.sha256(b"same").hexdigest())
+
+    assert [(stored.dist_file_path, stored.pack_key) for stored in found] == [
+        ("a.cfg", None),
+        ("b.cfg", "modpacks/pack/packs/00-abc.pack"),
+    ]
+    assert all(stored.generation_id == latest for stored in found)
+    assert not store.modpacks_containing("0" * 64)
+
+
+def test_modpacks_containing_finds_unpacked_files(store, capsys):
+    """Test that files too large for packs are found by hash as well."""
+    content = b"x" * (64 * 1024)
+    file_hash = hashlib.sha256(content).hexdigest()
+    first = make_map_json(dist_files({"mods/big.jar": content}))
+    second = make_map_json(dist_files({"mods/renamed.jar": content}))
+    store.record_generation(first)
+    latest = store.record_generation(second, diff_map_json(first, second))
+
+    found = store.modpacks_containing(file_hash, generations=2)
+
+    assert [
+        (stored.generation_id, stored.modpack, stored.dist_file_path)
+        for stored in found
+    ] == [
+        (latest, "pack", "mods/renamed.jar"),
+        (latest - 1, "pack", "mods/big.jar"),
+    ]
+    assert all(stored.pack_key is None for stored in found)
+    assert manifest_store.main(["--db", store.db_path, "find", file_hash]) == 0
+    assert capsys.readouterr().out == (
+        f"{latest} pack: main_data/mods/renamed.jar\n"
+    )
+
+
+def test_recent_changes_spans_generations(store):
+    """Test that changes of the last generations are returned."""
+    maps = [
+        make_map_json(dist_files({"a.cfg": b"a"})),
+        make_map_json(dist_files({"a.cfg": b"a2"})),
+        make_map_json(dist_files({"a.cfg": b"a2", "b.cfg": b"b"})),
+    ]
+    store.record_generation(maps[0])
+    for old, new in zip(maps, maps[1:]):
+        store.record_generation(new, diff_map_json(old, new))
+
+    assert [
+        (change.kind, change.dist_file_path)
+        for change in store.recent_changes(2)
+    ] == [("added", "b.cfg"), ("changed", "a.cfg")]
+    assert len(store.recent_changes(1)) == 1
+
+
+def test_store_provides_hashes_of_unchanged_files(store, tmpdir):
+    """Test that stored hashes are dropped once a file changes."""
+    path = tmpdir.join("modpacks", "a.cfg")
+    path.write_binary(b"a", ensure=True)
+    file_info = make_dist_file_info("a.cfg", b"a")
+    file_info.yan_obj_storage = str(path)
+    store.update_stats([file_info])
+
+    assert store.get(str(path)) == file_info.hash
+    path.write_binary(b"changed")
+    os.utime(str(path), ns=(1, 1))
+    assert store.get(str(path)) is None
+    assert store.reused == 1
@@ -0,0 +1,91 @@
+"""Tests for src/map_diff.py"""
+# pylint:disable = E0401, C0411
+from src import map_diff
+from src.test.conftest import dist_files, make_dist_file_info, make_map_json
+
+FILES = {
+    "mods/a.jar": b"a",
+    "mods/b.jar": b"b",
+    "config/c.cfg": b"c",
+}
+
+
+def test_diff_of_equal_maps_is_empty():
+    """Test that maps from different commits with same files are equal."""
+    old = make_map_json(dist_files(FILES))
+    new = make_map_json(dist_files(FILES))
+    new.source_commit = "abc"
+
+    changes = map_diff.diff_map_json(old, new)
+
+    assert changes.empty
+    assert changes.changelog() == ""
+
+
+def test_diff_finds_every_kind_of_file_change():
+    """Test added, removed, changed and moved files."""
+    old = make_map_json(dist_files(FILES))
+    new = make_map_json(
+        dist_files(
+            {
+                "mods/a.jar": b"a2",
+                "mods\\renamed.jar": b"b",
+                "config/d.cfg": b"d",
+            }
+        )
+    )
+
+    changes = map_diff.diff_map_json(old, new)
+
+    assert [c.dist_file_path for c in changes.changed] == ["mods/a.jar"]
+    assert [c.dist_file_path for c in changes.added] == ["config/d.cfg"]
+    assert [c.dist_file_path for c in changes.removed] == ["config/c.cfg"]
+    assert [(m.old_path, m.new_path) for m in changes.moved] == [
+        ("mods/b.jar", "mods/renamed.jar")
+    ]
+
+
+def test_diff_reports_config_and_icon_changes():
+    """Test that server_config fields and the icon are compared."""
+    old = make_map_json(dist_files(FILES))
+    new = make_map_json(
+        dist_files(FILES),
+        server_icon=make_dist_file_info("server_icon.jpg", b"new icon"),
+        minecraft_version="1.20.1",
+    )
+
+    changes = map_diff.diff_map_json(old, new)
+
+    assert not changes.empty
+    fields = changes.config_changed[0].fields
+    assert fields["minecraft_version"] == ("1.19.2", "1.20.1")
+    assert "server_icon" in fields
+    assert "pack: minecraft_version: 1.19.2 -> 1.20.1" in changes.changelog()
+
+
+def test_diff_reports_metadata_only_changes():
+    """Test that a new url with the same hash is not a content change."""
+    old = make_map_json(dist_files(FILES))
+    new = make_map_json(dist_files(FILES))
+    new.modpacks["pack"].main_data[0].api_url = "https://mirror.example.com"
+
+    changes = map_diff.diff_map_json(old, new)
+
+    assert not changes.changed
+    assert len(changes.metadata_changed) == 1
+    assert not changes.empty
+
+
+def test_main_writes_changelog(tmpdir, capsys):
+    """Test that the CLI writes the changelog to stdout."""
+    paths = []
+    for name, version in (("old", "1.19.2"), ("new", "1.20.1")):
+        map_json = make_map_json(dist_files(FILES), minecraft_version=version)
+        path = tmpdir.join(f"{name}.json")
+        path.write(map_json.model_dump_json())
+        paths.append(str(path))
+
+    assert map_diff.main(paths) == 0
+    assert capsys.readouterr().out == (
+        "pack: minecraft_version: 1.19.2 -> 1.20.1\n"
+    )
@@ -0,0 +1,126 @@
+"""Tests for src/packing.py"""
+# pylint:disable = E0401, C0411
+import io
+import os
+
+import pytest
+from src import client_sync, packing
+from src.test.conftest import STORAGE_URL, dist_files, make_map_json
+
+FILES = {
+    f"config/file_{i}.cfg": f"option_{i}=true\n".encode() for i in range(8)
+}
+
+
+@pytest.mark.usefixtures("workdir")
+def test_attach_packs_records_offsets():
+    """Test that every packed file can be read back by its range."""
+    map_json = packing.attach_packs(
+        make_map_json(dist_files(FILES, write=True)), buckets=2
+    )
+    packs = {
+        pack.yan_obj_storage: pack for pack in map_json.modpacks["pack"].packs
+    }
+
+    assert len(packs) == 2
+    for file_info in map_json.modpacks["pack"].main_data:
+        ref = file_info.pack
+        with open(
+            packing.pack_local_path(packs[ref.yan_obj_storage]), "rb"
+        ) as fr:
+            fr.seek(ref.offset)
+            assert fr.read(ref.length) == FILES[file_info.dist_file_path]
+
+
+@pytest.mark.usefixtures("workdir")
+def test_attach_packs_keeps_unchanged_packs():
+    """Test that a change only renames the pack of the changed file."""
+    first = packing.attach_packs(
+        make_map_json(dist_files(FILES, write=True)), buckets=4
+    )
+    changed_key = "modpacks/pack/main_data/config/file_0.cfg"
+
+    second = packing.attach_packs(
+        make_map_json(
+            dist_files({**FILES, "config/file_0.cfg": b"changed"}, write=True)
+        ),
+        buckets=4,
+    )
+
+    old_keys = {pack.yan_obj_storage for pack in first.modpacks["pack"].packs}
+    new_keys = {pack.yan_obj_storage for pack in second.modpacks["pack"].packs}
+    assert len(old_keys - new_keys) == 1
+    assert len(new_keys - old_keys) == 1
+    assert (
+        f"{packing.pack_bucket(changed_key, 4):02x}"
+        == os.path.basename((new_keys - old_keys).pop())[:2]
+    )
+
+
+@pytest.mark.usefixtures("workdir")
+def test_attach_packs_skips_large_files():
+    """Test that files above the threshold are not packed."""
+    map_json = packing.attach_packs(
+        make_map_json(
+            dist_files({"mods/big.jar": b"x" * 100, "a.cfg": b"a"}, write=True)
+        ),
+        threshold=10,
+    )
+
+    packed = {
+        info.dist_file_path: info.pack
+        for info in map_json.modpacks["pack"].main_data
+    }
+    assert packed["mods/big.jar"] is None
+    assert packed["a.cfg"] is not None
+
+
+@pytest.mark.usefixtures("workdir")
+def test_attach_packs_skips_files_changed_while_packing():
+    """Test that a file changed after hashing leaves its pack out."""
+    map_json = make_map_json(dist_files(FILES, write=True))
+    changed = map_json.modpacks["pack"].main_data[0]
+    with open(changed.yan_obj_storage, "ab") as fw:
+        fw.write(b"more")
+
+    map_json = packing.attach_packs(map_json, buckets=1)
+
+    assert map_json.modpacks["pack"].packs == []
+    assert all(
+        info.pack is None for info in map_json.modpacks["pack"].main_data
+    )
+    assert not os.listdir(
+        os.path.join(packing.PACKS_DIR, "modpacks", "pack", "packs")
+    )
+
+
+def test_sync_fetches_packed_files_with_one_range(workdir, mocker):
+    """Test that small files of one pack are fetched with one request."""
+    map_json = packing.attach_packs(
+        make_map_json(dist_files(FILES, write=True)), buckets=1
+    )
+    pack = map_json.modpacks["pack"].packs[0]
+    with open(packing.pack_local_path(pack), "rb") as fr:
+        data = fr.read()
+    requests = []
+
+    def open_url(url, offset=0, end=None):
+        requests.append((url, offset, end))
+        response = io.BytesIO(data[offset : end + 1])
+        response.status = 206
+        return response
+
+    mocker.patch.object(client_sync, "_open_url", side_effect=open_url)
+
+    report = client_sync.sync_files(
+        map_json.modpacks["pack"].main_data,
+        str(workdir.join("install")),
+        storage_url=STORAGE_URL,
+    )
+
+    assert report.ok
+    assert requests == [(STORAGE_URL + pack.yan_obj_storage, 0, len(data) - 1)]
+    assert (
+        workdir.join("install", "config", "file_3.cfg").read_binary()
+        == FILES["config/file_3.cfg"]
+    )
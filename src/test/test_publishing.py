@@ -0,0 +1,232 @@
+"""Tests for src/publishing.py"""
+# pylint:disable = E0401, C0411
+import json
+from unittest.mock import MagicMock
+
+import pytest
+from src import publishing
+from src.pydantic_models import MapJson, PackInfo
+from src.test.conftest import make_file_info, make_map_json, make_target
+
+
+def sample_map_json() -> MapJson:
+    """Create a map with one modpack, an icon and two files."""
+    return make_map_json(
+        [make_file_info("pack/main_data/mod.jar", file_hash="mod")],
+        server_icon=make_file_info("pack/icon.jpg", file_hash="icon_hash"),
+        client_additional_data={
+            "shaders": [make_file_info("pack/shaders/s.zip", file_hash="s")]
+        },
+    )
+
+
+@pytest.fixture
+def clients(mocker):
+    """
+    Return a fresh MagicMock client for every target by name. Every
+    target has a bucket which lists the keys uploaded to it so far.
+    """
+    created = {}
+    buckets = {}
+
+    def create_client(target):
+        bucket = buckets.setdefault(target.name, set())
+        client = MagicMock()
+        client.upload_file.side_effect = (
+            lambda _path, _bucket, key, **kwargs: bucket.add(key)
+        )
+        client.get_paginator.return_value.paginate.side_effect = (
+            lambda Bucket, Prefix: [
+                {
+                    "Contents": [
+                        {"Key": key, "Size": 0, "ETag": '"etag"'}
+                        for key in sorted(bucket)
+                        if key.startswith(Prefix)
+                    ]
+                }
+            ]
+        )
+        created[target.name] = client
+        client.bucket = bucket
+        return client
+
+    mocker.patch.object(publishing, "create_client", side_effect=create_client)
+    return created
+
+
+def test_collect_objects_includes_server_icon():
+    """Test that the server icon is referenced as an object."""
+    objects = publishing.collect_objects(sample_map_json())
+
+    assert {key: obj.local_path for key, obj in objects.items()} == {
+        "modpacks/objects/ic/icon_hash": "pack/icon.jpg",
+        "modpacks/objects/mo/mod": "pack/main_data/mod.jar",
+        "modpacks/objects/s/s": "pack/shaders/s.zip",
+    }
+
+
+def test_manifest_references_content_keys():
+    """Test that published files do not overwrite previous versions."""
+    map_json = sample_map_json()
+    manifest = json.loads(
+        publishing.manifest_for_target(map_json, make_target("main"))
+    )
+
+    main_data = manifest["modpacks"]["pack"]["main_data"]
+    assert main_data[0]["yan_obj_storage"] == "modpacks/objects/mo/mod"
+    assert map_json.modpacks["pack"].main_data[0].yan_obj_storage == (
+        "pack/main_data/mod.jar"
+    )
+    assert publishing.referenced_keys(map_json) >= {
+        "modpacks/objects/mo/mod",
+        "pack/main_data/mod.jar",
+    }
+
+
+def test_publish_uploads_to_every_target(tmpdir, clients):
+    """Test that every target gets all objects and its manifest."""
+    targets = [make_target("main"), make_target("lan")]
+
+    reports = publishing.publish(
+        targets, sample_map_json(), state_dir=str(tmpdir)
+    )
+
+    assert [report.name for report in reports] == ["main", "lan"]
+    for report in reports:
+        assert report.ok
+        assert report.manifest_published
+        assert len(report.uploaded) == 3
+        generation = f"modpacks/generations/{report.generation}/"
+        assert [
+            call.kwargs["Key"]
+            for call in clients[report.name].put_object.call_args_list
+        ] == [
+            generation + "map_blobs.json",
+            generation + "map.json",
+            "modpacks/current.json",
+            "modpacks/map_blobs.json",
+            "modpacks/map.json",
+        ]
+
+
+def test_publish_skips_objects_a_target_already_has(tmpdir, clients):
+    """Test that a second run uploads nothing to an up to date target."""
+    target = make_target("main")
+    publishing.publish([target], sample_map_json(), state_dir=str(tmpdir))
+
+    report = publishing.publish(
+        [target], sample_map_json(), state_dir=str(tmpdir)
+    )[0]
+
+    assert report.skipped == 3
+    assert not report.uploaded
+    assert not report.manifest_published
+    clients["main"].upload_file.assert_not_called()
+
+
+def test_publish_uploads_objects_missing_from_the_bucket(tmpdir, clients):
+    """Test that the state is not trusted for objects deleted elsewhere."""
+    target = make_target("main")
+    publishing.publish([target], sample_map_json(), state_dir=str(tmpdir))
+    clients["main"].bucket.discard("modpacks/objects/mo/mod")
+
+    report = publishing.publish(
+        [target], sample_map_json(), state_dir=str(tmpdir)
+    )[0]
+
+    assert report.skipped == 2
+    assert report.uploaded == ["modpacks/objects/mo/mod"]
+    clients[
+        "main"
+    ].get_paginator.return_value.paginate.assert_called_once_with(
+        Bucket="bucket", Prefix="modpacks/objects/"
+    )
+
+
+def test_publish_withholds_manifest_after_failed_upload(
+    tmpdir, clients, mocker
+):
+    """Test that a target with a failed object does not get a manifest."""
+    targets = [make_target("main"), make_target("broken")]
+
+    def upload_object(_client, target, obj):
+        if target.name == "broken" and obj.key == "modpacks/objects/mo/mod":
+            raise OSError("connection reset")
+
+    mocker.patch.object(publishing, "upload_object", side_effect=upload_object)
+    reports = publishing.publish(
+        targets, sample_map_json(), state_dir=str(tmpdir)
+    )
+
+    main_report, broken_report = reports
+    assert main_report.manifest_published
+    assert not broken_report.manifest_published
+    assert list(broken_report.failed) == ["modpacks/objects/mo/mod"]
+    clients["broken"].put_object.assert_not_called()
+
+
+def test_publish_sets_cache_headers(tmpdir, clients):
+    """Test that objects and manifests get cache headers."""
+    map_json = sample_map_json()
+    map_json.modpacks["pack"].packs = [
+        PackInfo(yan_obj_storage="pack/packs/00-abc.pack", hash="p", size=1)
+    ]
+
+    report = publishing.publish(
+        [make_target("main")], map_json, state_dir=str(tmpdir)
+    )[0]
+
+    client = clients["main"]
+    cache_control = {
+        call.args[2]: call.kwargs["ExtraArgs"]["CacheControl"]
+        for call in client.upload_file.call_args_list
+    }
+    assert cache_control["pack/packs/00-abc.pack"] == (
+        publishing.IMMUTABLE_CACHE_CONTROL
+    )
+    assert cache_control["modpacks/objects/mo/mod"] == (
+        publishing.IMMUTABLE_CACHE_CONTROL
+    )
+    manifests = {
+        call.kwargs["Key"]: call.kwargs
+        for call in client.put_object.call_args_list
+    }
+    assert manifests["modpacks/map.json"]["CacheControl"] == (
+        publishing.MANIFEST_CACHE_CONTROL
+    )
+    pointer = json.loads(manifests["modpacks/current.json"]["Body"])
+    assert pointer["generation"] == report.generation
+    assert manifests[pointer["manifest_key"]]["CacheControl"] == (
+        publishing.IMMUTABLE_CACHE_CONTROL
+    )
+
+
+def test_manifest_for_target_rewrites_api_url():
+    """Test that api_url points to the target's public url."""
+    target = make_target("lan", public_url="http://192.168.0.2:9000/pack/")
+
+    manifest = json.loads(
+        publishing.manifest_for_target(sample_map_json(), target)
+    )
+
+    main_data = manifest["modpacks"]["pack"]["main_data"]
+    assert (
+        main_data[0]["api_url"]
+        == "http://192.168.0.2:9000/pack/modpacks/objects/mo/mod"
+    )
+
+
+def test_load_targets_rejects_duplicate_names(tmpdir):
+    """Test that target names have to be unique."""
+    targets_path = tmpdir.join("targets.json")
+    targets_path.write(
+        json.dumps(
+            [
+                make_target("main").model_dump(),
+                make_target("main").model_dump(),
+            ]
+        )
+    )
+
+    with pytest.raises(publishing.PublishFailed):
+        publishing.load_targets(str(targets_path))